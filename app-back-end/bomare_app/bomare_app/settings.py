@@ -99,6 +99,8 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Worker processes write concurrently, wait for the lock instead of failing
+        'OPTIONS': {'timeout': 20},
     }
 }
 
@@ -166,6 +168,67 @@ UPLOAD_DIR = os.path.join(BASE_DIR, 'uploads')
 if not os.path.exists(UPLOAD_DIR):
     os.makedirs(UPLOAD_DIR)
 
+# Chunked uploads (files/uploads/) left unfinished this long are dropped, in seconds
+UPLOAD_SESSION_MAX_AGE = 24 * 60 * 60
+# Largest file a chunked upload may declare, in bytes
+UPLOAD_MAX_BYTES = 1024 * 1024 * 1024
+# Stored uploads no file points to are deleted by sweep_uploads once untouched this long, in seconds
+UPLOAD_SWEEP_GRACE = 60 * 60
+
+# Prediction tables (Parquet) written by processing jobs, one content-addressed folder per result
+RESULTS_DIR = os.path.join(BASE_DIR, 'results')
+
+# CSV/Excel/JSON exports rendered on download, evicted least-recently-used above the budget
+EXPORT_CACHE_DIR = os.path.join(BASE_DIR, 'export_cache')
+EXPORT_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+# Background processing (python manage.py run_workers)
+# When enabled, jobs/<id>/execute/ only queues the job: run_workers must be running,
+# or queued jobs stay 'pending'. When disabled, it runs the prediction inside the request
+PROCESSING_QUEUE_ENABLED = True
+PROCESSING_WORKER_CONCURRENCY = max(1, (os.cpu_count() or 2) - 1)
+PROCESSING_WORKER_POLL_INTERVAL = 2.0
+PROCESSING_JOB_TIMEOUT = 5 * 60  # seconds without a heartbeat before a claimed job is considered stale
+PROCESSING_HEARTBEAT_INTERVAL = 30  # seconds between heartbeats of a running job
+PROCESSING_JOB_MAX_ATTEMPTS = 3
+
+# Setups at least this large are read and scored in chunks of PROCESSING_CHUNK_ROWS rows
+PROCESSING_STREAMING_MIN_BYTES = 64 * 1024 * 1024
+PROCESSING_CHUNK_ROWS = 50000
+
+# Up to this many queued jobs are claimed together and scored with one model call
+PROCESSING_BATCH_SIZE = 8
+
+# Predictions of rows already scored for the same model, shared by every worker
+# (SQLite; each process also keeps a memory LRU). None keeps the cache in memory only
+PREDICTION_CACHE_PATH = os.path.join(BASE_DIR, 'prediction_cache', 'predictions.sqlite3')
+
+# Error-rate regressor scored alongside the classifier (features.pkl and threshold.pkl
+# next to it); None scores the classifier only
+ERROR_RATE_REGRESSOR_PATH = os.path.join(BASE_DIR, 'data_processor', 'services', 'best_regressor.pkl')
+
+# Online scoring of individual slots (slots/score/): largest request accepted
+SLOT_SCORING_MAX_SLOTS = 50
+
+# Feeder-assignment what-if search (files/<id>/optimize/): candidate moves scored per request at most
+OPTIMIZER_MAX_CANDIDATES = 20000
+
+# Service and worker messages (timings, skipped artifacts, job outcomes), with the
+# process name so the output of the worker pool can be told apart
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'process': {'format': '%(asctime)s %(levelname)s %(processName)s %(name)s: %(message)s'},
+    },
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler', 'formatter': 'process'},
+    },
+    'loggers': {
+        'data_processor': {'handlers': ['console'], 'level': 'INFO'},
+    },
+}
+
 CSRF_TRUSTED_ORIGINS = [
     "http://localhost:5173",
 ]
\ No newline at end of file
@@ -0,0 +1,39 @@
+import os
+import time
+
+import pandas as pd
+from django.core.management.base import BaseCommand, CommandError
+
+from ...services.ingestion import read_feeder_setup
+
+
+class Command(BaseCommand):
+    help = 'Time the streaming workbook reader of feeder setups against pd.read_excel'
+
+    def add_arguments(self, parser):
+        parser.add_argument('workbooks', nargs='+', help='.xlsx feeder setups')
+        parser.add_argument('--repeat', type=int, default=3, help='Runs of each reader; the best one is reported')
+
+    def handle(self, *args, **options):
+        for path in options['workbooks']:
+            if not os.path.exists(path):
+                raise CommandError(f'No such workbook: {path}')
+
+            streamed = pd_read = None
+            streaming_time = pandas_time = float('inf')
+            for _ in range(options['repeat']):
+                start = time.perf_counter()
+                streamed = read_feeder_setup(path)['frame']
+                streaming_time = min(streaming_time, time.perf_counter() - start)
+
+                # Whole sheet as pandas reads it (job lines and footer included, types per cell)
+                start = time.perf_counter()
+                pd_read = pd.read_excel(path, sheet_name=0, header=None)
+                pandas_time = min(pandas_time, time.perf_counter() - start)
+
+            self.stdout.write(
+                f"{os.path.basename(path)} ({os.path.getsize(path) / 1024 / 1024:.1f} MiB): "
+                f"streaming reader {len(streamed)} rows in {streaming_time:.2f}s, "
+                f"pd.read_excel {len(pd_read)} rows in {pandas_time:.2f}s "
+                f"({pandas_time / streaming_time:.1f}x)"
+            )
@@ -0,0 +1,48 @@
+import os
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from ...services.compiled_scorer import check_equivalence, export_scorer, get_scorer
+from ...services.history_store import DEFAULT_HISTORY_PATH, get_history
+from ...services.model_registry import DEFAULT_PIPELINE_PATH
+
+
+class Command(BaseCommand):
+    help = 'Compile the fitted pipeline into a NumPy scorer artifact and check it against the pipeline'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--pipeline', default=DEFAULT_PIPELINE_PATH,
+            help='Pickled pipeline to compile (defaults to bomare_best_pipeline.pkl)',
+        )
+        parser.add_argument(
+            '--output', default=None,
+            help='Artifact path (defaults to <pipeline>.scorer.npz, where the scoring code looks for it)',
+        )
+        parser.add_argument(
+            '--history', default=DEFAULT_HISTORY_PATH,
+            help='PartUsage CSV whose rows are scored by both models for the equivalence check',
+        )
+
+    def handle(self, *args, **options):
+        compiled = export_scorer(options['pipeline'], options['output'])
+        self.stdout.write(f"Compiled scorer written to {compiled['path']} (pipeline {compiled['source_version'][:12]})")
+
+        scorer = get_scorer(compiled['path'])['scorer']
+        X = get_history(options['history'])['frame'].reset_index()
+        for c in scorer['features']:
+            if c not in X.columns:
+                X[c] = np.nan
+        X = X[scorer['features']].replace([np.inf, -np.inf], np.nan)
+
+        check = check_equivalence(compiled['pipeline'], scorer, X)
+        self.stdout.write(
+            f"{check['rows']} rows: max probability difference {check['max_abs_diff']:.3g}, "
+            f"{check['label_mismatches']} label mismatches, "
+            f"pipeline {check['pipeline_time'] * 1000:.1f} ms, compiled {check['compiled_time'] * 1000:.1f} ms"
+        )
+        if not check['equivalent']:
+            # Never leave a diverging artifact where the scoring code would pick it up
+            os.remove(compiled['path'])
+            raise CommandError('Compiled scorer does not match the pipeline; artifact removed')
@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from ...services.worker import run_worker_pool
+
+
+class Command(BaseCommand):
+    help = 'Run background worker processes that execute pending processing jobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency', type=int, default=settings.PROCESSING_WORKER_CONCURRENCY,
+            help='Number of worker processes (defaults to PROCESSING_WORKER_CONCURRENCY)',
+        )
+        parser.add_argument(
+            '--poll-interval', type=float, default=settings.PROCESSING_WORKER_POLL_INTERVAL,
+            help='Seconds to wait between queue polls when there is no work',
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Drain the queue and exit instead of polling forever',
+        )
+
+    def handle(self, *args, **options):
+        concurrency = max(1, options['concurrency'])
+        self.stdout.write(f"Starting {concurrency} worker(s)")
+        run_worker_pool(concurrency, options['poll_interval'], once=options['once'])
+        self.stdout.write("Workers stopped")
@@ -0,0 +1,22 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from ...services.file_store import expire_upload_sessions, sweep_uploads
+from ...views.file import UPLOAD_DIR
+
+
+class Command(BaseCommand):
+    help = 'Delete stored uploads that no file points to any more, and expired chunked uploads'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--grace', type=int, default=settings.UPLOAD_SWEEP_GRACE,
+            help='Keep objects stored or referenced less than this many seconds ago (defaults to UPLOAD_SWEEP_GRACE)',
+        )
+
+    def handle(self, *args, **options):
+        expired = expire_upload_sessions(settings.UPLOAD_SESSION_MAX_AGE)
+        removed = sweep_uploads(UPLOAD_DIR, options['grace'])
+        for path in removed:
+            self.stdout.write(f"Removed {path}")
+        self.stdout.write(f"{len(removed)} unreferenced upload(s) removed, {expired} chunked upload(s) expired")
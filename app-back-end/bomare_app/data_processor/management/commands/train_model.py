@@ -0,0 +1,122 @@
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...services.history_store import DEFAULT_HISTORY_PATH
+from ...services.model_registry import DEFAULT_PIPELINE_PATH
+from ...services.training import FAMILIES, GRID, HALVING, train_pipeline
+
+
+class Command(BaseCommand):
+    help = 'Retrain the error prediction pipeline from feeder setups and part usage history'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'setups', nargs='+',
+            help='Feeder setup files (CSV) whose slots make up the training data',
+        )
+        parser.add_argument(
+            '--history', default=DEFAULT_HISTORY_PATH,
+            help='PartUsage CSV joined onto the setups (defaults to the one used for predictions)',
+        )
+        parser.add_argument(
+            '--output', required=True,
+            help=f'Where to write the winning pipeline and its lookup tables; the serving pipeline '
+                 f'({DEFAULT_PIPELINE_PATH}) is only replaced when given explicitly',
+        )
+        parser.add_argument(
+            '--families', default=','.join(FAMILIES),
+            help=f'Comma-separated model families to search (any of {", ".join(FAMILIES)})',
+        )
+        parser.add_argument('--cv', type=int, default=3, help='Cross-validation folds')
+        parser.add_argument('--scoring', default='f1', help='scikit-learn scorer used to rank candidates')
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count() or 1,
+            help='Processes fitting candidates in parallel',
+        )
+        parser.add_argument('--test-size', type=float, default=0.2, help='Share of rows held out for testing')
+        parser.add_argument(
+            '--search', choices=[GRID, HALVING], default=GRID,
+            help='Exhaustive grid, or successive halving over the training rows with early stopping',
+        )
+        parser.add_argument(
+            '--factor', type=int, default=3,
+            help='Halving: share of candidates kept (1/factor) and row growth per round',
+        )
+        parser.add_argument(
+            '--compare-full', action='store_true',
+            help='Halving: also run the full grid and report the measured wall time saved',
+        )
+        parser.add_argument(
+            '--no-lookups', action='store_true',
+            help='Train without the history lookup tables (Error Rate imputation, PartNumber_MeanError)',
+        )
+        parser.add_argument('--report', default=None, help='Also write the report as JSON to this path')
+
+    def handle(self, *args, **options):
+        families = [f.strip() for f in options['families'].split(',') if f.strip()]
+        unknown = [f for f in families if f not in FAMILIES]
+        if unknown:
+            raise CommandError(f'Unknown model families: {", ".join(unknown)}')
+
+        # Fail now rather than after the search when an output cannot be written
+        for path in [options['output'], options['report']]:
+            if not path:
+                continue
+            directory = os.path.dirname(os.path.abspath(path))
+            try:
+                os.makedirs(directory, exist_ok=True)
+            except OSError as e:
+                raise CommandError(f'Cannot create {directory}: {e}')
+            if not os.access(directory, os.W_OK):
+                raise CommandError(f'{directory} is not writable')
+
+        report = train_pipeline(
+            options['setups'],
+            historical_merged_path=options['history'],
+            output_path=options['output'],
+            families=families,
+            cv=options['cv'],
+            scoring=options['scoring'],
+            workers=max(1, options['workers']),
+            test_size=options['test_size'],
+            search=options['search'],
+            factor=max(2, options['factor']),
+            compare_full=options['compare_full'],
+            use_lookups=not options['no_lookups'],
+        )
+
+        self.stdout.write(
+            f"{report['rows']} rows ({report['train_rows']} train, {report['test_rows']} test), "
+            f"frame built in {report['frame_time']:.2f}s; {report['preprocessor_fits']} preprocessor fits "
+            f"({report['preprocess_time']:.2f}s) instead of {report['preprocessor_fits_without_cache']}"
+        )
+        for family, result in report['families'].items():
+            self.stdout.write(
+                f"{family:<20} {result['candidates']:>3} candidates {result['fits']:>3} fits  "
+                f"wall {result['wall_time']:7.2f}s  fit {result['fit_time']:7.2f}s  "
+                f"refit {result['refit_time']:6.2f}s  cv {options['scoring']} {result['cv_score']:.4f}  "
+                f"test {options['scoring']} {result['test_score']:.4f}  {result['best_params']}"
+            )
+            if 'rungs' in result:
+                rounds = ', '.join(f"{r['candidates']}x{r['rows']} rows" for r in result['rungs'])
+                line = (f"{'':<20} rounds {rounds}; {result['fits']} of {result['full_grid_fits']} fits, "
+                        f"estimated wall time saved {result['wall_time_saved']:.2f}s")
+                if 'full_grid_wall_time' in result:
+                    line += (f", measured {result['full_grid_wall_time'] - result['wall_time']:.2f}s "
+                             f"(same parameters as the full grid: {result['same_params_as_full_grid']})")
+                self.stdout.write(line)
+        if 'full_grid' in report:
+            self.stdout.write(
+                f"Full grid took {report['full_grid']['wall_time']:.2f}s, "
+                f"halving saved {report['full_grid']['wall_time_saved']:.2f}s"
+            )
+        self.stdout.write(
+            f"Best: {report['best_family']}, written to {report['output_path']} "
+            f"(total {report['total_time']:.2f}s). Run compile_scorer and package_models to rebuild its "
+            f"compiled scorer and memory-mapped package."
+        )
+        if options['report']:
+            with open(options['report'], 'w') as f:
+                json.dump(report, f, indent=2, default=str)
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.4 on 2026-10-18 16:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data_processor', '0009_user_last_login'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='processingjob',
+            name='attempts',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='processingjob',
+            name='worker_id',
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+    ]
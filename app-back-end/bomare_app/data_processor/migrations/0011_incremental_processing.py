@@ -0,0 +1,28 @@
+# Generated by Django 5.1.4 on 2026-10-18 16:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data_processor', '0010_processingjob_worker_id_attempts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='processingjob',
+            name='mode',
+            field=models.CharField(default='full', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='processingresult',
+            name='line_name',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='processingresult',
+            name='setup_name',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=100),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.4 on 2026-10-18 18:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data_processor', '0012_content_addressed_uploads'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='file',
+            name='cache_path',
+            field=models.CharField(blank=True, default='', max_length=500),
+        ),
+        migrations.AddField(
+            model_name='file',
+            name='cache_status',
+            field=models.CharField(blank=True, default='', max_length=20),
+        ),
+    ]
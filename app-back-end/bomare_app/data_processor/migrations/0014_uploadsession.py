@@ -0,0 +1,31 @@
+# Generated by Django 5.1.4 on 2026-10-18 19:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data_processor', '0013_file_setup_cache'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadSession',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('filename', models.CharField(max_length=255)),
+                ('file_type', models.CharField(max_length=50)),
+                ('total_size', models.BigIntegerField()),
+                ('received', models.BigIntegerField(default=0)),
+                ('checksum', models.CharField(blank=True, default='', max_length=64)),
+                ('partial_path', models.CharField(max_length=500)),
+                ('status', models.CharField(default='open', max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('file', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='upload_sessions', to='data_processor.file')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='upload_sessions', to='data_processor.user')),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-18 20:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data_processor', '0014_uploadsession'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='processingjob',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -3,4 +3,5 @@ from .file import File
 from .job import ProcessingJob
 from .result import ProcessingResult
 from .export import Export
-from .history import ProcessingHistory
\ No newline at end of file
+from .history import ProcessingHistory
+from .upload import UploadSession
\ No newline at end of file
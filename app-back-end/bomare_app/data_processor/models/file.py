@@ -8,6 +8,11 @@ class File(models.Model):
     file_type = models.CharField(max_length=50)
     file_size = models.IntegerField()
     storage_path = models.CharField(max_length=500)
+    # sha256 of the bytes; files with the same content share storage_path
+    content_hash = models.CharField(max_length=64, blank=True, default='', db_index=True)
+    # Parsed, typed copy of the setup written after the upload (see services/setup_cache.py)
+    cache_path = models.CharField(max_length=500, blank=True, default='')
+    cache_status = models.CharField(max_length=20, blank=True, default='')
     upload_date = models.DateTimeField(auto_now_add=True)
     status = models.CharField(max_length=50, default='uploaded')
     is_deleted = models.BooleanField(default=False)
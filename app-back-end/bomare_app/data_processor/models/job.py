@@ -8,6 +8,13 @@ class ProcessingJob(models.Model):
     started_at = models.DateTimeField(null=True, blank=True)
     completed_at = models.DateTimeField(null=True, blank=True)
     error_message = models.TextField(null=True, blank=True)
+    # Queue bookkeeping for the background workers (see services/job_queue.py)
+    worker_id = models.CharField(max_length=100, null=True, blank=True)
+    # Refreshed by the worker while the job runs; stale jobs are requeued from it
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.IntegerField(default=0)
+    # 'full', or 'diff' to re-score only what changed since the setup's last result
+    mode = models.CharField(max_length=10, default='full')
 
     def __str__(self):
         return f"Job #{self.id} for {self.file.filename}"
\ No newline at end of file
@@ -8,6 +8,13 @@ class ProcessingResult(models.Model):
     prediction_data = models.JSONField()
     confidence_level = models.FloatField()
     created_at = models.DateTimeField(auto_now_add=True)
+    # Setup the result belongs to (LineName/SetupName columns), to find it again in diff mode
+    line_name = models.CharField(max_length=100, blank=True, default='', db_index=True)
+    setup_name = models.CharField(max_length=100, blank=True, default='', db_index=True)
+    # What the result was computed from, to serve it again for the same upload
+    content_hash = models.CharField(max_length=64, blank=True, default='', db_index=True)
+    model_version = models.CharField(max_length=200, blank=True, default='')
+    history_version = models.CharField(max_length=64, blank=True, default='')
 
     def __str__(self):
         return f"Result for Job #{self.job.id}"
\ No newline at end of file
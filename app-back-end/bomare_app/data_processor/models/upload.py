@@ -0,0 +1,24 @@
+from django.db import models
+from .file import File
+from .user import User
+
+
+# A file uploaded in chunks (see views/file.py); its File row is created on finalize
+class UploadSession(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='upload_sessions')
+    filename = models.CharField(max_length=255)
+    file_type = models.CharField(max_length=50)
+    total_size = models.BigIntegerField()
+    # Bytes written so far: the offset the next chunk starts at
+    received = models.BigIntegerField(default=0)
+    # Expected sha256 of the whole file, given at init or on finalize
+    checksum = models.CharField(max_length=64, blank=True, default='')
+    partial_path = models.CharField(max_length=500)
+    # 'open', 'finalizing', 'complete', 'failed' (checksum mismatch) or 'expired'
+    status = models.CharField(max_length=20, default='open')
+    file = models.ForeignKey(File, on_delete=models.SET_NULL, null=True, blank=True, related_name='upload_sessions')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Upload #{self.id} of {self.filename} ({self.received}/{self.total_size})"
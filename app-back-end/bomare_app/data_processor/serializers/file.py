@@ -1,6 +1,7 @@
 from gotrue import model
 from rest_framework import serializers
 from ..models.file import File , User
+from ..models.upload import UploadSession
 
 class FileSerializer(serializers.ModelSerializer):
     username = serializers.ReadOnlyField(source='user.username')
@@ -8,5 +9,12 @@ class FileSerializer(serializers.ModelSerializer):
         model = File
 
         fields = ['id', 'user', 'filename', 'file_type', 'file_size',
-                  'storage_path', 'upload_date', 'status', 'is_deleted', 'username']
-        read_only_fields = ['id', 'upload_date', 'username']
\ No newline at end of file
+                  'storage_path', 'content_hash', 'cache_status', 'upload_date', 'status', 'is_deleted', 'username']
+        read_only_fields = ['id', 'cache_status', 'upload_date', 'username']
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = UploadSession
+        fields = ['id', 'filename', 'file_type', 'total_size', 'received', 'checksum',
+                  'status', 'file', 'created_at', 'updated_at']
+        read_only_fields = ['id', 'received', 'status', 'file', 'created_at', 'updated_at']
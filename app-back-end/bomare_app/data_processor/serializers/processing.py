@@ -7,14 +7,16 @@ from ..models.export import Export
 class ProcessingJobSerializer(serializers.ModelSerializer):
     class Meta:
         model = ProcessingJob
-        fields = ['id', 'file', 'status', 'started_at', 'completed_at', 'error_message']
+        fields = ['id', 'file', 'status', 'started_at', 'completed_at', 'error_message',
+                  'worker_id', 'attempts', 'heartbeat_at', 'mode']
         read_only_fields = ['id']
 
 
 class ProcessingResultSerializer(serializers.ModelSerializer):
     class Meta:
         model = ProcessingResult
-        fields = ['id', 'job', 'ai_score', 'prediction_data', 'confidence_level', 'created_at']
+        fields = ['id', 'job', 'ai_score', 'prediction_data', 'confidence_level', 'created_at',
+                  'line_name', 'setup_name']
         read_only_fields = ['id', 'created_at']
 
 
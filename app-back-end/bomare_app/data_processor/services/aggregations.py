@@ -0,0 +1,268 @@
+import numpy as np
+import pandas as pd
+
+# Sentinel for "no row seen yet" in the first_seen / first_error columns
+_NEVER = np.iinfo(np.int64).max
+
+PARTIAL_COLUMNS = ['size', 'errors', 'counted', 'first_seen', 'first_error']
+
+
+def dimension_partial(values, flags, counted_mask, offset=0):
+    """
+    Per-value counters for one dimension, from a single factorization of the column.
+
+    Returns a frame indexed by the distinct (non-null) values with:
+      size        rows holding the value
+      errors      rows holding the value with flag == 1
+      counted     rows holding the value where counted_mask is true
+      first_seen  position of the first row holding the value
+      first_error position of the first flagged row holding the value
+    Positions are shifted by `offset` so partials of consecutive chunks can be merged.
+    """
+    codes, uniques = pd.factorize(values)
+    n = len(uniques)
+    valid = codes >= 0
+    rows = np.flatnonzero(valid) + offset
+    codes = codes[valid]
+    is_error = np.asarray(flags)[valid] == 1
+
+    size = np.bincount(codes, minlength=n)
+    errors = np.bincount(codes[is_error], minlength=n)
+    counted = np.bincount(codes[np.asarray(counted_mask)[valid]], minlength=n)
+
+    # Unbuffered in-place minimum: O(rows), no sort
+    first_seen = np.full(n, _NEVER, dtype=np.int64)
+    np.minimum.at(first_seen, codes, rows)
+
+    first_error = np.full(n, _NEVER, dtype=np.int64)
+    np.minimum.at(first_error, codes[is_error], rows[is_error])
+
+    return pd.DataFrame({
+        'size': size.astype(np.int64),
+        'errors': errors.astype(np.int64),
+        'counted': counted.astype(np.int64),
+        'first_seen': first_seen,
+        'first_error': first_error,
+    }, index=pd.Index(uniques))
+
+
+def merge_partial(left, right):
+    """Combine the counters of the same dimension computed on two row ranges"""
+    if left is None:
+        return right
+    if right is None:
+        return left
+    combined = pd.concat([left, right])
+    return combined.groupby(level=0, sort=False).agg({
+        'size': 'sum',
+        'errors': 'sum',
+        'counted': 'sum',
+        'first_seen': 'min',
+        'first_error': 'min',
+    })
+
+
+def subtract_partial(left, right):
+    """
+    Remove from left the counters of rows it was computed on (right). Values left
+    without rows are dropped; first_seen is kept, first_error reset when no flagged
+    row remains.
+    """
+    if right is None or right.empty:
+        return left
+    removed = right.reindex(left.index, fill_value=0)
+    patched = left.copy()
+    for col in ['size', 'errors', 'counted']:
+        patched[col] = patched[col] - removed[col]
+    patched.loc[patched['errors'] <= 0, 'first_error'] = _NEVER
+    return patched[patched['size'] > 0]
+
+
+def compute_partials(df, part_number_col, shape_col=None, pkg_col=None, flag_col='PredictedError', offset=0):
+    """Counters for every reported dimension of a scored frame"""
+    flags = df[flag_col].to_numpy()
+    has_position = df['Position'].notna().to_numpy()
+
+    # dimension -> (column, which rows count towards 'counted')
+    dimensions = {
+        'position': ('Position', df[part_number_col].notna().to_numpy()),
+        'part': (part_number_col, has_position),
+        'module': ('Module', has_position),
+        'shape': (shape_col, has_position),
+        'package': (pkg_col, has_position),
+        'package_type': ('PackageType', has_position),
+        'tape_width': ('TapeWidth', has_position),
+        'feeder_type': ('FeederType', has_position),
+    }
+
+    partials = {}
+    for name, (col, counted_mask) in dimensions.items():
+        if col and col in df.columns:
+            partials[name] = dimension_partial(df[col], flags, counted_mask, offset)
+    return partials
+
+
+def merge_partials(left, right):
+    """Merge two compute_partials results (e.g. from consecutive chunks)"""
+    if not left:
+        return right
+    return {name: merge_partial(left.get(name), right.get(name)) for name in right.keys() | left.keys()}
+
+
+def subtract_partials(left, right):
+    """subtract_partial for every dimension"""
+    return {name: subtract_partial(partial, right.get(name)) for name, partial in left.items()}
+
+
+def partials_frame(partials):
+    """
+    All dimensions of compute_partials in one long table, to store with a result.
+    Values are kept as text with their Python type so partials_from_frame restores them.
+    """
+    frames = []
+    for name, partial in partials.items():
+        values = list(partial.index)
+        frames.append(pd.DataFrame({
+            'dimension': name,
+            'value': [str(v) for v in values],
+            'value_type': [type(v).__name__ for v in values],
+            **{col: partial[col].to_numpy() for col in PARTIAL_COLUMNS},
+        }))
+    if not frames:
+        return pd.DataFrame(columns=['dimension', 'value', 'value_type'] + PARTIAL_COLUMNS)
+    return pd.concat(frames, ignore_index=True)
+
+
+_VALUE_TYPES = {'str': str, 'int': int, 'float': float, 'bool': lambda v: v == 'True'}
+
+
+def partials_from_frame(frame):
+    """Inverse of partials_frame"""
+    partials = {}
+    for name, group in frame.groupby('dimension', sort=False):
+        values = [_VALUE_TYPES.get(t, str)(v) for v, t in zip(group['value'], group['value_type'])]
+        partials[name] = pd.DataFrame(
+            {col: group[col].to_numpy(dtype=np.int64) for col in PARTIAL_COLUMNS},
+            index=pd.Index(values, dtype=object),
+        )
+    return partials
+
+
+def confusion_counts(df, flag_col='PredictedError'):
+    """True/false positives/negatives of the flags against the historical errors"""
+    error_col = 'ActualError' if 'ActualError' in df.columns else 'Error'
+    y_true = (df[error_col] > 0).to_numpy()
+    y_pred = (df[flag_col] == 1).to_numpy()
+    return {
+        'tp': int(np.sum(y_true & y_pred)),
+        'fp': int(np.sum(~y_true & y_pred)),
+        'fn': int(np.sum(y_true & ~y_pred)),
+        'tn': int(np.sum(~y_true & ~y_pred)),
+    }
+
+
+def _distribution(partial):
+    """value_counts(normalize=True): shares by value, most frequent first"""
+    counts = partial.sort_values('first_seen', kind='stable')['size']
+    return (counts.sort_values(ascending=False) / counts.sum()).to_dict()
+
+
+def _mode(partial):
+    """Series.mode().iloc[0]: the smallest of the most frequent values"""
+    if partial.empty:
+        return None
+    return partial['size'].sort_index().idxmax()
+
+
+def _error_table(partial, col):
+    """Per-value error table: the groupby(col).agg(sum, mean, count) report"""
+    ordered = partial.sort_index()
+    table = pd.DataFrame({
+        col: ordered.index.to_numpy(),
+        'ErrorCount': ordered['errors'].to_numpy(),
+        'ErrorRate': ordered['errors'].to_numpy() / ordered['size'].to_numpy(),
+        'TotalCount': ordered['counted'].to_numpy(),
+    })
+    total = table['ErrorCount'].sum()
+    table['ErrorPercentage'] = table['ErrorCount'] / total * 100 if total > 0 else 0
+    return table.sort_values('ErrorCount', ascending=False).reset_index(drop=True)
+
+
+def _error_counts(partial):
+    """value_counts() over the flagged rows only, most errors first"""
+    flagged = partial[partial['errors'] > 0].sort_values('first_error', kind='stable')
+    return flagged['errors'].sort_values(ascending=False).to_dict()
+
+
+def _error_summary(partial, col, total_errors):
+    """Error table, error counts, top 5 and the value with most errors for one dimension"""
+    errors = _error_counts(partial)
+    top5 = dict(pd.Series(errors).sort_values(ascending=False).head(5))
+    most = None
+    if errors:
+        name, count = max(errors.items(), key=lambda x: x[1])
+        most = {
+            'name': name,
+            'count': int(count),
+            'percentage': float(count / total_errors) if total_errors > 0 else 0
+        }
+    return {'table': _error_table(partial, col), 'errors': errors, 'top5': top5, 'most': most}
+
+
+def finalize_report(partials, total_errors, part_number_col, shape_col=None, pkg_col=None):
+    """
+    Turn merged counters into the summary fields of the prediction JSON and the
+    per-dimension error tables, without touching the rows again.
+    """
+    empty = {'table': None, 'errors': {}, 'top5': {}, 'most': None}
+    position = partials['position']
+    shape = partials.get('shape')
+    package = partials.get('package')
+
+    shape_errors = _error_summary(shape, shape_col, total_errors) if shape is not None else empty
+    part_errors = _error_summary(partials['part'], part_number_col, total_errors)
+    module_errors = _error_summary(partials['module'], 'Module', total_errors)
+    package_errors = _error_summary(package, pkg_col, total_errors) if package is not None else empty
+
+    def distribution(name):
+        return _distribution(partials[name]) if name in partials else {}
+
+    summary = {
+        'unique_part_numbers': int(len(partials['part'])),
+        'unique_feeder_ids': int(len(position)),
+        'most_used_feeder_id': _mode(position),
+        'part_number_count_per_feeder': position['counted'].sort_index().to_dict(),
+        'unique_shapes': int(len(shape)) if shape is not None else 0,
+        'shape_distribution': distribution('shape'),
+        'most_common_shape': _mode(shape) if shape is not None else None,
+        'unique_package_names': int(len(package)) if package is not None else 0,
+        'most_common_package': _mode(package) if package is not None else None,
+        'package_type_distribution': distribution('package_type'),
+        'tape_width_distribution': distribution('tape_width'),
+        'feeder_type_distribution': distribution('feeder_type'),
+        'error_distribution_by_shape': shape_errors['errors'],
+        'shape_with_most_error': shape_errors['most'],
+        'top_5_shapes_with_errors': shape_errors['top5'],
+        'error_distribution_by_part_number': part_errors['errors'],
+        'part_number_with_most_error': part_errors['most'],
+        'top_5_parts_with_errors': part_errors['top5'],
+        'error_distribution_by_module': module_errors['errors'],
+        'module_with_most_error': module_errors['most'],
+        'top_5_modules_with_errors': module_errors['top5'],
+        'error_distribution_by_package': package_errors['errors'],
+        'package_with_most_error': package_errors['most'],
+        'top_5_packages_with_errors': package_errors['top5'],
+    }
+    tables = {
+        'shape_errors': shape_errors['table'],
+        'part_errors': part_errors['table'],
+        'module_errors': module_errors['table'],
+        'package_errors': package_errors['table'],
+    }
+    return {'summary': summary, 'tables': tables}
+
+
+def summarize_errors(df, part_number_col, shape_col=None, pkg_col=None, total_errors=0, flag_col='PredictedError'):
+    """Single-frame shortcut: compute_partials followed by finalize_report"""
+    partials = compute_partials(df, part_number_col, shape_col, pkg_col, flag_col)
+    return finalize_report(partials, total_errors, part_number_col, shape_col, pkg_col)
@@ -0,0 +1,95 @@
+import os
+import threading
+import time
+
+# Rendered export files, stored as <cache_dir>/<key[:2]>/<key>-<name>
+_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'render_time': 0.0}
+
+
+def artifact_path(cache_dir, key, name):
+    """Location of a cached artifact; the two-character fan-out keeps directories small"""
+    return os.path.join(cache_dir, key[:2], f'{key}-{name}')
+
+
+def get_or_render(cache_dir, key, name, render, max_bytes=None):
+    """
+    Return the cached artifact for (key, name), calling render(path) to produce it
+    on a miss. Hits refresh the file's mtime, which is what eviction orders by.
+    """
+    path = artifact_path(cache_dir, key, name)
+    if os.path.exists(path):
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        with _lock:
+            _stats['hits'] += 1
+        return path
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    # Render next to the target and move it in place, so a failed or concurrent
+    # render never leaves a half-written file behind
+    root, ext = os.path.splitext(path)
+    partial_path = f'{root}.{os.getpid()}.{threading.get_ident()}.partial{ext}'
+    start = time.perf_counter()
+    try:
+        render(partial_path)
+        os.replace(partial_path, path)
+    finally:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+
+    with _lock:
+        _stats['misses'] += 1
+        _stats['render_time'] += time.perf_counter() - start
+
+    if max_bytes:
+        evict(cache_dir, max_bytes, keep=path)
+    return path
+
+
+def evict(cache_dir, max_bytes, keep=None):
+    """Delete least recently used artifacts until the cache fits in max_bytes"""
+    entries = []
+    total = 0
+    for dirpath, _, filenames in os.walk(cache_dir):
+        for filename in filenames:
+            if '.partial' in filename:
+                continue
+            path = os.path.join(dirpath, filename)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue  # removed by another process meanwhile
+            entries.append((st.st_mtime, st.st_size, path))
+            total += st.st_size
+
+    removed = 0
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        if path == keep:
+            continue
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        removed += 1
+
+    with _lock:
+        _stats['evictions'] += removed
+    return removed
+
+
+def get_cache_stats(cache_dir=None):
+    """Hit/miss/eviction counters of this process, plus the on-disk size when cache_dir is given"""
+    with _lock:
+        stats = dict(_stats)
+    if cache_dir and os.path.isdir(cache_dir):
+        files = [os.path.join(d, f) for d, _, fs in os.walk(cache_dir) for f in fs]
+        stats['files'] = len(files)
+        stats['bytes'] = sum(os.path.getsize(f) for f in files if os.path.exists(f))
+    return stats
@@ -1,10 +1,17 @@
 import pandas as pd 
-import pickle
 import json
 import numpy as np
 from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score
 from datetime import datetime
 import os
+import logging
+
+from .history_store import join_history
+from .ingestion import read_feeder_setup
+from .model_registry import get_pipeline
+from .positions import build_positions, explode_positions, position_modules
+
+logger = logging.getLogger(__name__)
 
 script_dir = os.path.dirname(os.path.abspath(__file__))  # Folder where script lives
 
@@ -29,35 +36,25 @@ def predict_feeder_errors_detailed(
         'json': json_output_path
     }
 
-    # 1) Load historical merged data
-    hist = pd.read_csv(historical_merged_path)
-    print("hist data")
-    # 2) Load feeder setup
-    try:
-        fs = pd.read_csv(feeder_setup_path, skiprows=2, skipfooter=2,sep=';')
-    except:
-        fs = pd.read_csv(feeder_setup_path, skiprows=2, skipfooter=2, sep=';', engine='python', on_bad_lines='skip')
-    print("read file")
+    # Load feeder setup (header/footer/delimiter detected up front, C parser)
+    fs = read_feeder_setup(feeder_setup_path)['frame']
+    logger.debug("Read %s", feeder_setup_path)
     # Identify key columns
     cols = {col.lower(): col for col in fs.columns}
     module_col = cols.get('modulenumber')
     location_col = cols.get('location')
     part_number_col = cols.get('partnumber')
-    # Normalize Position
-    fs['Position'] = (fs[module_col].astype(str).str.lstrip('0').replace('', '0').map(lambda m: f"M{m}") + '-' + 
-                      fs[location_col].astype(str).str.replace("'","").str.lstrip('0').replace('', '0'))
-    if fs['Position'].str.contains(',').any():
-        fs = fs.assign(Position=fs['Position'].str.split(',')).explode('Position').reset_index(drop=True)
-
-    # Merge
-    hist_keys = set(zip(hist['Position'], hist[part_number_col])) if 'Position' in hist.columns else set()
-    df = pd.merge(fs, hist, on=['Position', part_number_col], how='left')
-
-    # Load pipeline
-    with open(pipeline_path, 'rb') as f:
-        pipeline = pickle.load(f)
-    pre = pipeline.named_steps['pre']
-    features = list(pre.transformers_[0][2]) + list(pre.transformers_[1][2])
+    # Normalize Position (once per distinct module/location, see positions.py)
+    fs['Position'] = build_positions(fs[module_col], fs[location_col])
+    fs = explode_positions(fs)
+
+    # Merge with the preloaded, indexed history (parsed once per process)
+    df = join_history(fs, part_number_col, historical_merged_path)
+
+    # Load pipeline (cached per process, reloaded only when the pickle changes)
+    model_entry = get_pipeline(pipeline_path)
+    pipeline = model_entry['pipeline']
+    features = list(model_entry['features'])
     for c in features:
         if c not in df.columns:
             df[c] = np.nan
@@ -136,7 +133,7 @@ def predict_feeder_errors_detailed(
         }
 
     # by module
-    df['Module'] = df['Position'].str.extract(r'(M\d+)')
+    df['Module'] = position_modules(df['Position'])
     err_by_module = df[df['PredictedError']==1]['Module'].value_counts().to_dict()
     top5_modules_err = dict(pd.Series(err_by_module).sort_values(ascending=False).head(5))
     module_with_most_err = None
@@ -0,0 +1,85 @@
+import logging
+import os
+import time
+
+import numpy as np
+
+from .backend_file1 import finish_predictions, prepare_setup, score_prepared, script_dir
+from .compiled_scorer import get_model
+from .ingestion import ingestion_summary, read_feeder_setup
+from .prediction_cache import cache_stats
+from .scoring import slice_regression
+
+logger = logging.getLogger(__name__)
+
+
+def predict_feeder_errors_batch(
+    feeder_setup_paths,
+    historical_merged_path=os.path.join(script_dir, 'PartUsage.csv'),
+    pipeline_path=os.path.join(script_dir, 'bomare_best_pipeline.pkl'),
+    file_prefix='predictions_output',
+    output_root='.',
+    prediction_cache_path=None,
+    regressor_path=None
+):
+    """
+    predict_feeder_errors for several setups with a single model call.
+
+    Each setup is parsed and joined with the (shared, preloaded) history on its
+    own, their feature rows are stacked into one matrix for a single scoring call
+    (rows already in the prediction cache are not scored), and the scores are
+    split back so each setup gets its own tables and JSON, exactly as if it had
+    been processed alone.
+
+    Returns one entry per path, in order: the predict_feeder_errors output, or
+    {'error': message} when that setup could not be processed (every setup when
+    the model cannot be loaded or the scoring call fails).
+    """
+    try:
+        model = get_model(pipeline_path, regressor_path)
+    except Exception as e:
+        return [{'error': str(e)} for _ in feeder_setup_paths]
+    features = model['input_features']
+
+    outputs = [None] * len(feeder_setup_paths)
+    prepared = {}
+    for i, path in enumerate(feeder_setup_paths):
+        try:
+            parsed = read_feeder_setup(path)
+            prepared[i] = (parsed, prepare_setup(parsed['frame'], features, historical_merged_path,
+                                                       parsed.get('positions')))
+        except Exception as e:
+            outputs[i] = {'error': str(e)}
+
+    if prepared:
+        order = list(prepared)
+        bounds = np.cumsum([0] + [len(prepared[i][1]['df']) for i in order])
+
+        start = time.perf_counter()
+        try:
+            cached = score_prepared(model, [prepared[i][1]['df'] for i in order], prediction_cache_path)
+        except Exception as e:
+            # One call scores them all: none of them has predictions
+            for i in order:
+                outputs[i] = {'error': str(e)}
+            return outputs
+        logger.info("Scored %d rows from %d setups in %.3fs", bounds[-1], len(order), time.perf_counter() - start)
+
+        for i, lo, hi in zip(order, bounds[:-1], bounds[1:]):
+            parsed, setup = prepared[i]
+            try:
+                outputs[i] = finish_predictions(
+                    setup,
+                    cached['probabilities'][lo:hi],
+                    cached['labels'][lo:hi],
+                    file_prefix=file_prefix,
+                    output_root=output_root,
+                    ingestion=ingestion_summary(parsed),
+                    prediction_cache=cache_stats(cached['sources'][lo:hi]),
+                    model_version=model['version'],
+                    regression=slice_regression(cached['regression'], lo, hi),
+                )
+            except Exception as e:
+                outputs[i] = {'error': str(e)}
+
+    return outputs
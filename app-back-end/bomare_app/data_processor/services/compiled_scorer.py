@@ -0,0 +1,311 @@
+import logging
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from .lookup_tables import get_lookup_tables, lookups_path_for
+from .model_package import map_npz
+from .model_registry import DEFAULT_PIPELINE_PATH, _file_hash, get_artifact, get_pipeline
+from .scoring import get_regressor
+
+logger = logging.getLogger(__name__)
+
+SCORER_FORMAT = 2
+
+# Distinct rows traversed together: bounds the dense one-hot block (rows x columns)
+BLOCK_ROWS = 512
+
+# Up to this many rows the compiled scorer beats the pipeline (no ColumnTransformer,
+# one pass for probabilities and labels); above it sklearn's C tree traversal wins
+MAX_ROWS = 2000
+
+
+def scorer_path_for(pipeline_path):
+    """Where the compiled artifact of a pipeline lives: next to it, .scorer.npz"""
+    return os.path.splitext(pipeline_path)[0] + '.scorer.npz'
+
+
+def _round_down_float32(values):
+    """Largest float32 <= each float64 value, so float32 rows compare exactly as sklearn does"""
+    rounded = values.astype(np.float32)
+    over = rounded.astype(np.float64) > values
+    rounded[over] = np.nextafter(rounded[over], np.float32(-np.inf))
+    return rounded
+
+
+def compile_pipeline(pipeline, source_version=''):
+    """
+    Flatten a fitted Pipeline(ColumnTransformer('num': median imputer + scaler,
+    'cat': constant imputer + one-hot) -> RandomForestClassifier) into plain arrays:
+    imputation and scaling vectors, the category list of every categorical input,
+    and every tree as (column, threshold, right child, leaf probabilities) per node.
+    """
+    pre = pipeline.named_steps['pre']
+    forest = pipeline.steps[-1][1]
+    num_pipe = pre.named_transformers_['num']
+    cat_pipe = pre.named_transformers_['cat']
+    num_features = list(pre.transformers_[0][2])
+    cat_features = list(pre.transformers_[1][2])
+
+    scaler = num_pipe.named_steps['sc']
+    ohe = cat_pipe.named_steps['ohe']
+    if ohe.drop_idx_ is not None or getattr(ohe, '_infrequent_enabled', False):
+        raise ValueError('Only one-hot encoders without dropped or infrequent categories can be compiled')
+    categories = ohe.categories_
+    cat_offsets = len(num_features) + np.cumsum([0] + [len(c) for c in categories[:-1]])
+
+    columns, thresholds, rights, probas, roots = [], [], [], [], []
+    offset = 0
+    for estimator in forest.estimators_:
+        tree = estimator.tree_
+        nodes = np.arange(tree.node_count)
+        leaf = tree.children_left == -1
+        # sklearn builds trees depth first: the left child of a node is always the next node
+        if not np.array_equal(tree.children_left[~leaf], nodes[~leaf] + 1):
+            raise ValueError('Tree nodes are not in depth-first order')
+
+        # Leaves point right at themselves and always go right, so finished rows stay put
+        columns.append(np.where(leaf, 0, tree.feature).astype(np.int32))
+        thresholds.append(np.where(leaf, -np.inf, _round_down_float32(tree.threshold)).astype(np.float32))
+        rights.append((np.where(leaf, nodes, tree.children_right) + offset).astype(np.int32))
+        value = tree.value[:, 0, :].astype(np.float64)
+        probas.append(value / value.sum(axis=1, keepdims=True))
+        roots.append(offset)
+        offset += tree.node_count
+
+    arrays = {
+        'format': np.array(SCORER_FORMAT),
+        'source_version': np.array(source_version),
+        'num_features': np.array(num_features),
+        'cat_features': np.array(cat_features),
+        'medians': num_pipe.named_steps['imp'].statistics_.astype(np.float64),
+        'mean': scaler.mean_ if scaler.with_mean else np.zeros(len(num_features)),
+        'scale': scaler.scale_ if scaler.with_std else np.ones(len(num_features)),
+        'cat_fill': np.array(str(cat_pipe.named_steps['imp'].fill_value)),
+        'cat_offsets': cat_offsets.astype(np.int32),
+        'n_columns': np.array(int(cat_offsets[-1] + len(categories[-1]))),
+        'classes': np.asarray(forest.classes_),
+        'node_column': np.concatenate(columns),
+        'node_threshold': np.concatenate(thresholds),
+        'node_right': np.concatenate(rights),
+        'node_proba': np.concatenate(probas),
+        'roots': np.array(roots, dtype=np.int32),
+    }
+    # Interleaved (left, right) child of every node; the left child is the next node
+    # except for leaves, which point at themselves on both sides. Stored rather than
+    # derived on load, so it is mapped and shared like the other arrays
+    nodes = np.arange(offset, dtype=np.int32)
+    leaf = arrays['node_right'] == nodes
+    arrays['node_children'] = np.stack([np.where(leaf, nodes, nodes + 1), arrays['node_right']], axis=1).ravel()
+    for f, cats in enumerate(categories):
+        arrays[f'categories_{f}'] = np.asarray(cats).astype(str)
+    return arrays
+
+
+def export_scorer(pipeline_path=DEFAULT_PIPELINE_PATH, output_path=None):
+    """Compile a pickled pipeline into its .npz scorer artifact"""
+    output_path = output_path or scorer_path_for(pipeline_path)
+    pipeline = get_pipeline(pipeline_path)['pipeline']
+    arrays = compile_pipeline(pipeline, source_version=_file_hash(pipeline_path))
+
+    # Write next to the target and move it in place, so readers never see a partial file
+    partial_path = f'{output_path}.{os.getpid()}.partial.npz'
+    np.savez(partial_path, **arrays)
+    os.replace(partial_path, output_path)
+    return {'path': output_path, 'pipeline': pipeline, 'source_version': str(arrays['source_version'])}
+
+
+def load_scorer(path):
+    """
+    Read a scorer artifact: plain arrays, no pickle and no sklearn. The node
+    arrays are mapped from the file, so every worker shares one copy of them.
+    """
+    scorer = map_npz(path)
+    if int(scorer['format']) != SCORER_FORMAT:
+        raise ValueError(f'Unsupported scorer format {int(scorer["format"])} in {path}')
+
+    num_features = [str(c) for c in scorer['num_features']]
+    cat_features = [str(c) for c in scorer['cat_features']]
+    scorer['category_maps'] = [
+        {value: code for code, value in enumerate(scorer[f'categories_{f}'].tolist())}
+        for f in range(len(cat_features))
+    ]
+    scorer['features'] = num_features + cat_features
+    scorer['source_version'] = str(scorer['source_version'])
+    scorer['cat_fill'] = str(scorer['cat_fill'])
+    scorer['n_columns'] = int(scorer['n_columns'])
+    return scorer
+
+
+def get_scorer(path):
+    """Registry entry for a scorer artifact (loaded once per process, hot-reloaded)"""
+    return get_artifact(path, loader=load_scorer, derive=lambda scorer: {
+        'scorer': scorer,
+        'features': scorer['features'],
+    })
+
+
+def _encode(scorer, X):
+    """
+    Imputed and scaled numeric block, plus the one-hot column of every categorical
+    value (-1 for values unseen in training, which the one-hot encoder ignores).
+    """
+    n_num = len(scorer['num_features'])
+    num = X[scorer['features'][:n_num]].to_numpy(dtype=np.float64, na_value=np.nan)
+    num = np.where(np.isnan(num), scorer['medians'], num)
+    num = ((num - scorer['mean']) / scorer['scale']).astype(np.float32)
+
+    hot = np.empty((len(X), len(scorer['cat_features'])), dtype=np.int32)
+    for f, col in enumerate(scorer['features'][n_num:]):
+        mapping = scorer['category_maps'][f]
+        missing = mapping.get(scorer['cat_fill'], -1)
+        codes = np.array([
+            mapping.get(v, -1) if isinstance(v, str) else (missing if pd.isna(v) else -1)
+            for v in X[col].tolist()
+        ], dtype=np.int32)
+        hot[:, f] = np.where(codes >= 0, codes + scorer['cat_offsets'][f], -1)
+    return num, hot
+
+
+def _leaves(scorer, block):
+    """Leaf reached in every tree by every row of a dense transformed block, shape (rows, trees)"""
+    column, threshold, children = scorer['node_column'], scorer['node_threshold'], scorer['node_children']
+    roots = scorer['roots']
+    rows = len(block)
+
+    # Column-major, so a node's column starts at column * rows
+    flat = np.ascontiguousarray(block.T).ravel()
+    column_start = column.astype(np.int64) * rows
+    row_ids = np.repeat(np.arange(rows, dtype=np.int64), len(roots))
+    nodes = np.tile(roots, rows)
+    pending = np.arange(len(nodes))
+    leaves = np.empty(len(nodes), dtype=np.int32)
+    step = 0
+    while len(nodes):
+        go_right = flat[row_ids + column_start[nodes]] > threshold[nodes]
+        nodes = children[2 * nodes + go_right]
+        step += 1
+        # Drop finished (row, tree) pairs every few levels; leaves loop on themselves meanwhile
+        if step % 4 == 0:
+            done = children[2 * nodes] == nodes
+            leaves[pending[done]] = nodes[done]
+            nodes, row_ids, pending = nodes[~done], row_ids[~done], pending[~done]
+    return leaves.reshape(rows, len(roots))
+
+
+def predict_proba(scorer, X):
+    """Class probabilities for a feature frame, same values as pipeline.predict_proba(X)"""
+    num, hot = _encode(scorer, X)
+    # Identical rows (e.g. repeated empty slots) get identical scores: traverse each once
+    keys = np.concatenate([num.view(np.int32), hot], axis=1)
+    _, first, inverse = np.unique(keys, axis=0, return_index=True, return_inverse=True)
+    num, hot = num[first], hot[first]
+
+    n_num = num.shape[1]
+    proba = np.empty((len(num), scorer['node_proba'].shape[1]))
+    for lo in range(0, len(num), BLOCK_ROWS):
+        hi = min(lo + BLOCK_ROWS, len(num))
+        block = np.zeros((hi - lo, scorer['n_columns']), dtype=np.float32)
+        block[:, :n_num] = num[lo:hi]
+        rows, cols = np.nonzero(hot[lo:hi] >= 0)
+        block[rows, hot[lo:hi][rows, cols]] = 1
+
+        # Sum over the trees in order, as the forest does (cumsum adds sequentially)
+        leaf_proba = scorer['node_proba'][_leaves(scorer, block)]
+        proba[lo:hi] = np.cumsum(leaf_proba, axis=1)[:, -1]
+    return proba[inverse.ravel()] / len(scorer['roots'])
+
+
+def predict(scorer, X, proba=None):
+    """Class labels, same as pipeline.predict(X): the most probable class, first on ties"""
+    proba = predict_proba(scorer, X) if proba is None else proba
+    return scorer['classes'][np.argmax(proba, axis=1)]
+
+
+def get_model(pipeline_path=DEFAULT_PIPELINE_PATH, regressor_path=None):
+    """
+    Scoring entry for a pipeline: its features, its lookup tables (None unless it
+    was trained with some; pass them to feature_matrix) and a score(X) ->
+    (probabilities of class 1, labels) callable. Small matrices go through the
+    compiled artifact when one exists for this exact pipeline file; everything
+    else through the pipeline, evaluated once for both outputs.
+
+    With a regressor_path, the error-rate regressor (see scoring.get_regressor)
+    is scored alongside: 'input_features' then lists the columns both models need.
+    """
+    pipeline_entry = get_pipeline(pipeline_path)
+    pipeline = pipeline_entry['pipeline']
+
+    scorer = None
+    scorer_path = scorer_path_for(pipeline_path)
+    if os.path.exists(scorer_path):
+        try:
+            scorer_entry = get_scorer(scorer_path)
+        except ValueError as e:
+            # Written in an older format
+            logger.warning("Ignoring compiled scorer %s (%s); run compile_scorer to rebuild it", scorer_path, e)
+        else:
+            if scorer_entry['scorer']['source_version'] == pipeline_entry['version']:
+                scorer = scorer_entry['scorer']
+            else:
+                logger.warning("Ignoring stale compiled scorer %s; run compile_scorer to rebuild it", scorer_path)
+
+    # Lookup tables the pipeline was trained with (see lookup_tables.py)
+    lookups = None
+    lookups_path = lookups_path_for(pipeline_path)
+    if os.path.exists(lookups_path):
+        lookups_entry = get_lookup_tables(lookups_path)
+        if lookups_entry['tables']['pipeline_version'] == pipeline_entry['version']:
+            lookups = lookups_entry['tables']
+        else:
+            logger.warning("Ignoring lookup tables %s written for another pipeline", lookups_path)
+
+    def score(X):
+        if scorer is not None and len(X) <= MAX_ROWS:
+            proba = predict_proba(scorer, X)
+            return proba[:, 1], predict(scorer, X, proba)
+        # Labels from the same probabilities, as predict() would recompute them
+        proba = pipeline.predict_proba(X)
+        return proba[:, 1], pipeline.classes_[np.argmax(proba, axis=1)]
+
+    features = list(pipeline_entry['features'])
+    regressor = get_regressor(regressor_path) if regressor_path else None
+    input_features = features
+    if regressor is not None:
+        input_features = features + [c for c in regressor['features'] if c not in features]
+
+    return {
+        'features': features,
+        'input_features': input_features,
+        'version': pipeline_entry['version'],
+        'compiled': scorer is not None,
+        'lookups': lookups,
+        'score': score,
+        'regressor': regressor,
+    }
+
+
+def check_equivalence(pipeline, scorer, X, atol=1e-9):
+    """Compare the compiled scorer with the pipeline on X: largest probability gap, label mismatches, timings"""
+    start = time.perf_counter()
+    expected = pipeline.predict_proba(X)
+    expected_labels = pipeline.predict(X)
+    pipeline_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    actual = predict_proba(scorer, X)
+    labels = predict(scorer, X, actual)
+    compiled_time = time.perf_counter() - start
+
+    max_diff = float(np.max(np.abs(expected - actual))) if len(X) else 0.0
+    mismatches = int(np.sum(expected_labels != labels))
+    return {
+        'rows': int(len(X)),
+        'max_abs_diff': max_diff,
+        'label_mismatches': mismatches,
+        'equivalent': max_diff <= atol and mismatches == 0,
+        'pipeline_time': pipeline_time,
+        'compiled_time': compiled_time,
+    }
@@ -0,0 +1,303 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from .artifact_cache import get_or_render
+
+# Columnar tables stored by predict_feeder_errors; every other export is rendered from them
+TABLE_NAMES = ['predictions', 'raw', 'shape_errors', 'part_errors', 'module_errors', 'package_errors']
+
+# Download names accepted by download_export_file -> key in output_files
+EXPORT_ALIASES = {
+    'csv': 'csv',
+    'excel': 'excel',
+    'xlsx': 'excel',
+    'json': 'json',
+    'parquet': 'parquet',
+    'predictions_csv': 'predictions_csv',
+    'predictions_excel': 'predictions_excel',
+}
+
+EXPORT_EXTENSIONS = {
+    'csv': 'csv',
+    'excel': 'xlsx',
+    'json': 'json',
+    'parquet': 'parquet',
+    'predictions_csv': 'csv',
+    'predictions_excel': 'xlsx',
+}
+
+
+def _arrow_safe(df):
+    """Parquet needs a single type per column: stringify object columns that mix types"""
+    out = df
+    for col in df.columns:
+        if df[col].dtype != object:
+            continue
+        kind = pd.api.types.infer_dtype(df[col], skipna=True)
+        if kind in ('mixed', 'mixed-integer'):
+            if out is df:
+                out = df.copy()
+            out[col] = df[col].where(df[col].isna(), df[col].astype(str))
+    return out
+
+
+def begin_tables(output_root):
+    """Start a result: tables are written to a staging folder until commit_tables"""
+    os.makedirs(output_root, exist_ok=True)
+    staging_dir = tempfile.mkdtemp(prefix='.staging-', dir=output_root)
+    os.makedirs(os.path.join(staging_dir, 'tables'))
+    return {'output_root': output_root, 'staging_dir': staging_dir, 'tables': {}}
+
+
+def write_table(store, name, table):
+    """Write a whole table as tables/<name>.parquet"""
+    if table is None:
+        return None
+    path = os.path.join(store['staging_dir'], 'tables', f'{name}.parquet')
+    _arrow_safe(table).to_parquet(path, index=False)
+    store['tables'][name] = f'{name}.parquet'
+    return path
+
+
+def append_table(store, name, chunk):
+    """Add one chunk of a table as tables/<name>/part-NNNNN.parquet, in order"""
+    table_dir = os.path.join(store['staging_dir'], 'tables', name)
+    os.makedirs(table_dir, exist_ok=True)
+    parts = store.setdefault('parts', {})
+    index = parts.get(name, 0)
+    path = os.path.join(table_dir, f'part-{index:05d}.parquet')
+    _arrow_safe(chunk).to_parquet(path, index=False)
+    parts[name] = index + 1
+    store['tables'][name] = name
+    return path
+
+
+def table_parts(path):
+    """Part files of a chunked table, in write order ([path] for a single file)"""
+    if not os.path.isdir(path):
+        return [path]
+    return [os.path.join(path, f) for f in sorted(os.listdir(path)) if f.endswith('.parquet')]
+
+
+def drop_table(store, name):
+    """Remove a staged table that is not part of the result"""
+    shutil.rmtree(os.path.join(store['staging_dir'], 'tables', name), ignore_errors=True)
+    store['tables'].pop(name, None)
+    store.get('parts', {}).pop(name, None)
+
+
+def discard_tables(store):
+    shutil.rmtree(store['staging_dir'], ignore_errors=True)
+
+
+def commit_tables(store, file_prefix):
+    """
+    Hash the staged tables and move them to the content-addressed folder
+    <output_root>/<file_prefix>_<hash>/tables/.
+
+    Identical results share one folder; the hash also keys the export cache.
+    """
+    staging_tables = os.path.join(store['staging_dir'], 'tables')
+    digest = hashlib.sha256()
+    for name, rel in store['tables'].items():
+        path = os.path.join(staging_tables, rel)
+        chunked = os.path.isdir(path)
+        for part in table_parts(path):
+            digest.update((f'{name}/{os.path.basename(part)}' if chunked else name).encode())
+            with open(part, 'rb') as f:
+                for block in iter(lambda: f.read(1 << 20), b''):
+                    digest.update(block)
+    result_hash = digest.hexdigest()
+
+    folder = os.path.join(store['output_root'], f'{file_prefix}_{result_hash[:16]}')
+    try:
+        os.rename(store['staging_dir'], folder)
+    except OSError:
+        # Same content already stored (possibly by another worker)
+        discard_tables(store)
+    folder = os.path.abspath(folder)
+
+    return {
+        'folder': folder,
+        'result_hash': result_hash,
+        'tables': {name: os.path.join(folder, 'tables', rel) for name, rel in store['tables'].items()},
+    }
+
+
+def store_tables(output_root, file_prefix, tables):
+    """
+    Write each DataFrame to Parquet in a content-addressed folder
+    <output_root>/<file_prefix>_<hash>/tables/<name>.parquet.
+    """
+    store = begin_tables(output_root)
+    try:
+        for name, table in tables.items():
+            write_table(store, name, table)
+    except Exception:
+        discard_tables(store)
+        raise
+    return commit_tables(store, file_prefix)
+
+
+def read_table(output_files, name):
+    """Load one of the columnar tables of a result, or None if it was not produced"""
+    path = output_files.get('tables', {}).get(name)
+    if not path or not os.path.exists(path):
+        return None
+    if os.path.isdir(path):
+        # Chunked table: parts may infer different dtypes, let concat reconcile them
+        return pd.concat([pd.read_parquet(p) for p in table_parts(path)], ignore_index=True)
+    return pd.read_parquet(path)
+
+
+def build_overview(json_output):
+    """Overview table of the summary exports, rebuilt from the stored JSON output"""
+    metrics = json_output['model_performance']
+    return pd.DataFrame({
+        'Metric': [
+            'Total Parts', 'Unique Part Numbers', 'Unique Feeder IDs', 'Most Used Feeder',
+            'Total Errors', 'Error Rate (%)', 'Accuracy', 'Precision', 'Recall', 'F1 Score'
+        ],
+        'Value': [
+            json_output['total_parts'], json_output['unique_part_numbers'],
+            json_output['unique_feeder_ids'], json_output['most_used_feeder_id'],
+            metrics['total_errors'], metrics['error_rate'] * 100,
+            metrics['accuracy'] * 100, metrics['precision'] * 100,
+            metrics['recall'] * 100, metrics['f1_score'] * 100
+        ]
+    })
+
+
+def _write_summary_csv(path, json_output, tables):
+    """Single CSV with all tables separated by multiple rows"""
+    with open(path, 'w', newline='') as f:
+        # Overview table
+        f.write('OVERVIEW\n')
+        build_overview(json_output).to_csv(f, index=False)
+        f.write('\n\n')
+
+        # Shape errors table
+        if tables['shape_errors'] is not None:
+            f.write('SHAPE ERRORS\n')
+            tables['shape_errors'].to_csv(f, index=False)
+            f.write('\n\n')
+
+        # Part errors table
+        f.write('PART NUMBER ERRORS\n')
+        tables['part_errors'].to_csv(f, index=False)
+        f.write('\n\n')
+
+        # Package errors table
+        if tables['package_errors'] is not None:
+            f.write('PACKAGE ERRORS\n')
+            tables['package_errors'].to_csv(f, index=False)
+            f.write('\n\n')
+
+        # Module errors table
+        f.write('MODULE ERRORS\n')
+        tables['module_errors'].to_csv(f, index=False)
+
+
+def _write_summary_excel(path, json_output, tables):
+    """Excel workbook with one sheet per table"""
+    df_overview = build_overview(json_output)
+    df_shape_errors = tables['shape_errors']
+    df_package_errors = tables['package_errors']
+
+    with pd.ExcelWriter(path) as writer:
+        # Add overview sheet
+        df_overview.to_excel(writer, sheet_name='Overview', index=False)
+
+        # Add raw data sheet
+        tables['raw'].to_excel(writer, sheet_name='Raw Data', index=False)
+
+        # Add predictions with original data sheet
+        tables['predictions'].to_excel(writer, sheet_name='Predictions', index=False)
+
+        # For shape and part number, create separate dataframes with headers
+        shape_part_combined = pd.DataFrame()
+
+        # Add shape errors if available
+        if df_shape_errors is not None:
+            # Add a title row for shape errors
+            shape_title_df = pd.DataFrame({'Shape Errors': ['']})
+            shape_part_combined = pd.concat([shape_title_df, df_shape_errors], axis=0)
+
+            # Add empty rows as separator
+            empty_rows = pd.DataFrame({'': ['', '']})
+            shape_part_combined = pd.concat([shape_part_combined, empty_rows], axis=0)
+
+        # Add part errors with title
+        part_title_df = pd.DataFrame({'Part Number Errors': ['']})
+        shape_part_combined = pd.concat([shape_part_combined, part_title_df, tables['part_errors']], axis=0)
+
+        # Write to the Excel file
+        shape_part_combined.to_excel(writer, sheet_name='Shape and Part Number', index=False)
+
+        # Add module errors sheet
+        tables['module_errors'].to_excel(writer, sheet_name='Module Errors', index=False)
+
+        # Add package errors sheet (if exists)
+        if df_package_errors is not None:
+            df_package_errors.to_excel(writer, sheet_name='Package Errors', index=False)
+
+
+def json_serializer(obj):
+    """json.dump fallback for numpy values left in the model output"""
+    try:
+        return float(obj) if isinstance(obj, (np.float32, np.float64)) else str(obj)
+    except:
+        return str(obj)
+
+
+def _render(export_key, json_output, path):
+    output_files = json_output['output_files']
+
+    if export_key == 'json':
+        with open(path, 'w') as f:
+            json.dump(json_output, f, indent=2, default=json_serializer)
+    elif export_key == 'parquet':
+        # Single-file copy of a chunked predictions table
+        _arrow_safe(read_table(output_files, 'predictions')).to_parquet(path, index=False)
+    elif export_key in ('predictions_csv', 'predictions_excel'):
+        predictions = read_table(output_files, 'predictions')
+        if export_key == 'predictions_csv':
+            predictions.to_csv(path, index=False)
+        else:
+            predictions.to_excel(path, index=False)
+    else:
+        tables = {name: read_table(output_files, name) for name in TABLE_NAMES}
+        if export_key == 'csv':
+            _write_summary_csv(path, json_output, tables)
+        else:
+            _write_summary_excel(path, json_output, tables)
+
+
+def render_export(export_key, json_output, cache_dir, max_bytes=None):
+    """
+    Return the path of an export for a stored result. Only the Parquet tables are
+    written when a job runs; CSV/Excel/JSON are rendered here on first download
+    and kept in the export cache under the result hash, so identical results
+    share one rendered file and the cache stays within max_bytes.
+    """
+    output_files = json_output['output_files']
+    path = output_files.get(export_key)
+    if 'tables' not in output_files or (path and not os.path.isdir(path)):
+        # Parquet table, or an older result whose files were all written eagerly
+        return output_files[export_key]
+    if export_key not in EXPORT_EXTENSIONS:
+        raise KeyError(export_key)
+
+    return get_or_render(
+        cache_dir,
+        json_output['result_hash'],
+        f'{export_key}.{EXPORT_EXTENSIONS[export_key]}',
+        lambda path: _render(export_key, json_output, path),
+        max_bytes=max_bytes,
+    )
@@ -0,0 +1,155 @@
+import hashlib
+import os
+import time
+from datetime import timedelta
+
+from django.utils import timezone
+
+from ..models.file import File
+from ..models.upload import UploadSession
+from .model_registry import _file_hash
+from .ingestion import SETUP_CACHE_SUFFIX
+from .setup_cache import cache_path_for
+
+# Uploaded files are stored once per content, under their sha256
+OBJECTS_DIR = 'objects'
+
+# Block size chunk bodies are copied in
+CHUNK_BLOCK_BYTES = 1024 * 1024
+
+
+def content_path(upload_dir, content_hash, extension=''):
+    """Where the file with this content lives: objects/<first 2 hex digits>/<hash>.<ext>"""
+    name = f'{content_hash}.{extension}' if extension else content_hash
+    return os.path.join(upload_dir, OBJECTS_DIR, content_hash[:2], name)
+
+
+def store_upload(chunks, upload_dir, extension=''):
+    """
+    Write an upload (an iterable of byte chunks, e.g. UploadedFile.chunks()) to
+    the content-addressed store, hashing it while it is written.
+
+    The bytes go to a partial file first and are renamed to their content path;
+    when that path already exists the same content was uploaded before and the
+    copy is dropped. Returns {'path', 'content_hash', 'size', 'existing'}.
+    """
+    os.makedirs(os.path.join(upload_dir, OBJECTS_DIR), exist_ok=True)
+    partial_path = os.path.join(upload_dir, OBJECTS_DIR, f'upload.{os.getpid()}.{id(chunks)}.partial')
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(partial_path, 'wb') as destination:
+            for chunk in chunks:
+                digest.update(chunk)
+                destination.write(chunk)
+                size += len(chunk)
+
+        content_hash = digest.hexdigest()
+        stored = _commit(partial_path, upload_dir, content_hash, extension)
+    except Exception:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        raise
+    return dict(stored, size=size)
+
+
+def _commit(partial_path, upload_dir, content_hash, extension):
+    """Move a fully written upload to its content path, or drop it when that content is stored already"""
+    path = content_path(upload_dir, content_hash, extension)
+    existing = os.path.exists(path)
+    if existing:
+        os.remove(partial_path)
+        # Just referenced again: sweep_uploads leaves recently touched objects alone
+        os.utime(path)
+    else:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(partial_path, path)
+    return {'path': path, 'content_hash': content_hash, 'existing': existing}
+
+
+def session_path(upload_dir, session_id):
+    """Where the chunks of an upload session are written, next to the stored objects (same filesystem)"""
+    return os.path.join(upload_dir, OBJECTS_DIR, f'session.{session_id}.partial')
+
+
+def received_bytes(partial_path):
+    """Bytes of a chunked upload on disk: where the next chunk starts, even after a dropped request"""
+    try:
+        return os.path.getsize(partial_path)
+    except OSError:
+        return 0
+
+
+def write_chunk(partial_path, offset, stream, limit):
+    """
+    Write the body of a chunk request (a stream read in blocks, never held
+    whole) at offset in the partial file of an upload session. Bytes a dropped
+    request left after offset are overwritten; at most limit bytes are written.
+    Returns the size of the partial file afterwards.
+    """
+    os.makedirs(os.path.dirname(partial_path), exist_ok=True)
+    with open(partial_path, 'r+b' if os.path.exists(partial_path) else 'wb') as destination:
+        destination.seek(offset)
+        destination.truncate()
+        while limit > 0:
+            block = stream.read(min(CHUNK_BLOCK_BYTES, limit))
+            if not block:
+                break
+            destination.write(block)
+            limit -= len(block)
+        return destination.tell()
+
+
+def commit_chunked_upload(partial_path, upload_dir, checksum, extension=''):
+    """
+    Check a fully received chunked upload against its expected sha256 and store
+    it as store_upload does (a rename: the chunks are already on the store's
+    filesystem). Returns store_upload's dict, or None when the checksum does
+    not match; the partial file is then removed.
+    """
+    content_hash = _file_hash(partial_path)
+    if content_hash != checksum.lower():
+        os.remove(partial_path)
+        return None
+    size = os.path.getsize(partial_path)
+    return dict(_commit(partial_path, upload_dir, content_hash, extension), size=size)
+
+
+def expire_upload_sessions(max_age):
+    """
+    Drop the partial files of upload sessions left open for more than max_age
+    seconds, or left finalizing that long by a request that died.
+    """
+    cutoff = timezone.now() - timedelta(seconds=max_age)
+    expired = UploadSession.objects.filter(status__in=['open', 'finalizing'], updated_at__lt=cutoff)
+    for session in expired:
+        if os.path.exists(session.partial_path):
+            os.remove(session.partial_path)
+    return expired.update(status='expired')
+
+
+def sweep_uploads(upload_dir, grace):
+    """
+    Delete stored uploads (and their setup caches) that no File row points to
+    and that nothing stored or referenced for `grace` seconds. Deleting a file
+    leaves its bytes to this sweep: removing them inline could race with an
+    upload of the same content that found them stored but has no File row yet.
+    """
+    objects_dir = os.path.join(upload_dir, OBJECTS_DIR)
+    cutoff = time.time() - grace
+    removed = []
+    for prefix in sorted(os.listdir(objects_dir)) if os.path.isdir(objects_dir) else []:
+        prefix_dir = os.path.join(objects_dir, prefix)
+        if not os.path.isdir(prefix_dir):
+            continue  # partial files of uploads in progress
+        for name in sorted(os.listdir(prefix_dir)):
+            path = os.path.join(prefix_dir, name)
+            # Setup caches go with their upload; partial files are caches being written
+            if name.endswith(SETUP_CACHE_SUFFIX) or name.endswith('.partial'):
+                continue
+            if os.path.getmtime(path) < cutoff and not File.objects.filter(storage_path=path).exists():
+                for stale in [path, cache_path_for(path)]:
+                    if os.path.exists(stale):
+                        os.remove(stale)
+                removed.append(path)
+    return removed
@@ -0,0 +1,95 @@
+import os
+import threading
+
+import pandas as pd
+
+from .model_registry import get_artifact
+
+script_dir = os.path.dirname(os.path.abspath(__file__))  # Folder where script lives
+DEFAULT_HISTORY_PATH = os.path.join(script_dir, 'PartUsage.csv')
+
+HISTORY_KEYS = ['Position', 'PartNumber']
+
+_lookup_lock = threading.Lock()
+
+
+def read_history_csv(path):
+    """
+    Parse a PartUsage CSV with its keys as text, as the setups they are joined to
+    are read: a key column inferred as numbers would match no setup row.
+    """
+    return pd.read_csv(path, dtype={key: str for key in HISTORY_KEYS})
+
+
+def _load_history(path):
+    """Parse PartUsage once into a frame indexed by (Position, PartNumber)"""
+    hist = read_history_csv(path)
+    frame = hist.set_index(HISTORY_KEYS)
+    return {
+        'frame': frame,
+        'unique': bool(frame.index.is_unique),
+        'columns': list(frame.columns),
+        'rows': int(len(frame)),
+    }
+
+
+def get_history(path=DEFAULT_HISTORY_PATH):
+    """Return the cached history entry, re-parsing only when the CSV changes on disk"""
+    entry = get_artifact(path, loader=_load_history)
+    return entry['object']
+
+
+def get_history_version(path=DEFAULT_HISTORY_PATH):
+    """Content hash of the history file currently loaded"""
+    return get_artifact(path, loader=_load_history)['version']
+
+
+def join_history(fs, part_number_col, path=DEFAULT_HISTORY_PATH):
+    """
+    Left-join historical usage onto a feeder setup by (Position, PartNumber).
+
+    Equivalent to pd.merge(fs, hist, on=['Position', part_number_col], how='left')
+    but served as a probe of the preloaded index, so the cost depends on the size
+    of the setup rather than on the size of the history file.
+    """
+    history = get_history(path)
+    frame = history['frame']
+
+    if not history['unique']:
+        # Duplicated keys fan out rows, let pandas handle the many-to-one join
+        hist = frame.reset_index().rename(columns={'PartNumber': part_number_col})
+        return pd.merge(fs, hist, on=['Position', part_number_col], how='left')
+
+    keys = pd.MultiIndex.from_arrays([fs['Position'], fs[part_number_col]])
+    matched = frame.reindex(keys)
+    matched.index = fs.index
+
+    # Mirror merge's suffixing of overlapping non-key columns
+    overlap = [c for c in matched.columns if c in fs.columns]
+    if overlap:
+        fs = fs.rename(columns={c: f'{c}_x' for c in overlap})
+        matched = matched.rename(columns={c: f'{c}_y' for c in overlap})
+
+    return pd.concat([fs, matched], axis=1).reset_index(drop=True)
+
+
+def lookup_history(keys, path=DEFAULT_HISTORY_PATH):
+    """
+    History columns of a few (Position, PartNumber) keys, as one dict per key
+    (None when the key has no history). Backed by a plain dict built once per
+    loaded history, so a lookup costs no pandas indexing; with duplicated keys
+    the first history row is used.
+    """
+    history = get_history(path)
+    rows = history.get('rows_by_key')
+    if rows is None:
+        with _lookup_lock:
+            rows = history.get('rows_by_key')
+            if rows is None:
+                frame = history['frame']
+                records = frame.to_dict('records')
+                rows = {}
+                for key, record in zip(frame.index, records):
+                    rows.setdefault(key, record)
+                history['rows_by_key'] = rows
+    return [rows.get(key) for key in keys]
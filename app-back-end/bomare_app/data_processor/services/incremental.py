@@ -0,0 +1,194 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from .aggregations import (
+    compute_partials, confusion_counts, merge_partials, partials_from_frame, subtract_partials,
+)
+from .backend_file1 import (
+    add_regression, finish_predictions, incremental_state, prepare_setup, score_prepared, script_dir,
+    write_predictions,
+)
+from .compiled_scorer import get_model
+from .exports import _arrow_safe, read_table
+from .ingestion import ingestion_summary, read_feeder_setup, setup_identity
+from .prediction_cache import SCORED, cache_stats, feature_hashes
+from .positions import position_modules
+from .scoring import ERROR_RATE_COLUMN, HIGH_ERROR_RATE_COLUMN
+from .streaming import metrics_from_counts
+
+# Columns written by the prediction step, not part of what identifies a row
+PREDICTION_COLUMNS = ['ErrorProbability', 'PredictedError', 'Module', ERROR_RATE_COLUMN, HIGH_ERROR_RATE_COLUMN]
+
+
+def _row_keys(df, columns):
+    """
+    (row hash, occurrence) of every row: identical rows are told apart by their
+    rank, so a setup is compared with its previous version as a multiset of rows.
+    """
+    hashes = feature_hashes(_arrow_safe(df[columns]))
+    occurrences = pd.Series(hashes).groupby(hashes).cumcount().to_numpy()
+    return pd.MultiIndex.from_arrays([hashes, occurrences])
+
+
+def _previous_run(previous, model_version, regressor_version, columns):
+    """Raw table and partials of the previous result, or the reason they cannot be reused"""
+    if previous is None:
+        return None, 'no previous result for this setup'
+    state = previous['prediction_data'].get('incremental_state')
+    if not state:
+        return None, 'previous result predates diff mode'
+    if state.get('model_version') != model_version:
+        return None, 'model changed since the previous result'
+    if state.get('regressor_version') != regressor_version:
+        return None, 'error-rate regressor changed since the previous result'
+    if state.get('fallback_threshold') is not None:
+        return None, 'previous result used the 95th-percentile fallback'
+
+    output_files = previous['prediction_data'].get('output_files', {})
+    prev_raw = read_table(output_files, 'raw')
+    prev_partials = read_table(output_files, 'partials')
+    if prev_raw is None or prev_partials is None:
+        return None, 'tables of the previous result are missing'
+    if set(prev_raw.columns) - set(PREDICTION_COLUMNS) != set(columns):
+        return None, 'columns differ from the previous result'
+    return {
+        'raw': prev_raw,
+        'partials': partials_from_frame(prev_partials),
+        'counts': state['confusion_counts'],
+    }, None
+
+
+def predict_feeder_errors_diff(
+    feeder_setup_path,
+    find_previous,
+    historical_merged_path=os.path.join(script_dir, 'PartUsage.csv'),
+    pipeline_path=os.path.join(script_dir, 'bomare_best_pipeline.pkl'),
+    file_prefix='predictions_output',
+    output_root='.',
+    prediction_cache_path=None,
+    regressor_path=None
+):
+    """
+    predict_feeder_errors for a revision of a setup that was already processed.
+
+    find_previous(identity) gets the setup's {'line_name', 'setup_name'} and
+    returns the last result of that setup as {'result_id', 'prediction_data'}, or
+    None. The new rows are compared with the previous raw table: rows found there
+    unchanged (same values, history included) keep their prediction, only the
+    added ones are scored, and the summary counters and confusion counts of the
+    previous result are patched by removing the dropped rows and adding the new
+    ones instead of being recomputed over the whole setup.
+
+    Counts, metrics and tables match a full run; values tied on counts may be
+    listed in another order, since patched first positions follow the previous
+    setup. Falls back to a full run, reported in 'incremental', when the previous
+    result cannot be reused (none found, other model or error-rate regressor,
+    fallback threshold, other columns) or when the patched setup flags nothing and
+    needs the fallback.
+    """
+    parsed = read_feeder_setup(feeder_setup_path)
+    model = get_model(pipeline_path, regressor_path)
+    regressor_version = model['regressor']['version'] if model['regressor'] else None
+    prepared = prepare_setup(parsed['frame'], model['input_features'], historical_merged_path,
+                             parsed.get('positions'))
+    df = prepared['df']
+    part_number_col = prepared['part_number_col']
+    identity = setup_identity(prepared['fs_original'])
+
+    columns = list(df.columns)
+    previous = find_previous(identity) if identity['line_name'] else None
+    prev, reason = _previous_run(previous, model['version'], regressor_version, columns)
+    if prev is None:
+        cached = score_prepared(model, [df], prediction_cache_path)
+        return finish_predictions(
+            prepared, cached['probabilities'], cached['labels'],
+            file_prefix=file_prefix, output_root=output_root,
+            ingestion=ingestion_summary(parsed),
+            prediction_cache=cache_stats(cached['sources']),
+            model_version=model['version'],
+            incremental={'applied': False, 'reason': reason if identity['line_name'] else 'setup has no LineName'},
+            regression=cached['regression'],
+        )
+    prev_raw = prev['raw']
+
+    # Match every new row with an identical previous one
+    new_keys = _row_keys(df, columns)
+    prev_keys = _row_keys(prev_raw, columns)
+    matches = prev_keys.get_indexer(new_keys)
+    kept = matches >= 0
+    added = np.flatnonzero(~kept)
+    removed = np.setdiff1d(np.arange(len(prev_raw)), matches[kept])
+
+    probabilities = np.zeros(len(df))
+    labels = np.zeros(len(df), dtype=np.int64)
+    probabilities[kept] = prev_raw['ErrorProbability'].to_numpy()[matches[kept]]
+    labels[kept] = prev_raw['PredictedError'].to_numpy()[matches[kept]]
+    cached = score_prepared(model, [df.iloc[added]], prediction_cache_path)
+    probabilities[added] = cached['probabilities']
+    labels[added] = cached['labels']
+    regression = cached['regression']
+    if regression is not None:
+        # Error rates of unchanged rows are kept too
+        error_rates = np.zeros(len(df))
+        high_error_rate = np.zeros(len(df), dtype=np.int64)
+        error_rates[kept] = prev_raw[ERROR_RATE_COLUMN].to_numpy()[matches[kept]]
+        high_error_rate[kept] = prev_raw[HIGH_ERROR_RATE_COLUMN].to_numpy()[matches[kept]]
+        error_rates[added] = regression['error_rates']
+        high_error_rate[added] = regression['high_error_rate']
+        regression = dict(regression, error_rates=error_rates, high_error_rate=high_error_rate)
+
+    changed_positions = set(prev_raw['Position'].iloc[removed].dropna()) & set(df['Position'].iloc[added].dropna())
+    incremental = {
+        'applied': True,
+        'previous_result_id': previous['result_id'],
+        'added': int(len(added)),
+        'removed': int(len(removed)),
+        'changed': len(changed_positions),
+        'unchanged': int(kept.sum()),
+        'scored': int(np.sum(cached['sources'] == SCORED)),
+    }
+
+    df['ErrorProbability'] = probabilities
+    df['PredictedError'] = labels
+    error_rate_model = add_regression(df, regression)
+    df['Module'] = position_modules(df['Position'])
+    removed_rows = prev_raw.iloc[removed]
+    added_rows = df.iloc[added]
+
+    counts = {
+        key: prev['counts'][key] - confusion_counts(removed_rows)[key] + confusion_counts(added_rows)[key]
+        for key in ['tp', 'fp', 'fn', 'tn']
+    }
+    if counts['tp'] + counts['fp'] == 0:
+        # Nothing flagged: the 95th-percentile fallback needs the whole setup
+        incremental['fallback'] = True
+        return finish_predictions(
+            prepared, probabilities, labels,
+            file_prefix=file_prefix, output_root=output_root,
+            ingestion=ingestion_summary(parsed),
+            prediction_cache=cache_stats(cached['sources']),
+            model_version=model['version'],
+            incremental=incremental,
+            regression=regression,
+        )
+
+    shape_col = next((c for c in ['PartShapeName', 'Shape'] if c in df.columns), None)
+    pkg_col = 'PackageName' if 'PackageName' in df.columns else None
+    # Added rows come after every previous row, in their order in the new setup
+    partials = merge_partials(
+        subtract_partials(prev['partials'], compute_partials(removed_rows, part_number_col, shape_col, pkg_col)),
+        compute_partials(added_rows.reset_index(drop=True), part_number_col, shape_col, pkg_col,
+                         offset=len(prev_raw)),
+    )
+
+    return write_predictions(
+        prepared, metrics_from_counts(counts), partials,
+        incremental_state(identity, model['version'], counts, None, regressor_version),
+        file_prefix=file_prefix, output_root=output_root,
+        ingestion=ingestion_summary(parsed),
+        prediction_cache=cache_stats(cached['sources']),
+        incremental=incremental,
+        error_rate_model=error_rate_model,
+    )
@@ -0,0 +1,606 @@
+import contextlib
+import csv
+import gzip
+import io
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+import zipfile
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from openpyxl import load_workbook
+
+logger = logging.getLogger(__name__)
+
+# Feeder setup exports: job lines, the column header, the slot rows, then a
+# TotalSlots/PlacedParts footer. These are the defaults when detection fails.
+HEADER_LINES = 2
+FOOTER_LINES = 2
+FOOTER_MARKER = 'totalslots'
+DELIMITERS = [';', ',', '\t']
+
+# How much of each end of the file is scanned for the header and the footer
+HEAD_SCAN_BYTES = 64 * 1024
+TAIL_SCAN_BYTES = 64 * 1024
+
+# Columns that are always text, even when every value looks numeric or is empty
+# (e.g. part numbers with leading zeros); other columns keep pandas' inference
+TEXT_COLUMNS = [
+    'LineName', 'ModelName', 'SetupName', 'AVLNAME', 'AVL', 'PartNumber', 'FeederName',
+    'Status', 'Location', 'PartNumberImage', 'PartShapeName', 'PackageName',
+    'PartComment', 'PMABAR', 'ChuteType', 'FeederType', 'TapeWidth',
+]
+FLOAT_COLUMNS = ['FeedPitch', 'PTPMNH', 'PMADC']
+
+# Workbook exports of the same layout, read row by row from their first sheet.
+# Legacy .xls (BIFF) workbooks have no reader here
+EXCEL_EXTENSIONS = ('.xlsx', '.xlsm')
+LEGACY_EXCEL_EXTENSIONS = ('.xls',)
+HEADER_SCAN_ROWS = 50
+
+# Compressed setups (gzip, or a zip archive holding one setup) are decompressed
+# while they are parsed, never to disk
+COMPRESSED_EXTENSIONS = {'.gz': 'gzip', '.zip': 'zip'}
+STREAM_BLOCK_BYTES = 1024 * 1024
+
+# Columnar cache of a parsed setup (see setup_cache.py): the typed frame as Parquet,
+# its normalized Position in an extra column and the parse layout in the metadata
+SETUP_CACHE_SUFFIX = '.setup.parquet'
+SETUP_CACHE_FORMAT = 1
+POSITION_COLUMN = '__position__'
+_CACHE_METADATA_KEY = b'bomare_setup'
+
+
+class _Window(io.RawIOBase):
+    """Read-only view of bytes [start, end) of a file, so the parser never sees the footer"""
+
+    def __init__(self, f, start, end):
+        self._f = f
+        self._f.seek(start)
+        self._remaining = end - start
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        size = min(len(buffer), self._remaining)
+        if size <= 0:
+            return 0
+        data = self._f.read(size)
+        buffer[:len(data)] = data
+        self._remaining -= len(data)
+        return len(data)
+
+
+class _StreamWindow(io.RawIOBase):
+    """
+    The bytes of a decompressed setup between its header and its footer, as
+    _Window gives them for a file on disk. A stream cannot seek to its end, so
+    the last TAIL_SCAN_BYTES read are held back until the stream ends, and the
+    footer is then found in them as detect_layout finds it.
+    """
+
+    def __init__(self, stream, head, layout):
+        self._stream = stream
+        self._head = head
+        self._layout = layout
+        self._held = bytearray(head[layout['header_offset']:])
+        self._base = layout['header_offset']  # stream offset of self._held[0]
+        self._pending = memoryview(b'')
+        self._done = False
+
+    def readable(self):
+        return True
+
+    def _fill(self):
+        block = self._stream.read(STREAM_BLOCK_BYTES)
+        if block:
+            self._held += block
+            cut = len(self._held) - TAIL_SCAN_BYTES
+            if cut > 0:
+                self._pending = memoryview(bytes(self._held[:cut]))
+                del self._held[:cut]
+                self._base += cut
+            return
+        # End of the stream: the tail is what is held, completed from the head for short setups
+        self._done = True
+        size = self._base + len(self._held)
+        tail_start = max(size - TAIL_SCAN_BYTES, 0)
+        tail = self._head[tail_start:self._base] + bytes(self._held[max(tail_start - self._base, 0):])
+        data_end = _data_end(tail, tail_start, size, self._layout)
+        self._pending = memoryview(bytes(self._held[:data_end - self._base]))
+        self._held = bytearray()
+
+    def readinto(self, buffer):
+        while not self._pending and not self._done:
+            self._fill()
+        size = min(len(buffer), len(self._pending))
+        buffer[:size] = self._pending[:size]
+        self._pending = self._pending[size:]
+        return size
+
+
+class _RowText(io.RawIOBase):
+    """
+    Rows of cell values as CSV text, produced as the parser reads it, so a
+    workbook goes through the same C parser (and type inference) as a CSV file
+    without being written out or held in memory whole.
+    """
+
+    def __init__(self, rows):
+        self._rows = rows
+        self._text = io.StringIO()
+        self._writer = csv.writer(self._text, lineterminator='\n')
+        self._pending = memoryview(b'')
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if not self._pending:
+            self._text.seek(0)
+            self._text.truncate()
+            for row in self._rows:
+                self._writer.writerow(row)
+                if self._text.tell() >= len(buffer):
+                    break
+            self._pending = memoryview(self._text.getvalue().encode('utf-8'))
+        size = min(len(buffer), len(self._pending))
+        buffer[:size] = self._pending[:size]
+        self._pending = self._pending[size:]
+        return size
+
+
+def _cell_text(value):
+    if value is None:
+        return ''
+    if isinstance(value, float):
+        return repr(value)  # shortest text that parses back to the same float
+    return str(value)
+
+
+def _is_blank(row):
+    return all(value is None or value == '' for value in row)
+
+
+def _header_index(rows):
+    """Index of the column header among the first rows, as detect_layout finds it in a CSV"""
+    for i, row in enumerate(rows):
+        lowered = ' '.join(_cell_text(value) for value in row).lower()
+        if 'modulenumber' in lowered and 'location' in lowered:
+            return i
+    return HEADER_LINES
+
+
+def _check_workbook(path):
+    if str(path).lower().endswith(LEGACY_EXCEL_EXTENSIONS):
+        raise ValueError(f'{os.path.basename(path)}: legacy .xls workbooks are not supported, '
+                         f'save the setup as .xlsx or .csv')
+
+
+def _workbook_rows(path):
+    """
+    Header and slot rows of the first sheet of a workbook, read with openpyxl's
+    read-only (row streaming) mode: the header found as in detect_layout, blank
+    rows skipped, and the TotalSlots footer (else the last FOOTER_LINES rows)
+    left out. The first row yielded is the header.
+    """
+    _check_workbook(path)
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        head = [row for _, row in zip(range(HEADER_SCAN_ROWS), rows)]
+        header_index = _header_index(head)
+        if header_index >= len(head):
+            return
+        header = list(head[header_index])
+        while header and header[-1] is None:
+            header.pop()
+        width = len(header)
+        yield [_cell_text(value) for value in header]
+
+        # The last FOOTER_LINES rows are held back until a later row shows they are not the footer
+        held = []
+        footer = False
+        for row in itertools.chain(head[header_index + 1:], rows):
+            if _is_blank(row):
+                continue
+            if _cell_text(row[0]).strip().lower() == FOOTER_MARKER:
+                footer = True
+                break
+            # Trailing empty cells past the header are not fields
+            if len(row) > width and _is_blank(row[width:]):
+                row = row[:width]
+            held.append(row)  # the CSV writer formats cells as _cell_text does
+            if len(held) > FOOTER_LINES:
+                yield held.pop(0)
+        # Without a TotalSlots line the last FOOTER_LINES rows are the footer, as for a CSV
+        yield from (held if footer else held[:-FOOTER_LINES])
+    finally:
+        workbook.close()
+
+
+def _line_starts(data, base):
+    """Byte offsets (relative to the file) of every line start in data"""
+    starts = [base]
+    i = data.find(b'\n')
+    while i != -1:
+        starts.append(base + i + 1)
+        i = data.find(b'\n', i + 1)
+    return starts
+
+
+def _header_layout(head):
+    """Header offset, delimiter and columns from the first bytes of a setup"""
+    # Header: first line naming the module and location columns
+    head_lines = head.split(b'\n')
+    header_index = HEADER_LINES
+    for i, line in enumerate(head_lines[:50]):
+        lowered = line.lower()
+        if b'modulenumber' in lowered and b'location' in lowered:
+            header_index = i
+            break
+    header_offset = sum(len(line) + 1 for line in head_lines[:header_index])
+    header = head_lines[header_index].decode('utf-8', errors='replace') if header_index < len(head_lines) else ''
+    delimiter = max(DELIMITERS, key=header.count)
+    return {
+        'header_offset': header_offset,
+        'delimiter': delimiter,
+        'columns': header.strip().split(delimiter),
+    }
+
+
+def _data_end(tail, tail_start, size, layout):
+    """Where the footer starts, from the last bytes of a setup (its size when it has none)"""
+    # Footer: from the TotalSlots line to the end, else the last FOOTER_LINES non-empty lines
+    starts = _line_starts(tail, tail_start)
+    if tail_start > 0:
+        starts = starts[1:]  # the first tail line is cut in the middle
+    lines = [(start, tail[start - tail_start:].split(b'\n', 1)[0].strip()) for start in starts]
+    lines = [(start, line) for start, line in lines if line]
+
+    data_end = size
+    for start, line in reversed(lines):
+        if line.split(layout['delimiter'].encode(), 1)[0].strip().lower() == FOOTER_MARKER.encode():
+            data_end = start
+            break
+    else:
+        if len(lines) >= FOOTER_LINES:
+            data_end = lines[-FOOTER_LINES][0]
+    return max(data_end, layout['header_offset'])
+
+
+def detect_layout(path):
+    """
+    Locate the column header and the footer of a feeder setup by scanning the
+    first and last few KB of the file, and pick the delimiter from the header.
+
+    Returns {'header_offset', 'data_end', 'delimiter', 'columns'}: the parser
+    reads bytes [header_offset, data_end) and never has to skip a footer.
+    A setup cache returns the layout of the file it was parsed from; a
+    compressed setup has no data_end until it has been read to the end.
+    """
+    if is_setup_cache(path):
+        return _cache_metadata(path)['layout']
+    if is_workbook(path):
+        return _workbook_layout(path)
+    if is_compressed(path):
+        with _decompressed(path) as stream:
+            return dict(_header_layout(stream.read(HEAD_SCAN_BYTES)), data_end=None,
+                        compression=_compression(path))
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        head = f.read(HEAD_SCAN_BYTES)
+        tail_start = max(size - TAIL_SCAN_BYTES, 0)
+        f.seek(tail_start)
+        tail = f.read()
+
+    layout = _header_layout(head)
+    return {
+        'header_offset': layout['header_offset'],
+        'data_end': _data_end(tail, tail_start, size, layout),
+        'delimiter': layout['delimiter'],
+        'columns': layout['columns'],
+    }
+
+
+def _dtypes(columns, floats=True):
+    dtypes = {c: str for c in columns if c in TEXT_COLUMNS}
+    if floats:
+        dtypes.update({c: 'float64' for c in columns if c in FLOAT_COLUMNS})
+    return dtypes
+
+
+def _read(f, layout, dtypes, **kwargs):
+    window = io.BufferedReader(_Window(f, layout['header_offset'], layout['data_end']))
+    return pd.read_csv(window, sep=layout['delimiter'], dtype=dtypes, on_bad_lines='skip', **kwargs)
+
+
+def _compression(path):
+    return COMPRESSED_EXTENSIONS.get(os.path.splitext(str(path))[1].lower())
+
+
+def is_compressed(path):
+    return _compression(path) is not None
+
+
+@contextlib.contextmanager
+def _decompressed(path):
+    """Binary stream of the decompressed content of a .gz file, or of the one setup in a .zip"""
+    if _compression(path) == 'gzip':
+        with gzip.open(path, 'rb') as stream:
+            yield stream
+        return
+    with zipfile.ZipFile(path) as archive:
+        members = [info for info in archive.infolist() if not info.is_dir()]
+        if len(members) != 1:
+            raise ValueError(f'{os.path.basename(path)}: a zip upload must hold exactly one feeder setup, '
+                             f'found {len(members)} files')
+        if is_workbook(members[0].filename):
+            raise ValueError(f'{os.path.basename(path)}: upload workbooks as they are, they are already compressed')
+        with archive.open(members[0]) as stream:
+            yield stream
+
+
+def setup_size(path):
+    """Size of a setup once decompressed (its file size when it is not compressed)"""
+    size = os.path.getsize(path)
+    if _compression(path) == 'gzip':
+        # The gzip trailer holds the size modulo 4 GiB
+        with open(path, 'rb') as f:
+            f.seek(-4, os.SEEK_END)
+            return max(int.from_bytes(f.read(4), 'little'), size)
+    if _compression(path) == 'zip':
+        try:
+            with zipfile.ZipFile(path) as archive:
+                return sum(info.file_size for info in archive.infolist())
+        except zipfile.BadZipFile:
+            return size  # reported by the parser
+    return size
+
+
+def _read_compressed(stream, dtypes, **kwargs):
+    head = stream.read(HEAD_SCAN_BYTES)
+    layout = _header_layout(head)
+    window = io.BufferedReader(_StreamWindow(stream, head, layout), buffer_size=STREAM_BLOCK_BYTES)
+    return pd.read_csv(window, sep=layout['delimiter'], dtype=dtypes, on_bad_lines='skip', **kwargs), layout
+
+
+def read_compressed_setup(path):
+    """
+    read_feeder_setup for a .gz or .zip feeder setup: decompressed as it is
+    parsed, the header and footer found in the stream, so the frame is the one
+    of the uncompressed file without it ever being written out.
+    """
+    start = time.perf_counter()
+    # Columns are only known once the header is read: dtypes for absent ones are ignored
+    try:
+        with _decompressed(path) as stream:
+            frame, layout = _read_compressed(stream, _dtypes(TEXT_COLUMNS + FLOAT_COLUMNS))
+    except ValueError:
+        with _decompressed(path) as stream:
+            frame, layout = _read_compressed(stream, _dtypes(TEXT_COLUMNS))
+    parse_time = time.perf_counter() - start
+
+    logger.info("Parsed %s: %d rows in %.3fs (sep %r, %s)",
+                os.path.basename(path), len(frame), parse_time, layout['delimiter'], _compression(path))
+    return {'frame': frame, 'layout': dict(layout, data_end=None, compression=_compression(path)),
+            'parse_time': parse_time, 'rows': len(frame)}
+
+
+def _read_workbook(path, dtypes, **kwargs):
+    # Columns are only known once the header row is read: dtypes for absent ones are ignored
+    rows = io.BufferedReader(_RowText(_workbook_rows(path)), buffer_size=1024 * 1024)
+    return pd.read_csv(rows, sep=',', dtype=dtypes, on_bad_lines='skip', **kwargs)
+
+
+def read_feeder_setup(path):
+    """
+    Parse a feeder setup with the C engine, between the detected header and footer.
+
+    Returns {'frame', 'layout', 'parse_time', 'rows'}. Text columns are read as
+    strings; if a numeric column holds text the file is re-read with inferred types.
+    A setup cache (SETUP_CACHE_SUFFIX) is read instead of parsed, and also returns
+    the normalized 'positions' it was written with.
+    """
+    if is_setup_cache(path):
+        return read_setup_cache(path)
+    if is_workbook(path):
+        return read_workbook_setup(path)
+    if is_compressed(path):
+        return read_compressed_setup(path)
+    start = time.perf_counter()
+    layout = detect_layout(path)
+    with open(path, 'rb') as f:
+        try:
+            frame = _read(f, layout, _dtypes(layout['columns']))
+        except ValueError:
+            frame = _read(f, layout, _dtypes(layout['columns'], floats=False))
+    parse_time = time.perf_counter() - start
+
+    logger.info("Parsed %s: %d rows in %.3fs (sep %r)", os.path.basename(path), len(frame), parse_time,
+                layout['delimiter'])
+    return {'frame': frame, 'layout': layout, 'parse_time': parse_time, 'rows': len(frame)}
+
+
+def iter_feeder_setup(path, chunk_rows, layout=None):
+    """
+    Same parse as read_feeder_setup, as DataFrames of at most chunk_rows rows.
+    Numeric columns are inferred per chunk: a stream cannot be re-read on a bad value.
+    Chunks of a setup cache keep their typed columns and their POSITION_COLUMN
+    (see pop_positions).
+    """
+    if is_setup_cache(path):
+        yield from iter_setup_cache(path, chunk_rows)
+        return
+    if is_workbook(path):
+        with _read_workbook(path, _dtypes(TEXT_COLUMNS, floats=False), chunksize=chunk_rows) as reader:
+            yield from reader
+        return
+    if is_compressed(path):
+        with _decompressed(path) as stream:
+            reader, _ = _read_compressed(stream, _dtypes(TEXT_COLUMNS, floats=False), chunksize=chunk_rows)
+            with reader:
+                yield from reader
+        return
+    layout = layout or detect_layout(path)
+    with open(path, 'rb') as f:
+        with _read(f, layout, _dtypes(layout['columns'], floats=False), chunksize=chunk_rows) as reader:
+            yield from reader
+
+
+def is_workbook(path):
+    return str(path).lower().endswith(EXCEL_EXTENSIONS + LEGACY_EXCEL_EXTENSIONS)
+
+
+def _workbook_layout(path, columns=None):
+    """detect_layout's answer for a workbook: no byte offsets or delimiter, the header of its first sheet"""
+    if columns is None:
+        rows = _workbook_rows(path)
+        columns = next(rows, [])
+        rows.close()
+    return {'header_offset': None, 'data_end': None, 'delimiter': None, 'columns': list(columns), 'sheet': 0}
+
+
+def read_workbook_setup(path):
+    """
+    read_feeder_setup for an .xlsx/.xlsm feeder setup: its first sheet streamed
+    row by row (openpyxl read-only mode) into the CSV parser, so the frame has
+    the same columns, types and rows as the CSV export of the same setup.
+    """
+    start = time.perf_counter()
+    try:
+        frame = _read_workbook(path, _dtypes(TEXT_COLUMNS + FLOAT_COLUMNS))
+    except ValueError:
+        frame = _read_workbook(path, _dtypes(TEXT_COLUMNS))
+    parse_time = time.perf_counter() - start
+
+    logger.info("Parsed %s: %d rows in %.3fs (workbook)", os.path.basename(path), len(frame), parse_time)
+    return {'frame': frame, 'layout': _workbook_layout(path, frame.columns), 'parse_time': parse_time,
+            'rows': len(frame)}
+
+
+def is_setup_cache(path):
+    return str(path).endswith(SETUP_CACHE_SUFFIX)
+
+
+def write_setup_cache(parsed, positions, path):
+    """
+    Store a read_feeder_setup result as a setup cache: the frame with its types,
+    the normalized Position of every row (None when the setup has no
+    module/location columns) and the layout and parse time in the Parquet
+    metadata. Written next to the target and moved in place.
+    """
+    frame = parsed['frame']
+    if positions is not None:
+        frame = frame.assign(**{POSITION_COLUMN: positions.to_numpy()})
+    table = pa.Table.from_pandas(frame, preserve_index=False)
+    metadata = {
+        'format': SETUP_CACHE_FORMAT,
+        'layout': parsed['layout'],
+        'parse_time': parsed['parse_time'],
+        'rows': parsed['rows'],
+    }
+    table = table.replace_schema_metadata({
+        **(table.schema.metadata or {}),
+        _CACHE_METADATA_KEY: json.dumps(metadata).encode(),
+    })
+    # Caches are built in background threads: two uploads of the same content must not share a partial file
+    partial_path = f'{path}.{os.getpid()}.{threading.get_ident()}.partial'
+    try:
+        pq.write_table(table, partial_path)
+        os.replace(partial_path, path)
+    finally:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+    return path
+
+
+def _cache_metadata(path):
+    metadata = json.loads(pq.read_schema(path).metadata[_CACHE_METADATA_KEY])
+    if metadata['format'] != SETUP_CACHE_FORMAT:
+        raise ValueError(f'Unsupported setup cache format {metadata["format"]} in {path}')
+    return metadata
+
+
+def _cache_frame(table, start=0):
+    # One block per column: no consolidation copy, and POSITION_COLUMN pops for free
+    frame = table.to_pandas(split_blocks=True)
+    # Parquet nulls come back as None; the parser gives NaN
+    for name in table.column_names:
+        column = table.column(name)
+        if column.null_count and frame[name].dtype == object:
+            values = frame[name].to_numpy(copy=True)
+            values[column.is_null().to_numpy(zero_copy_only=False)] = np.nan
+            frame[name] = pd.Series(values, index=frame.index, dtype=object)
+    frame.index = pd.RangeIndex(start, start + len(frame))
+    return frame
+
+
+def pop_positions(frame):
+    """Remove and return the cached normalized Position of a frame (None if it has none)"""
+    if POSITION_COLUMN not in frame.columns:
+        return None
+    return frame.pop(POSITION_COLUMN).rename('Position')
+
+
+def read_setup_cache(path):
+    """
+    Read a setup cache written by write_setup_cache: same result as parsing its
+    source, with 'positions' and 'cached' added. 'parse_time' is the read time.
+    """
+    start = time.perf_counter()
+    metadata = _cache_metadata(path)
+    frame = _cache_frame(pq.read_table(path))
+    positions = pop_positions(frame)
+    parse_time = time.perf_counter() - start
+
+    logger.info("Read setup cache %s: %d rows in %.3fs", os.path.basename(path), len(frame), parse_time)
+    return {'frame': frame, 'layout': metadata['layout'], 'parse_time': parse_time, 'rows': len(frame),
+            'positions': positions, 'cached': True}
+
+
+def iter_setup_cache(path, chunk_rows):
+    """A setup cache as DataFrames of at most chunk_rows rows, indexed as the parser's chunks are"""
+    _cache_metadata(path)
+    start = 0
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_rows):
+        frame = _cache_frame(pa.Table.from_batches([batch]), start)
+        start += len(frame)
+        yield frame
+
+
+def ingestion_summary(parsed):
+    """What the prediction JSON reports about how the upload was read"""
+    summary = {
+        'rows': int(parsed['rows']),
+        'parse_time': round(float(parsed['parse_time']), 4),
+        'delimiter': parsed['layout']['delimiter'],
+    }
+    if parsed.get('cached'):
+        summary['cached'] = True
+    return summary
+
+
+def setup_identity(frame):
+    """
+    Line and setup a feeder setup belongs to, from its LineName/SetupName columns
+    (first non-empty value; '' when the column is missing). Revisions of one setup
+    share it, which is how the diff mode finds the previous version.
+    """
+    cols = {col.lower(): col for col in frame.columns}
+    identity = {'line_name': '', 'setup_name': ''}
+    for key, name in [('line_name', 'linename'), ('setup_name', 'setupname')]:
+        if name not in cols:
+            continue
+        for value in frame[cols[name]].dropna():
+            if str(value).strip():
+                identity[key] = str(value).strip()
+                break
+    return identity
@@ -0,0 +1,483 @@
+import contextlib
+import logging
+import os
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from ..models import Export, ProcessingHistory
+from ..models.file import File
+from ..models.job import ProcessingJob
+from ..models.result import ProcessingResult
+from ..utils.serialization import make_json_serializable
+from .backend_file1 import predict_feeder_errors
+from .batch import predict_feeder_errors_batch
+from .compiled_scorer import get_model
+from .history_store import get_history_version
+from .incremental import predict_feeder_errors_diff
+from .ingestion import setup_size
+from .setup_cache import setup_path
+from .streaming import predict_feeder_errors_streaming
+
+logger = logging.getLogger(__name__)
+
+# ProcessingJob.status values; 'pending' rows are the queue, 'created' jobs wait for
+# jobs/<id>/execute/ and are never claimed
+CREATED = 'created'
+PENDING = 'pending'
+PROCESSING = 'processing'
+COMPLETED = 'completed'
+FAILED = 'failed'
+
+# ProcessingJob.mode values
+FULL = 'full'
+DIFF = 'diff'
+
+EXPORT_TYPES = {
+    'csv': 'CSV',
+    'excel': 'Excel',
+    'json': 'JSON',
+    'parquet': 'Parquet',
+}
+
+
+def enqueue_job(job):
+    """
+    Put a created (or failed) job on the queue so the next free worker picks it
+    up. Jobs already queued, running or completed are returned as they are, so
+    a repeated execute never runs a job twice.
+    """
+    queued = ProcessingJob.objects.filter(id=job.id, status__in=(CREATED, FAILED)).update(
+        status=PENDING,
+        worker_id=None,
+        started_at=None,
+        heartbeat_at=None,
+        completed_at=None,
+        error_message=None,
+    )
+    job.refresh_from_db()
+    if queued:
+        job.file.status = 'processing'
+        job.file.save(update_fields=['status'])
+    return job
+
+
+def start_job(job):
+    """
+    Move a created, queued or failed job to 'processing' in the current process
+    (inline execution). Returns False, with the job refreshed, when it is
+    already running or completed.
+    """
+    started = ProcessingJob.objects.filter(id=job.id, status__in=(CREATED, PENDING, FAILED)).update(
+        status=PROCESSING,
+        started_at=timezone.now(),
+        heartbeat_at=timezone.now(),
+        attempts=F('attempts') + 1,
+    )
+    job.refresh_from_db()
+    return bool(started)
+
+
+def create_jobs(files, status=PENDING):
+    """
+    Create one job per file with a single insert and mark the files as processing.
+    Pending jobs are picked up by the workers; pass status=PROCESSING to run them
+    in the current process instead.
+    """
+    started_at = timezone.now() if status == PROCESSING else None
+    with transaction.atomic():
+        jobs = ProcessingJob.objects.bulk_create([
+            ProcessingJob(
+                file=file,
+                status=status,
+                started_at=started_at,
+                attempts=1 if status == PROCESSING else 0,
+            )
+            for file in files
+        ])
+        for file in files:
+            file.status = 'processing'
+        File.objects.bulk_update(files, ['status'])
+    return jobs
+
+
+def claim_jobs(worker_id, limit=1):
+    """
+    Atomically move up to `limit` of the oldest pending jobs to 'processing' for
+    this worker.
+
+    The claim is a conditional UPDATE on (id, status='pending'), so when several
+    workers race for the same rows each row goes to only one of them. Returns an
+    empty list when the queue is empty.
+    """
+    while True:
+        job_ids = list(ProcessingJob.objects
+                       .filter(status=PENDING, file__is_deleted=False)
+                       .order_by('id')
+                       .values_list('id', flat=True)[:limit])
+        if not job_ids:
+            return []
+
+        claimed = ProcessingJob.objects.filter(id__in=job_ids, status=PENDING).update(
+            status=PROCESSING,
+            worker_id=worker_id,
+            started_at=timezone.now(),
+            heartbeat_at=timezone.now(),
+            attempts=F('attempts') + 1,
+        )
+        if claimed:
+            return list(ProcessingJob.objects
+                        .select_related('file', 'file__user')
+                        .filter(id__in=job_ids, status=PROCESSING, worker_id=worker_id)
+                        .order_by('id'))
+        # Another worker won the race, try the next ones
+
+
+def claim_next_job(worker_id):
+    """Claim the oldest pending job, or None when the queue is empty"""
+    jobs = claim_jobs(worker_id, limit=1)
+    return jobs[0] if jobs else None
+
+
+def heartbeat(worker_id, job_ids):
+    """Record that this worker is still running these jobs (see requeue_stale_jobs)"""
+    return ProcessingJob.objects.filter(id__in=job_ids, status=PROCESSING, worker_id=worker_id).update(
+        heartbeat_at=timezone.now(),
+    )
+
+
+@contextlib.contextmanager
+def keep_alive(worker_id, jobs, interval=None):
+    """Send a heartbeat for claimed jobs every `interval` seconds while they run"""
+    interval = interval or settings.PROCESSING_HEARTBEAT_INTERVAL
+    job_ids = [job.id for job in jobs]
+    done = threading.Event()
+
+    def beat():
+        try:
+            while not done.wait(interval):
+                try:
+                    heartbeat(worker_id, job_ids)
+                except Exception as e:
+                    # A missed beat is retried; only timeout seconds without one requeue the jobs
+                    logger.warning("[%s] heartbeat failed: %s", worker_id, e)
+        finally:
+            connection.close()
+
+    thread = threading.Thread(target=beat, daemon=True, name=f'heartbeat-{worker_id}')
+    thread.start()
+    try:
+        yield
+    finally:
+        done.set()
+        thread.join()
+
+
+def requeue_stale_jobs(timeout=None, max_attempts=None):
+    """
+    Release jobs whose worker died mid-run: no heartbeat for `timeout` seconds
+    (a running job keeps sending them, however long it takes). Give up after
+    max_attempts, failing the job and its file.
+    """
+    timeout = timeout or settings.PROCESSING_JOB_TIMEOUT
+    max_attempts = max_attempts or settings.PROCESSING_JOB_MAX_ATTEMPTS
+    cutoff = timezone.now() - timedelta(seconds=timeout)
+
+    stale = ProcessingJob.objects.filter(
+        Q(heartbeat_at__lt=cutoff) | Q(heartbeat_at__isnull=True, started_at__lt=cutoff),
+        status=PROCESSING,
+    )
+    exhausted = list(stale.filter(attempts__gte=max_attempts).values_list('id', 'file_id'))
+    failed = ProcessingJob.objects.filter(id__in=[job_id for job_id, _ in exhausted], status=PROCESSING).update(
+        status=FAILED,
+        completed_at=timezone.now(),
+        error_message=f'Job did not finish after {max_attempts} attempts',
+    )
+    # As _fail_job does for a job that raised
+    File.objects.filter(id__in=[file_id for _, file_id in exhausted]).update(status='error')
+    requeued = stale.filter(attempts__lt=max_attempts).update(
+        status=PENDING,
+        worker_id=None,
+        started_at=None,
+        heartbeat_at=None,
+    )
+    return {'requeued': requeued, 'failed': failed}
+
+
+def _model_version(model_version, regressor_version=None):
+    """Classifier and regressor versions of a result, as one key"""
+    return f'{model_version}:{regressor_version}' if regressor_version else model_version
+
+
+def _current_versions():
+    """Model and history versions a job run now is computed with"""
+    model = get_model(regressor_path=settings.ERROR_RATE_REGRESSOR_PATH)
+    regressor = model['regressor']
+    return {
+        'model_version': _model_version(model['version'], regressor['version'] if regressor else None),
+        'history_version': get_history_version(),
+    }
+
+
+def _find_reusable(job, versions):
+    """
+    Stored result of a file of the same user with the same content, computed with
+    the same models and history, whose tables are still on disk; None if there is
+    none. Other users' results are never served (reused_result_id would point at them).
+    """
+    if not job.file.content_hash:
+        return None
+    result = (ProcessingResult.objects
+              .filter(job__file__user=job.file.user, content_hash=job.file.content_hash, **versions)
+              .exclude(job=job)
+              .order_by('-created_at', '-id')
+              .first())
+    if result is None:
+        return None
+    tables = result.prediction_data.get('output_files', {}).get('tables', {})
+    if not tables or not all(os.path.exists(path) for path in tables.values()):
+        return None
+    return result
+
+
+def _reused_output(result, job):
+    """The stored output of a result, served again for a repeat upload"""
+    output = dict(result.prediction_data, reused_result_id=result.id)
+    # A diff against that result's own predecessor says nothing about this job
+    output.pop('incremental', None)
+    if job.mode == DIFF:
+        output['incremental'] = {'applied': False, 'reason': 'identical upload, result reused'}
+    return output
+
+
+def _save_outputs(finished, user=None, history_version=''):
+    """
+    Store the result, history and export rows of finished jobs and mark them
+    completed, with one bulk insert per table.
+
+    `finished` is a list of (job, model_output) pairs.
+    """
+    results = []
+    histories = []
+    for job, model_output in finished:
+        # Extract AI score from model output
+        ai_score = model_output['model_performance']['accuracy']
+        state = model_output.get('incremental_state') or {}
+        results.append(ProcessingResult(
+            job=job,
+            ai_score=ai_score,
+            prediction_data=make_json_serializable(model_output),  # Store the entire model output
+            confidence_level=ai_score,
+            line_name=state.get('line_name', ''),
+            setup_name=state.get('setup_name', ''),
+            # Key to serve this result again for the same content (see _find_reusable)
+            content_hash=job.file.content_hash if state.get('model_version') else '',
+            model_version=_model_version(state.get('model_version') or '', state.get('regressor_version')),
+            history_version=history_version,
+        ))
+        histories.append(ProcessingHistory(
+            file=job.file,
+            accuracy=model_output['model_performance']['accuracy'],
+            precision=model_output['model_performance']['precision'],
+            recall=model_output['model_performance']['recall'],
+            f1_score=model_output['model_performance']['f1_score'],
+            total_samples=model_output['model_performance']['total_samples'],
+            error_rate=model_output['model_performance']['error_rate'],
+        ))
+
+    now = timezone.now()
+    with transaction.atomic():
+        results = ProcessingResult.objects.bulk_create(results)
+        ProcessingHistory.objects.bulk_create(histories)
+
+        # 'tables' holds the internal columnar tables, not a downloadable export
+        exports = Export.objects.bulk_create([
+            Export(
+                user=user or job.file.user,
+                result=result,
+                export_type=EXPORT_TYPES.get(export_key, 'Other')
+            )
+            for (job, model_output), result in zip(finished, results)
+            for export_key in model_output['output_files']
+            if export_key != 'tables'
+        ])
+
+        jobs = [job for job, _ in finished]
+        for job in jobs:
+            job.status = COMPLETED
+            job.completed_at = now
+            job.error_message = None
+            job.file.status = 'processed'
+        ProcessingJob.objects.bulk_update(jobs, ['status', 'completed_at', 'error_message'])
+        File.objects.bulk_update([job.file for job in jobs], ['status'])
+
+    exports_by_result = {}
+    for export in exports:
+        exports_by_result.setdefault(export.result_id, []).append(export)
+    return [
+        {'result': result, 'exports': exports_by_result.get(result.id, []), 'model_output': model_output}
+        for (job, model_output), result in zip(finished, results)
+    ]
+
+
+def _fail_job(job, message):
+    job.status = FAILED
+    job.error_message = message
+    job.completed_at = timezone.now()
+    job.save()
+
+    job.file.status = 'error'
+    job.file.save(update_fields=['status'])
+
+
+def _is_large(path):
+    try:
+        # Compressed uploads are sized by their decompressed content
+        return setup_size(path) >= settings.PROCESSING_STREAMING_MIN_BYTES
+    except OSError:
+        return False  # reported by the parser
+
+
+def _predict(path, read_path=None):
+    """Score the upload at path, read from read_path (its setup cache) when given"""
+    read_path = read_path or path
+    if _is_large(path):
+        # Large setups are scored in bounded chunks
+        return predict_feeder_errors_streaming(
+            read_path,
+            output_root=settings.RESULTS_DIR,
+            chunk_rows=settings.PROCESSING_CHUNK_ROWS,
+            prediction_cache_path=settings.PREDICTION_CACHE_PATH,
+            regressor_path=settings.ERROR_RATE_REGRESSOR_PATH,
+        )
+    return predict_feeder_errors(
+        read_path,
+        output_root=settings.RESULTS_DIR,
+        prediction_cache_path=settings.PREDICTION_CACHE_PATH,
+        regressor_path=settings.ERROR_RATE_REGRESSOR_PATH,
+    )
+
+
+def _find_previous(job):
+    """Latest result of the same user for the setup identity, as predict_feeder_errors_diff expects it"""
+    def find(identity):
+        result = (ProcessingResult.objects
+                  .filter(job__file__user=job.file.user,
+                          line_name=identity['line_name'],
+                          setup_name=identity['setup_name'])
+                  .exclude(job=job)
+                  .order_by('-created_at', '-id')
+                  .first())
+        if result is None:
+            return None
+        return {'result_id': result.id, 'prediction_data': result.prediction_data}
+    return find
+
+
+def _predict_diff(job):
+    return predict_feeder_errors_diff(
+        setup_path(job.file),
+        _find_previous(job),
+        output_root=settings.RESULTS_DIR,
+        prediction_cache_path=settings.PREDICTION_CACHE_PATH,
+        regressor_path=settings.ERROR_RATE_REGRESSOR_PATH,
+    )
+
+
+def run_job(job, user=None):
+    """
+    Run the prediction pipeline for a claimed job and store its result,
+    history record and export records. Marks the job failed and re-raises
+    if anything goes wrong.
+    """
+    try:
+        versions = _current_versions()
+        reusable = _find_reusable(job, versions)
+        if reusable is not None:
+            # Same bytes, models and history as a stored result: nothing to compute
+            model_output = _reused_output(reusable, job)
+        # Diff mode holds the previous raw table in memory: large setups stay chunked
+        elif job.mode == DIFF and not _is_large(job.file.storage_path):
+            model_output = _predict_diff(job)['json_output']
+        else:
+            model_output = _predict(job.file.storage_path, setup_path(job.file))['json_output']
+        return _save_outputs([(job, model_output)], user=user, history_version=versions['history_version'])[0]
+    except Exception as e:
+        _fail_job(job, str(e))
+        raise
+
+
+def run_jobs(jobs, user=None):
+    """
+    Run several claimed jobs with one model call (see batch.py) and store all
+    their rows with bulk inserts. Setups large enough for the chunked mode, and
+    diff-mode jobs (which depend on their setup's previous result), are run on
+    their own. A job that fails is marked failed without affecting the
+    others.
+
+    Jobs whose file content already has a result for the current models and
+    history are completed from it without running the model.
+
+    Returns {job id: run_job-style outcome, or {'error': message}}.
+    """
+    outcomes = {}
+    small = []
+    try:
+        versions = _current_versions()
+    except Exception as e:
+        # No model to run any of them with
+        for job in jobs:
+            _fail_job(job, str(e))
+            outcomes[job.id] = {'error': str(e)}
+        return outcomes
+    reused = []
+    for job in jobs:
+        reusable = _find_reusable(job, versions)
+        if reusable is not None:
+            reused.append((job, _reused_output(reusable, job)))
+        elif job.mode == DIFF or _is_large(job.file.storage_path):
+            try:
+                outcomes[job.id] = run_job(job, user=user)
+            except Exception as e:
+                outcomes[job.id] = {'error': str(e)}
+        else:
+            small.append(job)
+
+    finished = reused
+    if small:
+        # Files with the same content in one batch are scored once
+        unique = {}
+        for job in small:
+            unique.setdefault(job.file.content_hash or f'job-{job.id}', job)
+        try:
+            outputs = dict(zip(unique, predict_feeder_errors_batch(
+                [setup_path(job.file) for job in unique.values()],
+                output_root=settings.RESULTS_DIR,
+                prediction_cache_path=settings.PREDICTION_CACHE_PATH,
+                regressor_path=settings.ERROR_RATE_REGRESSOR_PATH,
+            )))
+        except Exception as e:
+            outputs = {key: {'error': str(e)} for key in unique}
+        for job in small:
+            output = outputs[job.file.content_hash or f'job-{job.id}']
+            if 'error' in output:
+                _fail_job(job, output['error'])
+                outcomes[job.id] = output
+            else:
+                finished.append((job, output['json_output']))
+
+    if finished:
+        try:
+            saved = _save_outputs(finished, user=user, history_version=versions['history_version'])
+            for (job, _), outcome in zip(finished, saved):
+                outcomes[job.id] = outcome
+        except Exception as e:
+            for job, _ in finished:
+                _fail_job(job, str(e))
+                outcomes[job.id] = {'error': str(e)}
+
+    return outcomes
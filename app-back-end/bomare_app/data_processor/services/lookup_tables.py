@@ -0,0 +1,133 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from .history_store import read_history_csv
+from .model_registry import _file_hash, get_artifact
+
+LOOKUP_FORMAT = 1
+
+# History column imputed by (Shape, Position) group mean, then global mean, as in
+# the notebook, and the per-part mean of it added as a feature
+IMPUTED_COLUMN = 'Error Rate'
+PART_MEAN_COLUMN = 'PartNumber_MeanError'
+# Per-shape and per-position means of the rate, inputs of the error-rate regressor
+SHAPE_MEAN_COLUMN = 'ShapeErrMean'
+POSITION_MEAN_COLUMN = 'PosErrMean'
+
+
+def lookups_path_for(pipeline_path):
+    """Where the lookup tables a pipeline was trained with live: next to it, .lookups.npz"""
+    return os.path.splitext(pipeline_path)[0] + '.lookups.npz'
+
+
+def build_lookup_tables(history, pipeline_version=''):
+    """
+    Group statistics of a PartUsage frame (Shape, Position, PartNumber, Error Rate
+    columns) as plain arrays: mean rate per (Shape, Position), per Shape, per
+    Position, global mean, and mean rate per part number once missing rates are
+    imputed with the (Shape, Position) and global means.
+    """
+    rate = pd.to_numeric(history[IMPUTED_COLUMN], errors='coerce').replace([np.inf, -np.inf], np.nan)
+    global_mean = float(rate.mean()) if rate.notna().any() else 0.0
+
+    shape = history['Shape'].astype(str)
+    position = history['Position'].astype(str)
+    groups = rate.groupby([shape, position]).mean().dropna()
+
+    keys = pd.MultiIndex.from_arrays([shape, position])
+    imputed = rate.fillna(pd.Series(groups.reindex(keys).to_numpy(), index=rate.index)).fillna(global_mean)
+    parts = imputed.groupby(history['PartNumber']).mean()
+    shapes = rate.groupby(history['Shape']).mean().dropna()
+    positions = rate.groupby(history['Position']).mean().dropna()
+
+    return {
+        'format': np.array(LOOKUP_FORMAT),
+        'pipeline_version': np.array(pipeline_version),
+        'global_mean': np.array(global_mean),
+        'group_shape': groups.index.get_level_values(0).to_numpy().astype(str),
+        'group_position': groups.index.get_level_values(1).to_numpy().astype(str),
+        'group_mean': groups.to_numpy(dtype=np.float64),
+        'part_number': parts.index.to_numpy().astype(str),
+        'part_mean': parts.to_numpy(dtype=np.float64),
+        'shape': shapes.index.to_numpy().astype(str),
+        'shape_mean': shapes.to_numpy(dtype=np.float64),
+        'position': positions.index.to_numpy().astype(str),
+        'position_mean': positions.to_numpy(dtype=np.float64),
+    }
+
+
+def export_lookup_tables(history_path, output_path, pipeline_version=''):
+    """Build the tables from a PartUsage CSV and write them atomically, tagged with the pipeline they go with"""
+    arrays = build_lookup_tables(read_history_csv(history_path), pipeline_version)
+    arrays['history_version'] = np.array(_file_hash(history_path))
+    partial_path = f'{output_path}.{os.getpid()}.partial.npz'
+    np.savez(partial_path, **arrays)
+    os.replace(partial_path, output_path)
+    return output_path
+
+
+def tables_from_arrays(arrays):
+    """Dictionaries for O(1) lookups from the arrays of build_lookup_tables"""
+    empty = np.array([])
+    return {
+        'pipeline_version': str(arrays['pipeline_version']),
+        'history_version': str(arrays.get('history_version', '')),
+        'global_mean': float(arrays['global_mean']),
+        'group_means': dict(zip(zip(arrays['group_shape'].tolist(), arrays['group_position'].tolist()),
+                                arrays['group_mean'].tolist())),
+        'part_means': dict(zip(arrays['part_number'].tolist(), arrays['part_mean'].tolist())),
+        # Absent from tables exported before the regressor inputs were added
+        'shape_means': dict(zip(arrays.get('shape', empty).tolist(), arrays.get('shape_mean', empty).tolist())),
+        'position_means': dict(zip(arrays.get('position', empty).tolist(),
+                                   arrays.get('position_mean', empty).tolist())),
+    }
+
+
+def load_lookup_tables(path):
+    """Read a lookup table file written by export_lookup_tables"""
+    with np.load(path, allow_pickle=False) as data:
+        arrays = {key: data[key] for key in data.files}
+    if int(arrays['format']) != LOOKUP_FORMAT:
+        raise ValueError(f'Unsupported lookup table format {int(arrays["format"])} in {path}')
+    return tables_from_arrays(arrays)
+
+
+def get_lookup_tables(path):
+    """Registry entry for a lookup table file (loaded once per process, hot-reloaded)"""
+    return get_artifact(path, loader=load_lookup_tables, derive=lambda tables: {'tables': tables})
+
+
+def apply_lookups(X, tables, shapes=None):
+    """
+    Fill a feature frame from the tables, in one pass over its rows: missing
+    Error Rate from the (Shape, Position) mean or the global mean, and
+    PartNumber_MeanError, ShapeErrMean and PosErrMean from the part's, shape's and
+    position's means (global mean for unknown values).
+    Only the columns present in X are touched. `shapes` overrides X['Shape'] as
+    the group key (e.g. the setup's PartShapeName where history has no Shape).
+    """
+    X = X.copy()
+    global_mean = tables['global_mean']
+    if IMPUTED_COLUMN in X.columns:
+        missing = X[IMPUTED_COLUMN].isna().to_numpy()
+        if missing.any():
+            shapes = X['Shape'] if shapes is None else shapes
+            group_means = tables['group_means']
+            X.loc[missing, IMPUTED_COLUMN] = [
+                group_means.get((str(s), str(p)), global_mean)
+                for s, p in zip(shapes[missing].tolist(), X['Position'][missing].tolist())
+            ]
+    # Per-key means; missing or unknown keys get the global mean
+    for column, key, means in [
+        (PART_MEAN_COLUMN, 'PartNumber', tables['part_means']),
+        (SHAPE_MEAN_COLUMN, 'Shape', tables['shape_means']),
+        (POSITION_MEAN_COLUMN, 'Position', tables['position_means']),
+    ]:
+        if column in X.columns:
+            X[column] = [
+                means.get(str(v), global_mean) if isinstance(v, str) or not pd.isna(v) else global_mean
+                for v in X[key].tolist()
+            ]
+    return X
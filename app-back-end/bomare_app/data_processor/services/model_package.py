@@ -0,0 +1,125 @@
+import json
+import mmap
+import os
+import pickle
+import struct
+import zipfile
+
+import numpy as np
+
+PACKAGE_FORMAT = 1
+
+# Buffers start on cache-line boundaries, so mapped arrays are aligned as NumPy allocates them
+ALIGNMENT = 64
+_TRAILER = struct.Struct('<Q')
+
+# Smaller .npz members are read rather than mapped
+MIN_MAPPED_BYTES = 4096
+
+
+def package_path_for(model_path):
+    """Where the packaged form of a pickled model lives: next to it, .pkg"""
+    return os.path.splitext(model_path)[0] + '.pkg'
+
+
+def export_package(model, output_path, source_version=''):
+    """
+    Write a fitted model as a memory-mappable package: its pickle (protocol 5)
+    with every NumPy array taken out of band and stored raw after it, aligned,
+    then a JSON header locating each buffer and an 8-byte header length.
+    """
+    buffers = []
+    data = pickle.dumps(model, protocol=5, buffer_callback=buffers.append)
+
+    header = {'format': PACKAGE_FORMAT, 'source_version': source_version, 'pickle': len(data), 'buffers': []}
+    partial_path = f'{output_path}.{os.getpid()}.partial'
+    with open(partial_path, 'wb') as f:
+        f.write(data)
+        offset = len(data)
+        for buffer in buffers:
+            raw = buffer.raw()
+            padding = -offset % ALIGNMENT
+            f.write(b'\0' * padding)
+            offset += padding
+            header['buffers'].append([offset, raw.nbytes])
+            f.write(raw)
+            offset += raw.nbytes
+        encoded = json.dumps(header).encode()
+        f.write(encoded)
+        f.write(_TRAILER.pack(len(encoded)))
+    os.replace(partial_path, output_path)
+    return {
+        'path': output_path,
+        'buffers': len(buffers),
+        'buffer_bytes': sum(size for _, size in header['buffers']),
+        'pickle_bytes': len(data),
+    }
+
+
+def _map(path):
+    with open(path, 'rb') as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def read_package_header(path):
+    """Header of a package (format, source_version, buffer offsets)"""
+    mapped = _map(path)
+    try:
+        size = _TRAILER.unpack(mapped[-_TRAILER.size:])[0]
+        return json.loads(mapped[len(mapped) - _TRAILER.size - size:len(mapped) - _TRAILER.size])
+    finally:
+        mapped.close()
+
+
+def load_package(path):
+    """
+    Unpickle a package with its arrays mapped from the file, not copied: their
+    pages are shared by every process that loads it (read-only arrays).
+    """
+    mapped = _map(path)
+    size = _TRAILER.unpack(mapped[-_TRAILER.size:])[0]
+    header = json.loads(mapped[len(mapped) - _TRAILER.size - size:len(mapped) - _TRAILER.size])
+    if header['format'] != PACKAGE_FORMAT:
+        raise ValueError(f'Unsupported package format {header["format"]} in {path}')
+    view = memoryview(mapped)
+    # The arrays keep the mapping alive through these views
+    buffers = [view[offset:offset + length] for offset, length in header['buffers']]
+    return pickle.loads(view[:header['pickle']], buffers=buffers)
+
+
+def map_npz(path):
+    """
+    Arrays of an .npz written by np.savez (stored, not compressed), each mapped
+    read-only from the file instead of read into memory. Compressed and small
+    members are read as np.load would.
+    """
+    arrays = {}
+    mapped = _map(path)
+    with zipfile.ZipFile(path) as archive, open(path, 'rb') as f:
+        for info in archive.infolist():
+            name = info.filename[:-len('.npy')] if info.filename.endswith('.npy') else info.filename
+            if info.compress_type != zipfile.ZIP_STORED:
+                with archive.open(info) as member:
+                    arrays[name] = np.lib.format.read_array(member, allow_pickle=False)
+                continue
+            # Local file header: 30 bytes, then the name and extra field of this entry
+            f.seek(info.header_offset + 26)
+            name_length, extra_length = struct.unpack('<HH', f.read(4))
+            f.seek(info.header_offset + 30 + name_length + extra_length)
+            start = f.tell()
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+            count = int(np.prod(shape))
+            if dtype.hasobject or count * dtype.itemsize < MIN_MAPPED_BYTES:
+                # Scalars and small arrays: a page each is not worth mapping
+                f.seek(start)
+                arrays[name] = np.lib.format.read_array(f, allow_pickle=False)
+                continue
+            # Views on the one mapping of the file, which they keep alive
+            arrays[name] = np.frombuffer(mapped, dtype=dtype, count=count, offset=f.tell()).reshape(
+                shape, order='F' if fortran_order else 'C'
+            )
+    return arrays
@@ -0,0 +1,145 @@
+import hashlib
+import logging
+import os
+import pickle
+import threading
+import time
+from datetime import datetime
+
+from .model_package import load_package, package_path_for, read_package_header
+
+logger = logging.getLogger(__name__)
+
+script_dir = os.path.dirname(os.path.abspath(__file__))  # Folder where script lives
+DEFAULT_PIPELINE_PATH = os.path.join(script_dir, 'bomare_best_pipeline.pkl')
+
+# One registry per worker process: path -> loaded entry
+_lock = threading.Lock()
+_entries = {}
+_stats = {'hits': 0, 'misses': 0, 'reloads': 0, 'total_load_time': 0.0}
+
+
+def _file_signature(path):
+    """Cheap change detection: modification time and size of the file"""
+    st = os.stat(path)
+    return (st.st_mtime_ns, st.st_size)
+
+
+def _file_hash(path):
+    """SHA-256 of the file content, used as the artifact version"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def pipeline_features(pipeline):
+    """Input columns expected by the 'pre' ColumnTransformer (numeric then categorical)"""
+    pre = pipeline.named_steps['pre']
+    return list(pre.transformers_[0][2]) + list(pre.transformers_[1][2])
+
+
+def _load_pickle(path):
+    """
+    Unpickle a model, from its memory-mapped package (see model_package.py) when
+    one was built from this exact file: its arrays are then shared by every worker.
+    """
+    package_path = package_path_for(path)
+    if os.path.exists(package_path):
+        try:
+            if read_package_header(package_path)['source_version'] == _file_hash(path):
+                return load_package(package_path)
+            logger.warning("Ignoring stale model package %s; run package_models to rebuild it", package_path)
+        except (ValueError, KeyError, OSError) as e:
+            logger.warning("Ignoring model package %s (%s); run package_models to rebuild it", package_path, e)
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+def get_artifact(path, loader=_load_pickle, derive=None):
+    """
+    Return the registry entry for a model artifact, loading it only on first use
+    or when the file on disk has changed (hot reload).
+
+    `derive` is an optional callable receiving the loaded object and returning a
+    dict of extra values cached alongside it (e.g. the feature list).
+    """
+    path = os.path.abspath(path)
+    signature = _file_signature(path)
+
+    with _lock:
+        entry = _entries.get(path)
+        if entry is not None and entry['signature'] == signature:
+            entry['hits'] += 1
+            _stats['hits'] += 1
+            return entry
+
+        # File is new or was touched: only reload when the content really changed
+        version = _file_hash(path)
+        if entry is not None and entry['version'] == version:
+            entry['signature'] = signature
+            entry['hits'] += 1
+            _stats['hits'] += 1
+            return entry
+
+        start = time.perf_counter()
+        obj = loader(path)
+        extra = derive(obj) if derive else {}
+        load_time = time.perf_counter() - start
+
+        _stats['misses'] += 1
+        _stats['total_load_time'] += load_time
+        if entry is not None:
+            _stats['reloads'] += 1
+
+        entry = {
+            'path': path,
+            'signature': signature,
+            'version': version,
+            'object': obj,
+            'load_time': load_time,
+            'loaded_at': datetime.now(),
+            'hits': 0,
+            'reloads': entry['reloads'] + 1 if entry is not None else 0,
+        }
+        entry.update(extra)
+        _entries[path] = entry
+        return entry
+
+
+def get_pipeline(path=DEFAULT_PIPELINE_PATH):
+    """Return the registry entry for a fitted pipeline with its derived feature list"""
+    return get_artifact(path, derive=lambda pipeline: {
+        'pipeline': pipeline,
+        'features': pipeline_features(pipeline),
+    })
+
+
+def get_registry_stats():
+    """Hit/miss counters and load times for every artifact loaded in this process"""
+    with _lock:
+        return {
+            'pid': os.getpid(),
+            'hits': _stats['hits'],
+            'misses': _stats['misses'],
+            'reloads': _stats['reloads'],
+            'total_load_time': _stats['total_load_time'],
+            'models': [
+                {
+                    'path': entry['path'],
+                    'version': entry['version'],
+                    'load_time': entry['load_time'],
+                    'loaded_at': entry['loaded_at'].isoformat(),
+                    'hits': entry['hits'],
+                    'reloads': entry['reloads'],
+                }
+                for entry in _entries.values()
+            ],
+        }
+
+
+def clear_registry():
+    """Drop every cached artifact so the next call reloads from disk"""
+    with _lock:
+        _entries.clear()
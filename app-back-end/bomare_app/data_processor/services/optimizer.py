@@ -0,0 +1,167 @@
+import time
+
+import numpy as np
+import pandas as pd
+
+from .backend_file1 import feature_matrix, model_rows, setup_slots
+from .compiled_scorer import get_model
+from .history_store import DEFAULT_HISTORY_PATH, get_history_version
+from .ingestion import read_feeder_setup
+from .model_registry import DEFAULT_PIPELINE_PATH
+from .scoring import ERROR_RATE_COLUMN, predict_error_rates
+
+# Candidate (slot, position) rows scored per request at most, and per model call
+DEFAULT_MAX_CANDIDATES = 20000
+DEFAULT_CHUNK_ROWS = 5000
+
+# Row id carried through the history join: duplicated history keys fan rows out,
+# and the first match is kept, as lookup_history does
+ROW_ID = '_row'
+
+
+def _objective(model, df):
+    """
+    Value to minimize for every row of a prepared frame: the regressor's
+    predicted error rate when it is loaded, else the classifier's probability.
+    """
+    regressor = model['regressor']
+    if regressor is not None:
+        X = feature_matrix(df, regressor['features'], regressor['lookups'])
+        return predict_error_rates(regressor, X)['error_rates']
+    probabilities, _ = model['score'](feature_matrix(df, model['features'], model['lookups']))
+    return np.asarray(probabilities, dtype=np.float64)
+
+
+def _scored_rows(model, fs, part_number_col, historical_merged_path):
+    """Objective of every row of fs (setup columns, Position), one value per row"""
+    df = model_rows(fs.assign(**{ROW_ID: np.arange(len(fs))}), part_number_col, model['input_features'],
+                    historical_merged_path)
+    df = df.drop_duplicates(ROW_ID).reset_index(drop=True)
+    return df, _objective(model, df)
+
+
+def _position_prior(model, positions):
+    """
+    Order in which target positions are tried when the budget does not cover
+    them all: lowest historical mean error rate first (lookup tables), setup
+    order for positions without one.
+    """
+    tables = (model['regressor'] or {}).get('lookups') or model['lookups']
+    if tables is None:
+        return np.arange(len(positions))
+    means = tables['position_means']
+    prior = np.array([means.get(p, np.inf) for p in positions])
+    return np.argsort(prior, kind='stable')
+
+
+def optimize_assignments(
+    feeder_setup_path,
+    historical_merged_path=DEFAULT_HISTORY_PATH,
+    pipeline_path=DEFAULT_PIPELINE_PATH,
+    regressor_path=None,
+    shape=None,
+    part_numbers=None,
+    max_candidates=DEFAULT_MAX_CANDIDATES,
+    chunk_rows=DEFAULT_CHUNK_ROWS,
+    top=20
+):
+    """
+    What-if search for a setup: which part would do better in another position.
+
+    Every slot holding a part (optionally only parts of one shape, as in the
+    notebook's example, or the given part numbers) is paired with every other
+    position of the setup. The candidate rows are built as one frame, joined
+    with the history of their new (Position, PartNumber) and scored in chunks of
+    chunk_rows rows, then compared with the slot's current score.
+
+    With more than max_candidates pairs, the slots scoring worst now are searched
+    first, each against the positions with the lowest historical error rate,
+    so the budget goes where a move can help most ('truncated' is then True).
+
+    Returns the `top` moves with the largest predicted improvement.
+    """
+    start = time.perf_counter()
+    parsed = read_feeder_setup(feeder_setup_path)
+    model = get_model(pipeline_path, regressor_path)
+    setup = setup_slots(parsed['frame'], parsed.get('positions'))
+    slots = setup['slots'].reset_index(drop=True)
+    part_number_col = setup['part_number_col']
+    df, current = _scored_rows(model, slots, part_number_col, historical_merged_path)
+
+    # Slots that can move: a part in them, and the requested shape/part numbers
+    shape_col = next((c for c in ['PartShapeName', 'Shape'] if c in df.columns), None)
+    movable = df[part_number_col].notna().to_numpy()
+    if shape is not None and shape_col is not None:
+        movable &= (df[shape_col].astype(str).str.lower() == str(shape).lower()).to_numpy()
+    if part_numbers:
+        movable &= df[part_number_col].astype(str).isin([str(p) for p in part_numbers]).to_numpy()
+    candidates_slots = np.flatnonzero(movable)
+
+    positions = pd.unique(df['Position'].dropna())
+
+    # Budget: worst slots first, best-known positions first
+    n_targets = max(len(positions) - 1, 0)
+    total = len(candidates_slots) * n_targets
+    per_slot = n_targets
+    if total > max_candidates and len(candidates_slots):
+        per_slot = max(1, min(n_targets, max_candidates // len(candidates_slots)))
+        worst = candidates_slots[np.argsort(-current[candidates_slots], kind='stable')]
+        candidates_slots = np.sort(worst[:max(1, max_candidates // per_slot)])
+    ordered_positions = positions[_position_prior(model, positions)]
+
+    # One candidate row per (slot, target position), targets in prior order
+    slot_positions = df['Position'].to_numpy()
+    slot_index, target = [], []
+    for i in candidates_slots:
+        targets = ordered_positions[ordered_positions != slot_positions[i]][:per_slot]
+        slot_index.append(np.full(len(targets), i))
+        target.append(targets)
+    slot_index = np.concatenate(slot_index) if slot_index else np.zeros(0, dtype=np.int64)
+    target = np.concatenate(target) if target else np.zeros(0, dtype=object)
+
+    # Score the candidates in chunks: history join, features and model per chunk
+    scores = np.zeros(len(slot_index))
+    for lo in range(0, len(slot_index), chunk_rows):
+        hi = min(lo + chunk_rows, len(slot_index))
+        chunk = slots.iloc[slot_index[lo:hi]].reset_index(drop=True)
+        chunk['Position'] = target[lo:hi]
+        scores[lo:hi] = _scored_rows(model, chunk, part_number_col, historical_merged_path)[1]
+
+    # Best target of every slot, kept when it beats the current position
+    moves = pd.DataFrame({'slot': slot_index, 'to_position': target, 'predicted': scores})
+    moves = moves.loc[moves.groupby('slot', sort=False)['predicted'].idxmin()] if len(moves) else moves
+    moves['current'] = current[moves['slot'].to_numpy()] if len(moves) else []
+    moves['improvement'] = moves['current'] - moves['predicted']
+    moves = moves[moves['improvement'] > 0].sort_values(['improvement', 'slot'], ascending=[False, True]).head(top)
+
+    assignments = [
+        {
+            'PartNumber': df[part_number_col].iloc[row.slot],
+            'Shape': df[shape_col].iloc[row.slot] if shape_col else None,
+            'from_position': slot_positions[row.slot],
+            'to_position': row.to_position,
+            'current': float(row.current),
+            'predicted': float(row.predicted),
+            'improvement': float(row.improvement),
+        }
+        for row in moves.itertuples(index=False)
+    ]
+    for assignment in assignments:
+        if assignment['Shape'] is not None and pd.isna(assignment['Shape']):
+            assignment['Shape'] = None
+
+    return {
+        'objective': ERROR_RATE_COLUMN if model['regressor'] is not None else 'ErrorProbability',
+        'model_version': model['version'],
+        'regressor_version': model['regressor']['version'] if model['regressor'] is not None else None,
+        'history_version': get_history_version(historical_merged_path),
+        'slots': int(movable.sum()),
+        'slots_searched': int(len(candidates_slots)),
+        'positions': int(len(positions)),
+        'candidates_total': int(total),
+        'candidates_scored': int(len(slot_index)),
+        'max_candidates': int(max_candidates),
+        'truncated': bool(len(slot_index) < total),
+        'assignments': assignments,
+        'elapsed_ms': round((time.perf_counter() - start) * 1000, 3),
+    }
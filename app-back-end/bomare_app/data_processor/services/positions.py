@@ -0,0 +1,149 @@
+import re
+import threading
+
+import numpy as np
+import pandas as pd
+
+# Raw value -> normalized value, shared by every upload handled by this process.
+# Feeder setups reuse a few hundred module/location values, so after the first
+# upload nearly every lookup is a hit.
+_lock = threading.Lock()
+_memo = {'module': {}, 'location': {}, 'position': {}, 'module_of': {}}
+MEMO_MAX_ENTRIES = 100000
+
+_MODULE_RE = re.compile(r'(M\d+)')
+
+
+def _strip_zeros(value):
+    """'007' -> '7', '' / '000' -> '0'"""
+    return value.lstrip('0') or '0'
+
+
+def _normalize_module(raw):
+    return 'M' + _strip_zeros(str(raw))
+
+
+def _normalize_location(raw):
+    return _strip_zeros(str(raw).replace("'", ''))
+
+
+def normalize_position(pos):
+    """
+    Normalize a training-data position of the form MXX-<SEG1>-<SEG2>-...:
+    strip leading zeros from the module number and from every segment.
+      'M06-A-03-01'  -> 'M6-A-3-1'
+      'M6-B-10-02-5' -> 'M6-B-10-2-5'
+    """
+    parts = pos.split('-')
+    # must start with M<number>
+    if not parts or not parts[0].startswith('M'):
+        return pos.strip()
+    new_parts = ['M' + _strip_zeros(parts[0][1:])]
+    for seg in parts[1:]:
+        seg = seg.strip()
+        new_parts.append(seg.lstrip('0') or seg)
+    return '-'.join(new_parts)
+
+
+def _module_of(position):
+    if not isinstance(position, str):
+        return np.nan
+    match = _MODULE_RE.search(position)
+    return match.group(1) if match else np.nan
+
+
+def _memo_key(value):
+    # Typed key: 1, 1.0 and '1' format differently but compare equal; NaN never equals itself
+    if value != value:
+        return (type(value).__name__, 'nan')
+    return (type(value).__name__, value)
+
+
+def _memoized(kind, uniques, func):
+    """Apply func to each distinct raw value, reusing results from earlier calls"""
+    memo = _memo[kind]
+    keys = [_memo_key(u) for u in uniques]
+    with _lock:
+        if len(memo) + len(keys) > MEMO_MAX_ENTRIES:
+            memo.clear()
+        results = []
+        for key, u in zip(keys, uniques):
+            if key not in memo:
+                memo[key] = func(u)
+            results.append(memo[key])
+    return np.array(results, dtype=object)
+
+
+def _map_distinct(kind, values, func):
+    """func over a column, evaluated once per distinct value and broadcast back by code"""
+    codes, uniques = pd.factorize(pd.Series(values), use_na_sentinel=False)
+    return _memoized(kind, list(uniques), func)[codes]
+
+
+def build_positions(module, location):
+    """
+    Serving-side Position for every feeder-setup row: 'M<module>-<location>' with
+    quotes and leading zeros removed, e.g. ('01', "'007") -> 'M1-7'.
+
+    Same result as the former astype(str)/str.lstrip/map chain, but each distinct
+    module, location and (module, location) pair is formatted only once.
+    """
+    module_codes, module_uniques = pd.factorize(module, use_na_sentinel=False)
+    location_codes, location_uniques = pd.factorize(location, use_na_sentinel=False)
+    modules = _memoized('module', list(module_uniques), _normalize_module)
+    locations = _memoized('location', list(location_uniques), _normalize_location)
+
+    # One string per distinct (module, location) pair
+    pair_codes, pairs = pd.factorize(module_codes.astype(np.int64) * len(location_uniques) + location_codes)
+    labels = [f'{m}-{l}' for m, l in zip(modules[pairs // len(location_uniques)],
+                                           locations[pairs % len(location_uniques)])]
+    values = np.array(labels, dtype=object)[pair_codes]
+
+    index = module.index if isinstance(module, pd.Series) else None
+    return pd.Series(values, index=index, name='Position')
+
+
+def normalize_positions(positions):
+    """normalize_position over a column of training positions, once per distinct value"""
+    values = _map_distinct('position', pd.Series(positions).astype(str), normalize_position)
+    index = positions.index if isinstance(positions, pd.Series) else None
+    return pd.Series(values, index=index, name='Position')
+
+
+def position_modules(positions):
+    """Module part ('M<n>') of each position, NaN where there is none; like str.extract(r'(M\\d+)')"""
+    values = _map_distinct('module_of', positions, _module_of)
+    index = positions.index if isinstance(positions, pd.Series) else None
+    return pd.Series(values, index=index, name='Module')
+
+
+def explode_positions(df, col='Position'):
+    """
+    One row per comma-separated position, in row order, with a fresh RangeIndex;
+    like df.assign(col=df[col].str.split(',')).explode(col).reset_index(drop=True).
+    Returns df unchanged when no position contains a comma.
+    """
+    codes, uniques = pd.factorize(df[col], use_na_sentinel=False)
+    splits = [u.split(',') if isinstance(u, str) else [u] for u in uniques]
+    lengths = np.fromiter((len(s) for s in splits), dtype=np.int64, count=len(splits))
+    if len(lengths) == 0 or lengths.max() == 1:
+        return df
+
+    row_lengths = lengths[codes]
+    rows = np.repeat(np.arange(len(df)), row_lengths)
+
+    # Flatten the split values of each distinct position, then pick each row's run
+    flat = np.array([s for parts in splits for s in parts], dtype=object)
+    starts = np.cumsum(lengths) - lengths
+    row_starts = np.cumsum(row_lengths) - row_lengths
+    within = np.arange(len(rows)) - np.repeat(row_starts, row_lengths)
+
+    exploded = df.iloc[rows].reset_index(drop=True)
+    exploded[col] = flat[np.repeat(starts[codes], row_lengths) + within]
+    return exploded
+
+
+def get_memo_stats():
+    """Number of memoized raw values per kind"""
+    with _lock:
+        return {kind: len(memo) for kind, memo in _memo.items()}
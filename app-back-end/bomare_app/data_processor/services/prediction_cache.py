@@ -0,0 +1,227 @@
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+# Where each row's prediction came from
+SCORED = 0
+MEMORY = 1
+DISK = 2
+
+# Predictions kept in memory per process, least recently used dropped first
+MEMORY_MAX_ENTRIES = 200000
+
+# Ids per SELECT ... IN (...): below SQLite's bound-parameter limit
+QUERY_BATCH = 500
+
+# Row hash: columns folded in order, missing values with a fixed hash
+_HASH_MULTIPLIER = np.uint64(0x100000001B3)
+_NAN_HASH = np.uint64(0x9E3779B97F4A7C15)
+
+_lock = threading.Lock()
+_memory = OrderedDict()
+_connections = {}
+# (pid, store, model_version) whose store was pruned of other versions
+_pruned = set()
+
+
+def feature_hashes(X):
+    """
+    64-bit hash of every feature row that depends on the values only: numeric
+    columns are hashed as float64 and missing values hash the same whatever the
+    column dtype, so a row hashes the same alone or stacked with other setups
+    (where an all-NaN column may become object, or an int column float).
+    """
+    combined = np.zeros(len(X), dtype=np.uint64)
+    with np.errstate(over='ignore'):
+        for col in X.columns:
+            values = X[col]
+            if pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+                values = values.astype(np.float64)
+            hashed = pd.util.hash_array(values.to_numpy())
+            hashed[values.isna().to_numpy()] = _NAN_HASH
+            combined = combined * _HASH_MULTIPLIER + hashed
+    return combined.view(np.int64)
+
+
+def _connection(path):
+    """One SQLite connection per process and store (reopened after a fork)"""
+    key = (os.getpid(), os.path.abspath(path))
+    conn = _connections.get(key)
+    if conn is None:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS predictions ('
+            ' model_version TEXT, position TEXT, part_number TEXT, feature_hash INTEGER,'
+            ' probability REAL, label INTEGER,'
+            ' PRIMARY KEY (model_version, feature_hash, position, part_number)'
+            ') WITHOUT ROWID'
+        )
+        conn.commit()
+        _connections[key] = conn
+    return conn
+
+
+def _key_column(X, col):
+    if col not in X.columns:
+        return [''] * len(X)
+    return ['' if pd.isna(v) else str(v) for v in X[col].tolist()]
+
+
+def _remember(key, value):
+    _memory[key] = value
+    _memory.move_to_end(key)
+    while len(_memory) > MEMORY_MAX_ENTRIES:
+        _memory.popitem(last=False)
+
+
+def _read_disk(path, model_version, keys, wanted):
+    """Stored predictions for keys[i] for every i in wanted: {i: (probability, label)}"""
+    found = {}
+    by_key = {}
+    for i in wanted:
+        by_key.setdefault(keys[i], []).append(i)
+    hashes = sorted({keys[i][2] for i in wanted})
+
+    conn = _connection(path)
+    for lo in range(0, len(hashes), QUERY_BATCH):
+        batch = hashes[lo:lo + QUERY_BATCH]
+        rows = conn.execute(
+            'SELECT position, part_number, feature_hash, probability, label FROM predictions'
+            f' WHERE model_version = ? AND feature_hash IN ({",".join("?" * len(batch))})',
+            [model_version] + batch,
+        ).fetchall()
+        for position, part_number, feature_hash, probability, label in rows:
+            for i in by_key.get((position, part_number, feature_hash), []):
+                found[i] = (probability, label)
+    return found
+
+
+def _prune_disk(path, model_version):
+    """
+    Delete the stored predictions of every other model version: once a model is
+    replaced they are never read again. Done on the first write of a version in
+    each process, so a store holds about one model's rows.
+    """
+    key = (os.getpid(), os.path.abspath(path), model_version)
+    if key in _pruned:
+        return 0
+    conn = _connection(path)
+    deleted = conn.execute('DELETE FROM predictions WHERE model_version != ?', [model_version]).rowcount
+    conn.commit()
+    _pruned.add(key)
+    return deleted
+
+
+def _write_disk(path, model_version, entries):
+    _prune_disk(path, model_version)
+    conn = _connection(path)
+    conn.executemany(
+        'INSERT OR REPLACE INTO predictions VALUES (?, ?, ?, ?, ?, ?)',
+        [(model_version, position, part_number, feature_hash, probability, label)
+         for (position, part_number, feature_hash), (probability, label) in entries],
+    )
+    conn.commit()
+
+
+def cached_score(score, X, model_version, path=None):
+    """
+    score(X) -> (probabilities, labels), computed only for rows never seen before.
+
+    A row is identified by its Position, PartNumber, the hash of its feature vector
+    and the model version. Known rows come from this process' LRU, then from the
+    SQLite store at path (shared by every worker; None keeps the cache in memory
+    only); the rest are scored once per distinct row and remembered in both.
+
+    Returns {'probabilities', 'labels', 'sources'}, sources holding SCORED, MEMORY
+    or DISK for every row (see cache_stats).
+    """
+    hashes = feature_hashes(X)
+    keys = list(zip(_key_column(X, 'Position'), _key_column(X, 'PartNumber'), hashes.tolist()))
+
+    probabilities = np.zeros(len(X))
+    labels = np.zeros(len(X), dtype=np.int64)
+    sources = np.full(len(X), SCORED, dtype=np.int8)
+
+    with _lock:
+        missing = []
+        for i, key in enumerate(keys):
+            value = _memory.get((model_version,) + key)
+            if value is None:
+                missing.append(i)
+                continue
+            _memory.move_to_end((model_version,) + key)
+            probabilities[i], labels[i] = value
+            sources[i] = MEMORY
+
+        if missing and path:
+            for i, value in _read_disk(path, model_version, keys, missing).items():
+                probabilities[i], labels[i] = value
+                sources[i] = DISK
+                _remember((model_version,) + keys[i], value)
+            missing = [i for i in missing if sources[i] == SCORED]
+
+    if missing:
+        # Score each distinct unseen row once
+        first = {}
+        for i in missing:
+            first.setdefault(keys[i], i)
+        rows = list(first.values())
+        new_probabilities, new_labels = score(X.iloc[rows])
+        values = {keys[i]: (float(p), int(label)) for i, p, label in zip(rows, new_probabilities, new_labels)}
+        for i in missing:
+            probabilities[i], labels[i] = values[keys[i]]
+
+        with _lock:
+            for key, value in values.items():
+                _remember((model_version,) + key, value)
+            if path:
+                _write_disk(path, model_version, values.items())
+
+    return {'probabilities': probabilities, 'labels': labels, 'sources': sources}
+
+
+def cache_stats(sources):
+    """Hit counts of one job, from the sources of its rows"""
+    sources = np.asarray(sources)
+    rows = int(len(sources))
+    memory_hits = int(np.sum(sources == MEMORY))
+    disk_hits = int(np.sum(sources == DISK))
+    return {
+        'rows': rows,
+        'hits': memory_hits + disk_hits,
+        'memory_hits': memory_hits,
+        'disk_hits': disk_hits,
+        'misses': rows - memory_hits - disk_hits,
+        'hit_rate': round((memory_hits + disk_hits) / rows, 4) if rows else 0.0,
+    }
+
+
+def add_cache_stats(total, stats):
+    """Sum the counts of two cache_stats results (chunked setups)"""
+    if total is None:
+        return dict(stats)
+    merged = {key: total[key] + stats[key] for key in ['rows', 'hits', 'memory_hits', 'disk_hits', 'misses']}
+    merged['hit_rate'] = round(merged['hits'] / merged['rows'], 4) if merged['rows'] else 0.0
+    return merged
+
+
+def get_prediction_cache_stats():
+    """Entries held in this process' memory cache"""
+    with _lock:
+        return {'pid': os.getpid(), 'memory_entries': len(_memory), 'memory_max_entries': MEMORY_MAX_ENTRIES}
+
+
+def clear_prediction_cache(path=None):
+    """Empty the memory cache, and the on-disk store when a path is given"""
+    with _lock:
+        _memory.clear()
+        if path:
+            conn = _connection(path)
+            conn.execute('DELETE FROM predictions')
+            conn.commit()
@@ -0,0 +1,136 @@
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+from .lookup_tables import get_lookup_tables, lookups_path_for
+from .model_registry import get_artifact, pipeline_features, script_dir
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_REGRESSOR_PATH = os.path.join(script_dir, 'best_regressor.pkl')
+
+# Columns added to a scored setup by the error-rate regressor
+ERROR_RATE_COLUMN = 'PredictedErrorRate'
+HIGH_ERROR_RATE_COLUMN = 'HighErrorRate'
+
+
+def _sidecar(path, name):
+    return os.path.join(os.path.dirname(os.path.abspath(path)), name)
+
+
+def get_regressor(regressor_path=DEFAULT_REGRESSOR_PATH):
+    """
+    Scoring entry for the error-rate regressor: its pipeline, input features
+    (features.pkl next to it, else its preprocessor's columns), the error-rate
+    threshold of threshold.pkl and its lookup tables (ShapeErrMean, PosErrMean),
+    each loaded once per process like the classifier.
+    """
+    entry = get_artifact(regressor_path, derive=lambda pipeline: {
+        'pipeline': pipeline,
+        'features': pipeline_features(pipeline),
+        'categorical': list(pipeline.named_steps['pre'].transformers_[1][2]),
+    })
+    features = list(entry['features'])
+    features_path = _sidecar(regressor_path, 'features.pkl')
+    if os.path.exists(features_path):
+        features = list(get_artifact(features_path)['object'])
+    threshold_entry = get_artifact(_sidecar(regressor_path, 'threshold.pkl'))
+
+    lookups = None
+    lookups_path = lookups_path_for(regressor_path)
+    if os.path.exists(lookups_path):
+        lookups_entry = get_lookup_tables(lookups_path)
+        if lookups_entry['tables']['pipeline_version'] == entry['version']:
+            lookups = lookups_entry['tables']
+        else:
+            logger.warning("Ignoring lookup tables %s written for another regressor", lookups_path)
+
+    return {
+        'pipeline': entry['pipeline'],
+        'features': features,
+        'threshold': float(threshold_entry['object']),
+        # A new threshold changes the labels as much as a new model
+        'version': f"{entry['version']}:{threshold_entry['version']}",
+        'categorical': list(entry['categorical']),
+        'lookups': lookups,
+    }
+
+
+def derive_setup_features(df, features):
+    """
+    Regressor inputs computed from setup columns, added when requested and not
+    already there: FeederQTY (the setup's QTY) and FP_QTY (FeedPitch x QTY).
+    """
+    if 'QTY' not in df.columns:
+        return df
+    qty = pd.to_numeric(df['QTY'], errors='coerce')
+    if 'FeederQTY' in features and 'FeederQTY' not in df.columns:
+        df['FeederQTY'] = qty
+    if 'FP_QTY' in features and 'FP_QTY' not in df.columns and 'FeedPitch' in df.columns:
+        df['FP_QTY'] = pd.to_numeric(df['FeedPitch'], errors='coerce') * qty
+    return df
+
+
+def predict_error_rates(regressor, X):
+    """
+    Predicted error rate of every row of X, whether it reaches the regressor's
+    threshold, and the version and threshold they come from.
+    """
+    # Its one-hot encoder was fitted on object columns (NaN being a category):
+    # an all-missing column read as float must be compared as objects too
+    X = X.copy()
+    for c in regressor['categorical']:
+        X[c] = X[c].astype(object)
+    rates = regressor['pipeline'].predict(X) if len(X) else np.zeros(0)
+    return {
+        'error_rates': rates,
+        'high_error_rate': (rates >= regressor['threshold']).astype(np.int64),
+        'version': regressor['version'],
+        'threshold': regressor['threshold'],
+    }
+
+
+def slice_regression(regression, lo, hi):
+    """Rows lo:hi of a predict_error_rates result (setups scored together)"""
+    if regression is None:
+        return None
+    return dict(regression, error_rates=regression['error_rates'][lo:hi],
+                high_error_rate=regression['high_error_rate'][lo:hi])
+
+
+def error_rate_counts(df):
+    """Mergeable totals of a setup's (or chunk's) regressor columns"""
+    rates = df[ERROR_RATE_COLUMN]
+    return {
+        'rows': int(len(rates)),
+        'sum': float(rates.sum()),
+        'max': float(rates.max()) if len(rates) else None,
+        'high': int(df[HIGH_ERROR_RATE_COLUMN].sum()),
+    }
+
+
+def add_error_rate_counts(total, counts):
+    """Sum two error_rate_counts results (chunked setups)"""
+    if total is None:
+        return dict(counts)
+    maxima = [m for m in [total['max'], counts['max']] if m is not None]
+    return {
+        'rows': total['rows'] + counts['rows'],
+        'sum': total['sum'] + counts['sum'],
+        'max': max(maxima) if maxima else None,
+        'high': total['high'] + counts['high'],
+    }
+
+
+def error_rate_summary(counts, regression):
+    """error_rate_model entry of the prediction JSON"""
+    return {
+        'version': regression['version'],
+        'threshold': regression['threshold'],
+        # Rounded: chunked sums differ from a single sum in the last bits
+        'mean_predicted_error_rate': round(counts['sum'] / counts['rows'], 9) if counts['rows'] else 0.0,
+        'max_predicted_error_rate': counts['max'] if counts['max'] is not None else 0.0,
+        'high_error_rate_slots': counts['high'],
+    }
@@ -0,0 +1,104 @@
+import logging
+import os
+import threading
+import time
+
+from django.db import connection
+
+from ..models.file import File
+from .ingestion import SETUP_CACHE_SUFFIX, read_feeder_setup, write_setup_cache
+from .positions import build_positions
+
+logger = logging.getLogger(__name__)
+
+# File.cache_status values; '' means no cache was requested
+PENDING = 'pending'
+READY = 'ready'
+FAILED = 'failed'
+
+# Uploads converted at upload time (the types read_feeder_setup parses; gz/zip are compressed setups)
+SETUP_CACHE_TYPES = {'csv', 'txt', 'xlsx', 'xlsm', 'gz', 'zip'}
+
+
+def cache_path_for(storage_path):
+    """Where the setup cache of an upload lives: next to it (one per content, as uploads are stored)"""
+    return storage_path + SETUP_CACHE_SUFFIX
+
+
+def _positions(frame):
+    """Normalized Position of every row, as setup_slots builds it; None without module/location columns"""
+    cols = {col.lower(): col for col in frame.columns}
+    if 'modulenumber' not in cols or 'location' not in cols:
+        return None
+    return build_positions(frame[cols['modulenumber']], frame[cols['location']])
+
+
+def build_setup_cache(source_path, cache_path=None):
+    """Parse a feeder setup once and store it, with its normalized Position, as a setup cache"""
+    cache_path = cache_path or cache_path_for(source_path)
+    start = time.perf_counter()
+    parsed = read_feeder_setup(source_path)
+    write_setup_cache(parsed, _positions(parsed['frame']), cache_path)
+    build_time = time.perf_counter() - start
+    logger.info("Setup cache %s: %d rows in %.3fs", os.path.basename(cache_path), parsed['rows'], build_time)
+    return {'path': cache_path, 'rows': parsed['rows'], 'build_time': build_time}
+
+
+def build_file_cache(file_id):
+    """
+    Build the setup cache of an uploaded file and record it on the File row
+    (cache_path, cache_status). Content already converted for another upload
+    is not converted again. Returns the cache path, or None when it failed.
+    """
+    file = File.objects.get(id=file_id)
+    cache_path = cache_path_for(file.storage_path)
+    try:
+        if not os.path.exists(cache_path):
+            build_setup_cache(file.storage_path, cache_path)
+    except Exception as e:
+        # Execution parses the upload itself, as without a cache
+        logger.warning("Setup cache of %s not built: %s", file.filename, e)
+        File.objects.filter(id=file_id).update(cache_status=FAILED)
+        return None
+    # Only the cache fields: the request may be updating the status meanwhile
+    File.objects.filter(id=file_id).update(cache_path=cache_path, cache_status=READY)
+    return cache_path
+
+
+def _build_in_background(file_id):
+    try:
+        build_file_cache(file_id)
+    finally:
+        connection.close()
+
+
+def schedule_setup_cache(file):
+    """
+    Convert an upload to its setup cache in a background thread, so the upload
+    request does not wait for the parse. Returns the thread (None when the file
+    type is not converted or its content already has a cache).
+    """
+    if file.file_type not in SETUP_CACHE_TYPES:
+        return None
+    cache_path = cache_path_for(file.storage_path)
+    if os.path.exists(cache_path):
+        file.cache_path, file.cache_status = cache_path, READY
+        File.objects.filter(id=file.id).update(cache_path=cache_path, cache_status=READY)
+        return None
+    file.cache_status = PENDING
+    File.objects.filter(id=file.id).update(cache_status=PENDING)
+    thread = threading.Thread(target=_build_in_background, args=(file.id,), daemon=True,
+                              name=f'setup-cache-{file.id}')
+    thread.start()
+    return thread
+
+
+def setup_path(file):
+    """
+    Path execution reads a file's setup from: its setup cache when it is ready,
+    else the upload itself (cache still building, failed or never requested).
+    """
+    for path in [file.cache_path if file.cache_status == READY else '', cache_path_for(file.storage_path)]:
+        if path and os.path.exists(path):
+            return path
+    return file.storage_path
@@ -0,0 +1,107 @@
+import math
+import time
+
+import numpy as np
+import pandas as pd
+
+from .compiled_scorer import get_model
+from .history_store import DEFAULT_HISTORY_PATH, get_history_version, lookup_history
+from .lookup_tables import apply_lookups
+from .model_registry import DEFAULT_PIPELINE_PATH
+from .positions import build_positions
+
+SLOT_KEYS = ['ModuleNumber', 'Location', 'PartNumber']
+
+# Feeder-setup columns the model reads; a slot may carry them, history supplies the rest.
+# Typed as read_feeder_setup types them: text, or float
+SLOT_TEXT_FEATURES = ['FeederName', 'Status', 'PackageName', 'PartComment', 'FeederType', 'TapeWidth']
+SLOT_FLOAT_FEATURES = ['FeedPitch', 'PTPMNH']
+
+
+def _slot_value(slot, column, cast):
+    value = slot.get(column)
+    if value is None or value == '':
+        return np.nan
+    try:
+        return cast(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def validate_slots(slots, max_slots):
+    """Error message for a malformed slot list, None when it can be scored"""
+    if not isinstance(slots, list) or not slots:
+        return 'slots must be a non-empty list'
+    if len(slots) > max_slots:
+        return f'At most {max_slots} slots can be scored per request'
+    for i, slot in enumerate(slots):
+        if not isinstance(slot, dict):
+            return f'slots[{i}] must be an object'
+        missing = [key for key in SLOT_KEYS if slot.get(key) in (None, '')]
+        if missing:
+            return f'slots[{i}] is missing {", ".join(missing)}'
+        for key in SLOT_KEYS:
+            if not isinstance(slot[key], (str, int)) or isinstance(slot[key], bool):
+                return f'slots[{i}].{key} must be a string or an integer'
+    return None
+
+
+def score_slots(slots, historical_merged_path=DEFAULT_HISTORY_PATH, pipeline_path=DEFAULT_PIPELINE_PATH):
+    """
+    Score a few feeder slots without a setup file: for each
+    {'ModuleNumber', 'Location', 'PartNumber', optional feeder columns} build the
+    Position as the upload path does, look its history up in the in-process index
+    and run the cached model on the resulting rows.
+
+    A Location listing several positions ("'01,'02") yields one result per position.
+    There is no 95th-percentile fallback: that only makes sense for a whole setup.
+    """
+    start = time.perf_counter()
+    model = get_model(pipeline_path)
+
+    # One row per (slot, position), with the slot index kept to report results in order
+    positions = build_positions(
+        pd.Series([slot['ModuleNumber'] for slot in slots]),
+        pd.Series([slot['Location'] for slot in slots]),
+    )
+    rows, slot_index = [], []
+    for i, (slot, position) in enumerate(zip(slots, positions)):
+        for pos in position.split(','):
+            rows.append({'Position': pos, 'PartNumber': str(slot['PartNumber'])})
+            slot_index.append(i)
+
+    history = lookup_history([(row['Position'], row['PartNumber']) for row in rows], historical_merged_path)
+    records = []
+    for row, i, hist in zip(rows, slot_index, history):
+        record = {c: _slot_value(slots[i], c, str) for c in SLOT_TEXT_FEATURES}
+        record.update({c: _slot_value(slots[i], c, float) for c in SLOT_FLOAT_FEATURES})
+        if hist is not None:
+            # Infinite rates count as missing, as in feature_matrix
+            record.update({k: np.nan if isinstance(v, float) and math.isinf(v) else v for k, v in hist.items()})
+        record.update(row)
+        records.append(record)
+
+    X = pd.DataFrame.from_records(records, columns=model['features'])
+    if model['lookups'] is not None:
+        X = apply_lookups(X, model['lookups'])
+    probabilities, labels = model['score'](X)
+
+    results = [
+        {
+            'ModuleNumber': slots[i]['ModuleNumber'],
+            'Location': slots[i]['Location'],
+            'PartNumber': row['PartNumber'],
+            'Position': row['Position'],
+            'ErrorProbability': float(p),
+            'PredictedError': int(label),
+            'has_history': hist is not None,
+        }
+        for row, i, hist, p, label in zip(rows, slot_index, history, probabilities, labels)
+    ]
+    return {
+        'results': results,
+        'model_version': model['version'],
+        'history_version': get_history_version(historical_merged_path),
+        'compiled': model['compiled'],
+        'elapsed_ms': round((time.perf_counter() - start) * 1000, 3),
+    }
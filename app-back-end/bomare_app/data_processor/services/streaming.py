@@ -0,0 +1,258 @@
+import logging
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from .aggregations import compute_partials, confusion_counts, finalize_report, merge_partials, partials_frame
+from .backend_file1 import (
+    add_regression, assemble_json_output, incremental_state, model_rows, prediction_columns, result_output_paths,
+    score_prepared, script_dir, setup_slots,
+)
+from .compiled_scorer import get_model
+from .exports import (
+    append_table, begin_tables, commit_tables, discard_tables, drop_table, table_parts, write_table,
+)
+from .ingestion import (
+    detect_layout, ingestion_summary, is_setup_cache, iter_feeder_setup, pop_positions, setup_identity,
+)
+from .prediction_cache import add_cache_stats, cache_stats
+from .positions import position_modules
+from .scoring import add_error_rate_counts, error_rate_counts, error_rate_summary
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_ROWS = 50000
+
+# Original rows of each chunk, staged until the predictions table is written
+SOURCE_TABLE = 'source'
+
+def metrics_from_counts(counts):
+    """model_performance from accumulated confusion counts (same values as the sklearn scores)"""
+    tp, fp, fn, tn = counts['tp'], counts['fp'], counts['fn'], counts['tn']
+    total = tp + fp + fn + tn
+    predicted = tp + fp
+    return {
+        'accuracy': float((tp + tn) / total) if total else 0.0,
+        'precision': float(tp / predicted) if predicted else 0.0,
+        'recall': float(tp / (tp + fn)) if tp + fn else 0.0,
+        'f1_score': float(2 * tp / (2 * tp + fp + fn)) if tp + fp + fn else 0.0,
+        'total_samples': int(total),
+        'total_errors': int(predicted),
+        'error_rate': float(predicted / total) if total else 0.0,
+    }
+
+
+def _add_counts(total, counts):
+    for key, value in counts.items():
+        total[key] = total.get(key, 0) + value
+
+
+def _predictions_chunk(fs_original, df, part_number_col):
+    """Original rows with their prediction columns, as in predict_feeder_errors"""
+    columns = prediction_columns(df)
+    predictions = pd.merge(
+        fs_original,
+        df[['Position', part_number_col] + columns],
+        on=['Position', part_number_col],
+        how='left'
+    )
+    for c in columns:
+        predictions[c] = predictions[c].fillna(0)
+    return predictions
+
+
+def _staged_parts(store, name):
+    return table_parts(os.path.join(store['staging_dir'], 'tables', name))
+
+
+def _chunk_keys(df, fs_original, part_number_col, index):
+    """Distinct (Position, PartNumber) keys of a chunk's model and original rows"""
+    keys = ['Position', part_number_col]
+    return pd.concat([df[keys], fs_original[keys]]).drop_duplicates().assign(chunk=index)
+
+
+def _shared_keys(chunk_keys, keys):
+    """
+    (Position, PartNumber) keys found in more than one chunk, among the original
+    or the model rows. Their rows must be merged across chunks; every other key
+    only matches rows of its own chunk.
+    """
+    keys_frame = pd.concat(chunk_keys, ignore_index=True)
+    chunks = keys_frame.groupby(keys, dropna=False, sort=False)['chunk'].nunique()
+    return chunks[chunks > 1].index.to_frame(index=False)
+
+
+def _in_keys(df, keys_frame, keys):
+    """Boolean mask of the rows of df whose key is in keys_frame (unique keys)"""
+    marked = df[keys].merge(keys_frame.assign(_match=True), on=keys, how='left')
+    return marked['_match'].notna().to_numpy()
+
+
+def _write_predictions(store, part_number_col, columns, shared):
+    """
+    Merge the prediction columns back onto the original rows, chunk by chunk,
+    as predict_feeder_errors merges the whole setup: rows of keys shared between
+    chunks (in practice repeated empty slots) are matched against the rows of
+    that key in every chunk, in file order, so they fan out as in memory.
+    """
+    keys = ['Position', part_number_col]
+    raw_parts = _staged_parts(store, 'raw')
+    shared_rows = []
+    for raw_path in raw_parts:
+        df = pd.read_parquet(raw_path, columns=keys + columns)
+        shared_rows.append(df[_in_keys(df, shared, keys)])
+    shared_rows = pd.concat(shared_rows, ignore_index=True)
+
+    for raw_path, source_path in zip(raw_parts, _staged_parts(store, SOURCE_TABLE)):
+        df = pd.read_parquet(raw_path, columns=keys + columns)
+        df = pd.concat([df[~_in_keys(df, shared, keys)], shared_rows], ignore_index=True)
+        append_table(store, 'predictions', _predictions_chunk(pd.read_parquet(source_path), df, part_number_col))
+    drop_table(store, SOURCE_TABLE)
+
+
+def _relabel(store, part_number_col, shape_col, pkg_col, thresh):
+    """
+    Second pass for a setup where the model flagged nothing: re-label every stored
+    chunk with the 95th-percentile threshold and rebuild partials and counts.
+    """
+    partials = None
+    counts = {}
+    offset = 0
+    for raw_path in _staged_parts(store, 'raw'):
+        df = pd.read_parquet(raw_path)
+        df['PredictedError'] = (df['ErrorProbability'] >= thresh).astype(int)
+        df.to_parquet(raw_path, index=False)
+
+        partials = merge_partials(partials, compute_partials(df, part_number_col, shape_col, pkg_col, offset=offset))
+        _add_counts(counts, confusion_counts(df))
+        offset += len(df)
+    return partials, counts
+
+
+def predict_feeder_errors_streaming(
+    feeder_setup_path,
+    historical_merged_path=os.path.join(script_dir, 'PartUsage.csv'),
+    pipeline_path=os.path.join(script_dir, 'bomare_best_pipeline.pkl'),
+    file_prefix='predictions_output',
+    output_root='.',
+    chunk_rows=DEFAULT_CHUNK_ROWS,
+    prediction_cache_path=None,
+    regressor_path=None
+):
+    """
+    predict_feeder_errors for setups too large to hold in memory.
+
+    The file is read chunk_rows rows at a time; each chunk goes through history
+    join, prediction and aggregation, its scored rows and original rows are staged
+    as Parquet parts, and only the mergeable counters of aggregations.py, the
+    confusion counts and the chunk's distinct keys are kept across chunks. Peak
+    memory therefore depends on chunk_rows and the number of distinct slots, not
+    on the file size.
+
+    The predictions table is merged from the staged parts once every chunk is
+    scored, so keys repeated across chunks fan out as in memory and the tables are
+    those of predict_feeder_errors. If the model flags nothing in the whole file,
+    the 95th-percentile fallback needs every probability, so the stored chunks are
+    re-labelled in a second pass first.
+    """
+    model = get_model(pipeline_path, regressor_path)
+    features = model['input_features']
+
+    store = begin_tables(output_root)
+    try:
+        partials = None
+        counts = {}
+        cache_counts = None
+        rate_counts = None
+        regression = None
+        offset = 0
+        part_number_col = shape_col = pkg_col = None
+        identity = None
+        fallback_threshold = None
+        chunk_keys = []
+
+        start = time.perf_counter()
+        layout = detect_layout(feeder_setup_path)
+        parse_time = time.perf_counter() - start
+        rows = 0
+        chunks = iter_feeder_setup(feeder_setup_path, chunk_rows, layout)
+        while True:
+            start = time.perf_counter()
+            fs = next(chunks, None)
+            parse_time += time.perf_counter() - start
+            if fs is None:
+                break
+            rows += len(fs)
+            positions = pop_positions(fs)
+            fs_original = fs.copy()
+            if identity is None:
+                identity = setup_identity(fs_original)
+
+            slots = setup_slots(fs, positions)
+            part_number_col = slots['part_number_col']
+            if 'Position' not in fs_original.columns:
+                fs_original['Position'] = slots['positions']
+
+            df = model_rows(slots['slots'], part_number_col, features, historical_merged_path)
+
+            cached = score_prepared(model, [df], prediction_cache_path)
+            df['ErrorProbability'] = cached['probabilities']
+            df['PredictedError'] = cached['labels']
+            cache_counts = add_cache_stats(cache_counts, cache_stats(cached['sources']))
+            regression = cached['regression']
+            if regression is not None:
+                add_regression(df, regression)
+                rate_counts = add_error_rate_counts(rate_counts, error_rate_counts(df))
+
+            shape_col = next((c for c in ['PartShapeName', 'Shape'] if c in df.columns), None)
+            pkg_col = 'PackageName' if 'PackageName' in df.columns else None
+            df['Module'] = position_modules(df['Position'])
+
+            append_table(store, 'raw', df)
+            append_table(store, SOURCE_TABLE, fs_original)
+            chunk_keys.append(_chunk_keys(df, fs_original, part_number_col, len(chunk_keys)))
+
+            partials = merge_partials(partials, compute_partials(df, part_number_col, shape_col, pkg_col, offset=offset))
+            _add_counts(counts, confusion_counts(df))
+            offset += len(df)
+
+        if offset == 0:
+            raise ValueError('Feeder setup contains no rows')
+
+        if counts['tp'] + counts['fp'] == 0:
+            probabilities = np.concatenate([
+                pd.read_parquet(p, columns=['ErrorProbability'])['ErrorProbability'].to_numpy()
+                for p in _staged_parts(store, 'raw')
+            ])
+            thresh = np.percentile(probabilities, 95)
+            del probabilities
+            partials, counts = _relabel(store, part_number_col, shape_col, pkg_col, thresh)
+            fallback_threshold = float(thresh)
+        _write_predictions(store, part_number_col, prediction_columns(df),
+                           _shared_keys(chunk_keys, ['Position', part_number_col]))
+
+        metrics = metrics_from_counts(counts)
+        report = finalize_report(partials, metrics['total_errors'], part_number_col, shape_col, pkg_col)
+        for name, table in report['tables'].items():
+            write_table(store, name, table)
+        write_table(store, 'partials', partials_frame(partials))
+    except Exception:
+        discard_tables(store)
+        raise
+
+    stored = commit_tables(store, file_prefix)
+    output_paths = result_output_paths(stored)
+    json_output = assemble_json_output(
+        metrics, offset, report['summary'], stored['result_hash'], output_paths,
+        ingestion=ingestion_summary({'rows': rows, 'parse_time': parse_time, 'layout': layout,
+                                     'cached': is_setup_cache(feeder_setup_path)}),
+        prediction_cache=cache_counts,
+        state=incremental_state(identity, model['version'], counts, fallback_threshold,
+                                regression['version'] if regression else None),
+        error_rate_model=error_rate_summary(rate_counts, regression) if regression else None,
+    )
+
+    logger.info("Prediction tables saved in folder: %s", stored['folder'])
+    return {'json_output': json_output, 'output_paths': output_paths}
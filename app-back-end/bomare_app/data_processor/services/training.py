@@ -0,0 +1,399 @@
+import hashlib
+import os
+import pickle
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from sklearn.base import clone
+from sklearn.compose import ColumnTransformer
+from sklearn.ensemble import GradientBoostingClassifier, RandomForestClassifier
+from sklearn.impute import SimpleImputer
+from sklearn.linear_model import LogisticRegression
+from sklearn.metrics import accuracy_score, f1_score, get_scorer, precision_score, recall_score
+from sklearn.model_selection import ParameterGrid, StratifiedKFold, train_test_split
+from sklearn.neighbors import KNeighborsClassifier
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import OneHotEncoder, StandardScaler
+from sklearn.svm import SVC
+
+from .backend_file1 import feature_matrix, prepare_setup
+from .history_store import DEFAULT_HISTORY_PATH, read_history_csv
+from .ingestion import read_feeder_setup
+from .lookup_tables import (
+    PART_MEAN_COLUMN, build_lookup_tables, export_lookup_tables, lookups_path_for, tables_from_arrays,
+)
+from .model_registry import DEFAULT_PIPELINE_PATH
+
+# Inputs of the production pipeline, in the order its ColumnTransformer takes them
+NUMERIC_FEATURES = [
+    'FeedPitch', 'PTPMNH', 'VT', 'SizeX', 'SizeY', 'Height', 'Pickup', 'NoPick', 'Usage', 'Reject', 'Error',
+    'Dislodge', 'Pickup Rate', 'Reject Rate', 'Error Rate', 'Dislodge Rate', 'Success Rate',
+]
+CATEGORICAL_FEATURES = [
+    'PartNumber', 'FeederName', 'Status', 'Shape', 'PackageName', 'PartComment', 'FeederType', 'TapeWidth',
+    'Position', 'FIDL',
+]
+TARGET = 'HasError'
+
+# Search modes of train_pipeline
+GRID = 'grid'
+HALVING = 'halving'
+
+# The notebook's five model families, as classifiers of HasError (Ridge becomes a
+# logistic regression); every estimator must have predict_proba for the scoring code
+FAMILIES = {
+    'LogisticRegression': (
+        LogisticRegression(max_iter=1000),
+        {'C': [0.01, 0.1, 1.0, 10.0]},
+    ),
+    'RandomForest': (
+        RandomForestClassifier(random_state=42),
+        {'n_estimators': [50, 100], 'max_depth': [None, 10, 20]},
+    ),
+    'GradientBoosting': (
+        GradientBoostingClassifier(random_state=42),
+        {'n_estimators': [50, 100], 'learning_rate': [0.01, 0.1], 'max_depth': [3, 5]},
+    ),
+    'SVC': (
+        SVC(kernel='rbf', probability=True, random_state=42),
+        {'C': [0.1, 1, 10], 'gamma': ['scale', 'auto']},
+    ),
+    'KNN': (
+        KNeighborsClassifier(),
+        {'n_neighbors': [3, 5, 7], 'weights': ['uniform', 'distance']},
+    ),
+}
+
+# Fold matrices of the worker process, set once by _init_worker
+_worker_folds = None
+
+
+def build_preprocessor(columns=()):
+    """
+    The production ColumnTransformer: median + scaling for numbers, 'missing' +
+    one-hot for text. PartNumber_MeanError is a numeric input when in columns.
+    """
+    numeric = NUMERIC_FEATURES + ([PART_MEAN_COLUMN] if PART_MEAN_COLUMN in columns else [])
+    return ColumnTransformer([
+        ('num', Pipeline([('imp', SimpleImputer(strategy='median')), ('sc', StandardScaler())]), numeric),
+        ('cat', Pipeline([
+            ('imp', SimpleImputer(strategy='constant', fill_value='missing')),
+            ('ohe', OneHotEncoder(handle_unknown='ignore')),
+        ]), CATEGORICAL_FEATURES),
+    ])
+
+
+def build_training_frame(setup_paths, historical_merged_path=DEFAULT_HISTORY_PATH, lookups=None):
+    """
+    Feature matrix and target of every slot of the given feeder setups, joined with
+    history exactly as at prediction time (read_feeder_setup + prepare_setup, and
+    feature_matrix with the lookup tables when given, which adds
+    PartNumber_MeanError). Slots without a part number are dropped, as in the notebook.
+    """
+    features = NUMERIC_FEATURES + ([PART_MEAN_COLUMN] if lookups is not None else []) + CATEGORICAL_FEATURES
+    frames = []
+    for path in setup_paths:
+        df = prepare_setup(read_feeder_setup(path)['frame'], features, historical_merged_path)['df']
+        frames.append(df[df['PartNumber'].notna() & df['Position'].notna()])
+
+    df = pd.concat(frames, ignore_index=True)
+    X = feature_matrix(df, features, lookups)
+    # Text columns reach the encoder as text, whatever the reader inferred
+    for col in CATEGORICAL_FEATURES:
+        X[col] = X[col].where(X[col].isna(), X[col].astype(str)).astype(object)
+    return {'X': X, 'y': df[TARGET].to_numpy(), 'rows': int(len(df))}
+
+
+def _stratified_order(y, random_state=42):
+    """Row order whose every prefix keeps the class proportions of y (subsamples for halving)"""
+    rng = np.random.RandomState(random_state)
+    keys = np.empty(len(y))
+    for label in np.unique(y):
+        rows = np.flatnonzero(y == label)
+        keys[rows[rng.permutation(len(rows))]] = (np.arange(len(rows)) + 0.5) / len(rows)
+    return np.argsort(keys, kind='stable')
+
+
+def fold_cache(X, y, cv=3, random_state=42):
+    """
+    Fit the preprocessor once per CV fold and keep its transformed train/validation
+    matrices: the preprocessor has no searched parameter, so every grid point of
+    every family can be fitted on the same matrices.
+    """
+    folds = []
+    splitter = StratifiedKFold(n_splits=cv, shuffle=True, random_state=random_state)
+    for train_idx, val_idx in splitter.split(X, y):
+        start = time.perf_counter()
+        pre = build_preprocessor(X.columns).fit(X.iloc[train_idx])
+        folds.append({
+            'X_train': pre.transform(X.iloc[train_idx]),
+            'y_train': y[train_idx],
+            'X_val': pre.transform(X.iloc[val_idx]),
+            'y_val': y[val_idx],
+            'order': _stratified_order(y[train_idx], random_state),
+            'fit_time': time.perf_counter() - start,
+        })
+    return folds
+
+
+def _init_worker(folds):
+    global _worker_folds
+    _worker_folds = folds
+
+
+def _evaluate(task):
+    """
+    Fit one candidate on one cached fold, on its first n_rows training rows (all
+    when None): (family, candidate, fold, score, seconds)
+    """
+    family, candidate, fold_index, estimator, scoring, n_rows = task
+    fold = _worker_folds[fold_index]
+    X_train, y_train = fold['X_train'], fold['y_train']
+    if n_rows is not None and n_rows < len(y_train):
+        rows = fold['order'][:n_rows]
+        X_train, y_train = X_train[rows], y_train[rows]
+    start = time.perf_counter()
+    estimator.fit(X_train, y_train)
+    score = get_scorer(scoring)(estimator, fold['X_val'], fold['y_val'])
+    return family, candidate, fold_index, float(score), time.perf_counter() - start
+
+
+def _score_candidates(family, candidates, folds, scoring, executor, n_rows=None):
+    """Mean validation score of every candidate over the folds, with the fit and wall times"""
+    base = FAMILIES[family][0]
+    tasks = [
+        (family, i, k, clone(base).set_params(**params), scoring, n_rows)
+        for i, params in enumerate(candidates)
+        for k in range(len(folds))
+    ]
+    start = time.perf_counter()
+    if executor is None:
+        _init_worker(folds)
+        results = [_evaluate(task) for task in tasks]
+    else:
+        results = list(executor.map(_evaluate, tasks))
+    wall_time = time.perf_counter() - start
+
+    scores = np.zeros((len(candidates), len(folds)))
+    for _, i, k, score, _ in results:
+        scores[i, k] = score
+    return {
+        'scores': scores.mean(axis=1),
+        'fits': len(tasks),
+        'fit_time': float(sum(r[4] for r in results)),
+        'wall_time': wall_time,
+    }
+
+
+def _search(X, y, families, cv, workers, search_family):
+    """Run search_family(family, folds, executor) for every family on shared fold matrices"""
+    families = families or list(FAMILIES)
+    workers = workers or os.cpu_count() or 1
+
+    folds = fold_cache(X, y, cv)
+    report = {
+        'families': {},
+        'preprocess_time': sum(f['fit_time'] for f in folds),
+        'preprocessor_fits': len(folds),
+        'preprocessor_fits_without_cache': 0,
+    }
+
+    executor = ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(folds,)) if workers > 1 else None
+    try:
+        for family in families:
+            result = search_family(family, folds, executor)
+            report['families'][family] = result
+            report['preprocessor_fits_without_cache'] += result['fits']
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return report
+
+
+def grid_search(X, y, families=None, cv=3, scoring='f1', workers=None):
+    """
+    GridSearchCV over several model families with the preprocessing shared: folds
+    are transformed once (fold_cache) and the (candidate, fold) fits of a family
+    run in a process pool of `workers` processes (1 runs them in this process).
+
+    Returns {'families': {name: best params, cv score, timings}, 'preprocess_time',
+    'preprocessor_fits', 'preprocessor_fits_without_cache'}.
+    """
+    def search_family(family, folds, executor):
+        candidates = list(ParameterGrid(FAMILIES[family][1]))
+        scored = _score_candidates(family, candidates, folds, scoring, executor)
+        best = int(np.argmax(scored['scores']))  # first best on ties, as GridSearchCV
+        return {
+            'best_params': candidates[best],
+            'cv_score': float(scored['scores'][best]),
+            'candidates': len(candidates),
+            'fits': scored['fits'],
+            'fit_time': scored['fit_time'],
+            'wall_time': scored['wall_time'],
+        }
+
+    return _search(X, y, families, cv, workers, search_family)
+
+
+def halving_search(X, y, families=None, cv=3, scoring='f1', workers=None, factor=3, min_rows=None):
+    """
+    Successive halving over the training rows, on the same shared folds as
+    grid_search: every candidate is first fitted on min_rows rows of each fold,
+    only the best 1/factor go on to factor times more rows, and a family stops as
+    soon as one candidate is left or every row has been used. min_rows defaults
+    to what lets the grid shrink to one candidate by the full fold size (at least
+    50 rows, and never fewer than 10 per fold and class).
+
+    Per family, 'rungs' lists the candidates and rows of every round, and the
+    fit and wall times of the full grid are estimated from the fits done on the
+    most rows (fit time taken as proportional to rows), so 'fit_time_saved' and
+    'wall_time_saved' report what the early stops saved. Same report layout as
+    grid_search otherwise.
+    """
+    def search_family(family, folds, executor):
+        candidates = list(ParameterGrid(FAMILIES[family][1]))
+        max_rows = min(len(f['y_train']) for f in folds)
+        n_rounds, left = 1, len(candidates)
+        while left > factor:
+            left = -(-left // factor)
+            n_rounds += 1
+        n_classes = len(np.unique(folds[0]['y_train']))
+        rows = min_rows or max(50, 10 * n_classes, max_rows // factor ** (n_rounds - 1))
+
+        result = {'candidates': len(candidates), 'fits': 0, 'fit_time': 0.0, 'wall_time': 0.0, 'rungs': []}
+        alive = list(range(len(candidates)))
+        while True:
+            rows = min(rows, max_rows)
+            scored = _score_candidates(family, [candidates[i] for i in alive], folds, scoring, executor, rows)
+            result['fits'] += scored['fits']
+            result['fit_time'] += scored['fit_time']
+            result['wall_time'] += scored['wall_time']
+            result['rungs'].append({
+                'candidates': len(alive),
+                'rows': rows,
+                'best_score': float(scored['scores'].max()),
+                'wall_time': scored['wall_time'],
+            })
+            ranked = np.argsort(-scored['scores'], kind='stable')  # first best on ties
+            full_rows_fit_time = scored['fit_time'] / scored['fits'] * max_rows / rows
+            if rows == max_rows or len(alive) <= factor:
+                best = alive[int(ranked[0])]
+                result['best_params'] = candidates[best]
+                result['cv_score'] = float(scored['scores'][ranked[0]])
+                break
+            alive = [alive[int(i)] for i in ranked[:int(np.ceil(len(alive) / factor))]]
+            rows *= factor
+
+        result['full_grid_fits'] = len(candidates) * len(folds)
+        result['estimated_full_grid_fit_time'] = full_rows_fit_time * result['full_grid_fits']
+        result['fit_time_saved'] = result['estimated_full_grid_fit_time'] - result['fit_time']
+        # Same share of the fit time spent in parallel as the halving rounds
+        parallelism = result['wall_time'] / result['fit_time'] if result['fit_time'] else 1.0
+        result['estimated_full_grid_wall_time'] = result['estimated_full_grid_fit_time'] * parallelism
+        result['wall_time_saved'] = result['estimated_full_grid_wall_time'] - result['wall_time']
+        return result
+
+    return _search(X, y, families, cv, workers, search_family)
+
+
+def _test_metrics(pipeline, X, y):
+    y_pred = pipeline.predict(X)
+    return {
+        'accuracy': float(accuracy_score(y, y_pred)),
+        'precision': float(precision_score(y, y_pred, zero_division=0)),
+        'recall': float(recall_score(y, y_pred, zero_division=0)),
+        'f1_score': float(f1_score(y, y_pred, zero_division=0)),
+    }
+
+
+def save_pipeline(pipeline, output_path, historical_merged_path=None):
+    """
+    Pickle the pipeline next to its target and move it in place (the registry
+    hot-reloads it). With a history path, the lookup tables built from it are
+    written first, tagged with the pipeline's version, so the scoring code never
+    pairs them with another pipeline.
+    """
+    data = pickle.dumps(pipeline)
+    if historical_merged_path:
+        export_lookup_tables(historical_merged_path, lookups_path_for(output_path),
+                             pipeline_version=hashlib.sha256(data).hexdigest())
+    partial_path = f'{output_path}.{os.getpid()}.partial'
+    with open(partial_path, 'wb') as f:
+        f.write(data)
+    os.replace(partial_path, output_path)
+
+
+def train_pipeline(setup_paths, historical_merged_path=DEFAULT_HISTORY_PATH, output_path=DEFAULT_PIPELINE_PATH,
+                   families=None, cv=3, scoring='f1', workers=None, test_size=0.2, search=GRID, factor=3,
+                   compare_full=False, use_lookups=True):
+    """
+    The notebook's training loop as a function: build the training frame once,
+    hold out test_size of it, search every family's grid on the rest (grid_search,
+    or halving_search with search=HALVING), refit each family's best candidate as a
+    full pipeline and keep the one with the best test score. The winner is pickled
+    to output_path as Pipeline([('pre', ColumnTransformer), ('clf', estimator)]),
+    the layout the prediction code expects.
+
+    compare_full also runs the full grid after a halving search and reports the
+    measured wall time saved ('full_grid'). With use_lookups the history's lookup
+    tables (lookup_tables.py) impute Error Rate and add PartNumber_MeanError, and
+    are written next to the pipeline so predictions use the same values.
+
+    Returns the timing and score report, per family and overall.
+    """
+    start = time.perf_counter()
+    lookups = None
+    if use_lookups:
+        lookups = tables_from_arrays(build_lookup_tables(read_history_csv(historical_merged_path)))
+    data = build_training_frame(setup_paths, historical_merged_path, lookups)
+    X_train, X_test, y_train, y_test = train_test_split(
+        data['X'], data['y'], test_size=test_size, random_state=42, stratify=data['y'],
+    )
+    frame_time = time.perf_counter() - start
+
+    if search == HALVING:
+        report = halving_search(X_train, y_train, families, cv, scoring, workers, factor)
+        if compare_full:
+            full = grid_search(X_train, y_train, families, cv, scoring, workers)
+            for family, result in report['families'].items():
+                result['full_grid_wall_time'] = full['families'][family]['wall_time']
+                result['same_params_as_full_grid'] = result['best_params'] == full['families'][family]['best_params']
+            report['full_grid'] = {
+                'wall_time': sum(r['wall_time'] for r in full['families'].values()),
+                'wall_time_saved': sum(r['wall_time'] for r in full['families'].values())
+                - sum(r['wall_time'] for r in report['families'].values()),
+            }
+    else:
+        report = grid_search(X_train, y_train, families, cv, scoring, workers)
+
+    best_family, best_pipeline, best_score = None, None, -np.inf
+    for family, result in report['families'].items():
+        refit_start = time.perf_counter()
+        base = FAMILIES[family][0]
+        pipeline = Pipeline([
+            ('pre', build_preprocessor(X_train.columns)),
+            ('clf', clone(base).set_params(**result['best_params'])),
+        ]).fit(X_train, y_train)
+        result['refit_time'] = time.perf_counter() - refit_start
+        result['test'] = _test_metrics(pipeline, X_test, y_test)
+        result['test_score'] = float(get_scorer(scoring)(pipeline, X_test, y_test))
+        if result['test_score'] > best_score:
+            best_family, best_pipeline, best_score = family, pipeline, result['test_score']
+
+    save_pipeline(best_pipeline, output_path, historical_merged_path if use_lookups else None)
+    report.update({
+        'rows': data['rows'],
+        'train_rows': int(len(X_train)),
+        'test_rows': int(len(X_test)),
+        'scoring': scoring,
+        'search': search,
+        'lookups': use_lookups,
+        'workers': workers or os.cpu_count() or 1,
+        'frame_time': frame_time,
+        'best_family': best_family,
+        'output_path': output_path,
+        'total_time': time.perf_counter() - start,
+    })
+    return report
@@ -0,0 +1,102 @@
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import time
+
+import django
+from django.apps import apps
+
+logger = logging.getLogger(__name__)
+
+
+def worker_main(worker_index, poll_interval, once=False):
+    """Entry point of one worker process: claim pending jobs and run them until stopped"""
+    # Spawned processes start from a clean interpreter
+    if not apps.ready:
+        django.setup()
+
+    from django.db import close_old_connections
+
+    from .history_store import get_history
+    from django.conf import settings
+
+    from .job_queue import claim_jobs, keep_alive, run_jobs
+    from .compiled_scorer import get_model
+
+    worker_id = f'{socket.gethostname()}:{os.getpid()}:{worker_index}'
+    stopping = []
+    # Ctrl+C is handled by the supervisor, which then sends SIGTERM; finish the current job first
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.append(signum))
+
+    # Warm the per-process caches so the first job does not pay for them
+    get_model()
+    get_history()
+    logger.info("[%s] ready", worker_id)
+
+    while not stopping:
+        close_old_connections()
+        # Jobs waiting together are scored together (one model call, bulk inserts)
+        jobs = claim_jobs(worker_id, limit=settings.PROCESSING_BATCH_SIZE)
+        if not jobs:
+            if once:
+                break
+            time.sleep(poll_interval)
+            continue
+
+        logger.info("[%s] running job(s) %s", worker_id, ', '.join(f'#{job.id}' for job in jobs))
+        try:
+            with keep_alive(worker_id, jobs):
+                outcomes = run_jobs(jobs)
+        except Exception as e:
+            logger.exception("[%s] batch failed: %s", worker_id, e)
+            continue
+        for job in jobs:
+            error = outcomes.get(job.id, {}).get('error')
+            if error:
+                logger.error("[%s] job #%d failed: %s", worker_id, job.id, error)
+            else:
+                logger.info("[%s] job #%d completed", worker_id, job.id)
+
+    close_old_connections()
+    logger.info("[%s] stopped", worker_id)
+
+
+def run_worker_pool(concurrency, poll_interval, once=False):
+    """Start `concurrency` worker processes and supervise them until they exit"""
+    from django.db import connections
+
+    from .job_queue import requeue_stale_jobs
+
+    # Children must not inherit the parent's database connections
+    connections.close_all()
+
+    processes = [
+        multiprocessing.Process(
+            target=worker_main,
+            args=(index, poll_interval, once),
+            name=f'bomare-worker-{index}',
+        )
+        for index in range(concurrency)
+    ]
+    for process in processes:
+        process.start()
+
+    try:
+        while any(process.is_alive() for process in processes):
+            for process in processes:
+                process.join(timeout=poll_interval)
+            if not once:
+                released = requeue_stale_jobs()
+                if released['requeued'] or released['failed']:
+                    logger.warning("Stale jobs: %d requeued, %d failed", released['requeued'], released['failed'])
+    except KeyboardInterrupt:
+        logger.info("Stopping workers...")
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+        for process in processes:
+            process.join()
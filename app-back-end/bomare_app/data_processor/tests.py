@@ -1,3 +1,964 @@
-from django.test import TestCase
+import csv
+import gzip
+import hashlib
+import os
+import pickle
+import shutil
+import sqlite3
+import tempfile
+import zipfile
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook
+
+from django.conf import settings
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from .models.file import File
+from .models.job import ProcessingJob
+from .models.result import ProcessingResult
+from .models.upload import UploadSession
+from .models.user import User
+from .services import backend_file1, batch, job_queue, streaming
+from .services.aggregations import compute_partials, finalize_report, merge_partials, summarize_errors
+from .services.backend_file1 import predict_feeder_errors
+from .services.compiled_scorer import check_equivalence, export_scorer, get_model, load_scorer
+from .services.exports import read_table
+from .services.file_store import store_upload
+from .services.history_store import read_history_csv
+from .services.incremental import predict_feeder_errors_diff
+from .services.ingestion import (
+    FLOAT_COLUMNS, TEXT_COLUMNS, iter_feeder_setup, pop_positions, read_feeder_setup, setup_size,
+)
+from .services.lookup_tables import (
+    apply_lookups, build_lookup_tables, export_lookup_tables, load_lookup_tables, tables_from_arrays,
+)
+from .services.model_package import export_package, load_package, map_npz
+from .services.model_registry import _load_pickle, get_pipeline
+from .services.optimizer import optimize_assignments
+from .services.positions import build_positions, explode_positions, position_modules
+from .services.prediction_cache import (
+    DISK, MEMORY, SCORED, cache_stats, cached_score, clear_prediction_cache,
+)
+from .services.scoring import DEFAULT_REGRESSOR_PATH
+from .services.job_queue import (
+    COMPLETED, CREATED, DIFF, FAILED, FULL, PENDING, PROCESSING,
+    claim_jobs, create_jobs, requeue_stale_jobs, run_job, run_jobs,
+)
+from .services.setup_cache import READY, build_setup_cache, setup_path
+from .services.streaming import predict_feeder_errors_streaming
+from .utils.auth import generate_jwt_token
+
+# Sample setup of the repo: 840 slots, keys repeated across chunks of 200 rows
+FEEDER_SETUP = os.path.join(settings.BASE_DIR, 'uploads', 'user_1', 'FeederSetupA.csv')
+
+
+def make_user(name='tester'):
+    return User.objects.create(username=name, email=f'{name}@example.com', password_hash='x')
+
+
+def make_file(user, name='setup.csv'):
+    return File.objects.create(user=user, filename=name, file_type='csv', file_size=0,
+                               storage_path=f'/nonexistent/{name}', status='uploaded')
+
+
+class ChunkedUploadTests(TestCase):
+    """files/uploads/: init, put-chunk with offset, status, finalize"""
+
+    def setUp(self):
+        self.upload_dir = tempfile.mkdtemp()
+        patcher = mock.patch('data_processor.views.file.UPLOAD_DIR', self.upload_dir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(shutil.rmtree, self.upload_dir, ignore_errors=True)
+
+        self.user = make_user()
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {generate_jwt_token(self.user)}'}
+        self.data = bytes(range(256)) * 40
+        self.checksum = hashlib.sha256(self.data).hexdigest()
+
+    def init(self, size=None, checksum=None, filename='setup.dat'):
+        body = {'filename': filename, 'size': len(self.data) if size is None else size}
+        if checksum:
+            body['checksum'] = checksum
+        return self.client.post('/files/uploads/', body, content_type='application/json', **self.auth)
+
+    def put(self, upload_id, offset, body, **extra):
+        return self.client.put(f'/files/uploads/{upload_id}/chunk/?offset={offset}', body,
+                               content_type='application/octet-stream', **self.auth, **extra)
+
+    def finalize(self, upload_id, checksum=None):
+        body = {'checksum': checksum} if checksum else {}
+        return self.client.post(f'/files/uploads/{upload_id}/finalize/', body,
+                                content_type='application/json', **self.auth)
+
+    def test_chunks_and_finalize_create_the_file(self):
+        upload_id = self.init(checksum=self.checksum).json()['id']
+        for offset in range(0, len(self.data), 4096):
+            response = self.put(upload_id, offset, self.data[offset:offset + 4096])
+            self.assertEqual(response.status_code, 200)
+        self.assertFalse(File.objects.exists())
+
+        response = self.finalize(upload_id)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['content_hash'], self.checksum)
+        with open(response.json()['storage_path'], 'rb') as f:
+            self.assertEqual(f.read(), self.data)
+        session = UploadSession.objects.get(id=upload_id)
+        self.assertEqual(session.status, 'complete')
+        self.assertFalse(os.path.exists(session.partial_path))
+
+    def test_gap_is_refused(self):
+        upload_id = self.init().json()['id']
+        self.put(upload_id, 0, self.data[:100])
+        response = self.put(upload_id, 200, self.data[200:300])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['received'], 100)
+
+    def test_overlap_rewrites_from_offset(self):
+        upload_id = self.init(checksum=self.checksum).json()['id']
+        self.put(upload_id, 0, self.data[:3000])
+        # Sent again from an earlier offset, e.g. after a lost response
+        response = self.put(upload_id, 1000, self.data[1000:])
+        self.assertEqual(response.json()['received'], len(self.data))
+        self.assertEqual(self.finalize(upload_id).status_code, 201)
+
+    def test_resume_from_reported_offset(self):
+        upload_id = self.init(checksum=self.checksum).json()['id']
+        session = UploadSession.objects.get(id=upload_id)
+        # A dropped request wrote part of its chunk without recording it
+        self.put(upload_id, 0, self.data[:1000])
+        with open(session.partial_path, 'ab') as f:
+            f.write(self.data[1000:1500])
+
+        received = self.client.get(f'/files/uploads/{upload_id}/', **self.auth).json()['received']
+        self.assertEqual(received, 1500)
+        self.put(upload_id, received, self.data[received:])
+        self.assertEqual(self.finalize(upload_id).status_code, 201)
+
+    def test_checksum_mismatch_discards_the_upload(self):
+        upload_id = self.init().json()['id']
+        self.put(upload_id, 0, self.data)
+        response = self.finalize(upload_id, checksum='0' * 64)
+        self.assertEqual(response.status_code, 400)
+        session = UploadSession.objects.get(id=upload_id)
+        self.assertEqual(session.status, 'failed')
+        self.assertFalse(os.path.exists(session.partial_path))
+        self.assertFalse(File.objects.exists())
+        self.assertEqual(self.put(upload_id, 0, self.data).status_code, 409)
+
+    def test_incomplete_upload_is_not_finalized(self):
+        upload_id = self.init().json()['id']
+        self.put(upload_id, 0, self.data[:10])
+        response = self.finalize(upload_id, checksum=self.checksum)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['received'], 10)
+
+    def test_invalid_sizes_are_refused(self):
+        self.assertEqual(self.init(size=0).status_code, 400)
+        with override_settings(UPLOAD_MAX_BYTES=10):
+            self.assertEqual(self.init(size=11).status_code, 413)
+        upload_id = self.init().json()['id']
+        self.assertEqual(self.put(upload_id, 0, self.data, CONTENT_LENGTH='x').status_code, 400)
+        self.put(upload_id, 0, self.data)
+        self.assertEqual(self.put(upload_id, len(self.data), b'x').status_code, 400)
+
+    def test_repeat_finalize_returns_the_same_file(self):
+        upload_id = self.init(checksum=self.checksum).json()['id']
+        self.put(upload_id, 0, self.data)
+        first = self.finalize(upload_id)
+        again = self.finalize(upload_id)
+        self.assertEqual(again.status_code, 200)
+        self.assertEqual(again.json()['id'], first.json()['id'])
+        self.assertEqual(File.objects.count(), 1)
+
+    def test_sessions_of_other_users_are_hidden(self):
+        upload_id = self.init().json()['id']
+        other = {'HTTP_AUTHORIZATION': f'Bearer {generate_jwt_token(make_user("other"))}'}
+        self.assertEqual(self.client.get(f'/files/uploads/{upload_id}/', **other).status_code, 404)
+
+
+class JobQueueTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.files = [make_file(self.user, f'setup{i}.csv') for i in range(5)]
+
+    def test_claims_are_exclusive(self):
+        jobs = create_jobs(self.files)
+        first = claim_jobs('worker-a', limit=3)
+        second = claim_jobs('worker-b', limit=10)
+        self.assertEqual(len(first), 3)
+        self.assertEqual(len(second), 2)
+        self.assertFalse({job.id for job in first} & {job.id for job in second})
+        self.assertEqual({job.id for job in first + second}, {job.id for job in jobs})
+        self.assertEqual(claim_jobs('worker-c', limit=10), [])
+        for job in ProcessingJob.objects.all():
+            self.assertEqual(job.status, PROCESSING)
+            self.assertEqual(job.attempts, 1)
+
+    def test_claim_lost_to_another_worker_takes_the_next_jobs(self):
+        jobs = create_jobs(self.files[:2])
+        # Another worker claims the oldest job between the SELECT and the UPDATE
+        original_filter = ProcessingJob.objects.filter
+
+        def racing_filter(*args, **kwargs):
+            if 'id__in' in kwargs and kwargs.get('status') == PENDING:
+                ProcessingJob.objects.filter(id=jobs[0].id).update(status=PROCESSING, worker_id='worker-b')
+            return original_filter(*args, **kwargs)
+
+        with mock.patch.object(ProcessingJob.objects, 'filter', side_effect=racing_filter):
+            claimed = claim_jobs('worker-a', limit=1)
+        self.assertEqual([job.id for job in claimed], [jobs[1].id])
+        self.assertEqual(ProcessingJob.objects.get(id=jobs[0].id).worker_id, 'worker-b')
+
+    def test_created_jobs_are_not_claimed(self):
+        ProcessingJob.objects.create(file=self.files[0], status=CREATED)
+        self.assertEqual(claim_jobs('worker-a', limit=10), [])
+
+    def test_stale_jobs_are_requeued_then_failed(self):
+        job, = create_jobs(self.files[:1])
+        claim_jobs('worker-a')
+        old = timezone.now() - timedelta(hours=1)
+
+        ProcessingJob.objects.filter(id=job.id).update(heartbeat_at=timezone.now(), started_at=old)
+        self.assertEqual(requeue_stale_jobs(timeout=60, max_attempts=2), {'requeued': 0, 'failed': 0})
+
+        ProcessingJob.objects.filter(id=job.id).update(heartbeat_at=old)
+        self.assertEqual(requeue_stale_jobs(timeout=60, max_attempts=2), {'requeued': 1, 'failed': 0})
+
+        claim_jobs('worker-b')
+        ProcessingJob.objects.filter(id=job.id).update(heartbeat_at=old)
+        self.assertEqual(requeue_stale_jobs(timeout=60, max_attempts=2), {'requeued': 0, 'failed': 1})
+        self.assertEqual(ProcessingJob.objects.get(id=job.id).status, FAILED)
+        self.assertEqual(File.objects.get(id=self.files[0].id).status, 'error')
+
+
+class ExecuteProcessingTests(TestCase):
+    def setUp(self):
+        self.owner = make_user()
+        self.job = ProcessingJob.objects.create(file=make_file(self.owner), status=CREATED)
+
+    def execute(self, user, body=None):
+        return self.client.post(f'/jobs/{self.job.id}/execute/', body or {}, content_type='application/json',
+                                HTTP_AUTHORIZATION=f'Bearer {generate_jwt_token(user)}')
+
+    def test_jobs_of_other_users_are_not_found(self):
+        response = self.execute(make_user('other'), {'mode': DIFF})
+        self.assertEqual(response.status_code, 404)
+        job = ProcessingJob.objects.get(id=self.job.id)
+        self.assertEqual((job.status, job.mode), (CREATED, FULL))
+
+    @override_settings(PROCESSING_QUEUE_ENABLED=True)
+    def test_owner_queues_the_job(self):
+        response = self.execute(self.owner, {'mode': DIFF})
+        self.assertEqual(response.status_code, 202)
+        job = ProcessingJob.objects.get(id=self.job.id)
+        self.assertEqual((job.status, job.mode), (PENDING, DIFF))
+
+
+class ResultReuseTests(TestCase):
+    """Repeat uploads are completed from the stored result of the same content"""
+
+    versions = {'model_version': 'v', 'history_version': 'h'}
+
+    def setUp(self):
+        self.user = make_user()
+        tables_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tables_dir, ignore_errors=True)
+        table = os.path.join(tables_dir, 'raw.parquet')
+        open(table, 'wb').close()
+        performance = {'accuracy': 1.0, 'precision': 1.0, 'recall': 1.0, 'f1_score': 1.0,
+                       'total_samples': 1, 'error_rate': 0.0}
+        self.output = {'model_performance': performance, 'output_files': {'tables': {'raw': table}},
+                       'incremental': {'applied': True, 'previous_result_id': 1}}
+        patcher = mock.patch.object(job_queue, '_current_versions', return_value=self.versions)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def stored_result(self, user, content_hash='a' * 64):
+        file = File.objects.create(user=user, filename='setup.csv', file_type='csv', file_size=1,
+                                   storage_path='/nonexistent/setup.csv', content_hash=content_hash)
+        job = ProcessingJob.objects.create(file=file, status=COMPLETED)
+        return ProcessingResult.objects.create(job=job, ai_score=1.0, confidence_level=1.0, prediction_data=self.output,
+                                               content_hash=content_hash, **self.versions)
+
+    def repeat_job(self, user, mode=FULL, content_hash='a' * 64):
+        file = File.objects.create(user=user, filename='again.csv', file_type='csv', file_size=1,
+                                   storage_path='/nonexistent/again.csv', content_hash=content_hash)
+        return ProcessingJob.objects.create(file=file, status=PROCESSING, mode=mode)
+
+    def test_repeat_upload_is_served_from_the_stored_result(self):
+        result = self.stored_result(self.user)
+        outcome = run_job(self.repeat_job(self.user))
+        self.assertEqual(outcome['model_output']['reused_result_id'], result.id)
+        self.assertNotIn('incremental', outcome['model_output'])
+
+    def test_reused_diff_reports_no_diff(self):
+        self.stored_result(self.user)
+        job = self.repeat_job(self.user, mode=DIFF)
+        outcomes = run_jobs([job])
+        self.assertEqual(outcomes[job.id]['model_output']['incremental'],
+                         {'applied': False, 'reason': 'identical upload, result reused'})
+
+
+    def test_other_users_results_are_never_reused(self):
+        self.stored_result(make_user('other'))
+        job = self.repeat_job(self.user)
+        self.assertIsNone(job_queue._find_reusable(job, self.versions))
+        own = self.stored_result(self.user)
+        self.assertEqual(job_queue._find_reusable(job, self.versions), own)
+
+    def test_results_of_other_versions_or_without_tables_are_not_reused(self):
+        result = self.stored_result(self.user)
+        job = self.repeat_job(self.user)
+        self.assertIsNone(job_queue._find_reusable(job, dict(self.versions, model_version='w')))
+        os.remove(result.prediction_data['output_files']['tables']['raw'])
+        self.assertIsNone(job_queue._find_reusable(job, self.versions))
+
+    def test_uploads_are_stored_once_per_content(self):
+        upload_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, upload_dir, ignore_errors=True)
+        first = store_upload([b'a,b\n', b'1,2\n'], upload_dir, 'csv')
+        again = store_upload([b'a,b\n1,2\n'], upload_dir, 'csv')
+        self.assertEqual(first['content_hash'], hashlib.sha256(b'a,b\n1,2\n').hexdigest())
+        self.assertEqual(again['path'], first['path'])
+        self.assertEqual((first['existing'], again['existing']), (False, True))
+        with open(first['path'], 'rb') as f:
+            self.assertEqual(f.read(), b'a,b\n1,2\n')
+
+
+class RunJobsFailureTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        files = [make_file(self.user, f'setup{i}.csv') for i in range(2)]
+        self.jobs = create_jobs(files, status=PROCESSING)
+
+    def assert_all_failed(self, outcomes, message):
+        self.assertEqual(set(outcomes), {job.id for job in self.jobs})
+        for job in ProcessingJob.objects.filter(id__in=outcomes):
+            self.assertEqual(job.status, FAILED)
+            self.assertEqual(job.error_message, message)
+            self.assertEqual(job.file.status, 'error')
+            self.assertEqual(outcomes[job.id], {'error': message})
+
+    def test_model_that_cannot_load_fails_every_job(self):
+        with mock.patch.object(job_queue, 'get_model', side_effect=RuntimeError('no model')):
+            outcomes = run_jobs(self.jobs)
+        self.assert_all_failed(outcomes, 'no model')
+
+    def test_batch_that_raises_fails_every_job(self):
+        versions = {'model_version': 'v', 'history_version': 'h'}
+        with mock.patch.object(job_queue, '_current_versions', return_value=versions), \
+                mock.patch.object(job_queue, 'predict_feeder_errors_batch', side_effect=RuntimeError('boom')):
+            outcomes = run_jobs(self.jobs)
+        self.assert_all_failed(outcomes, 'boom')
+        self.assertFalse(ProcessingJob.objects.filter(status=COMPLETED).exists())
+
+    def test_batch_reports_model_errors_per_setup(self):
+        with mock.patch.object(batch, 'get_model', side_effect=RuntimeError('no model')):
+            outputs = batch.predict_feeder_errors_batch(['a.csv', 'b.csv'])
+        self.assertEqual(outputs, [{'error': 'no model'}, {'error': 'no model'}])
+
+
+class StreamingTests(TestCase):
+    def setUp(self):
+        self.output_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.output_root, ignore_errors=True)
+
+    def assert_same_tables(self, expected, actual):
+        for name in ['predictions', 'raw']:
+            a = read_table(expected['output_files'], name)
+            b = read_table(actual['output_files'], name)
+            self.assertTrue(a.equals(b), name)
+        self.assertEqual(expected['model_performance'], actual['model_performance'])
+
+    def test_chunked_result_is_the_in_memory_result(self):
+        expected = predict_feeder_errors(FEEDER_SETUP, output_root=self.output_root)['json_output']
+        actual = predict_feeder_errors_streaming(FEEDER_SETUP, output_root=self.output_root,
+                                                 chunk_rows=200)['json_output']
+        self.assertEqual(len(read_table(expected['output_files'], 'predictions')), 1324)
+        self.assert_same_tables(expected, actual)
+        self.assertNotIn('source', actual['output_files']['tables'])
+
+    def test_relabelled_chunks_are_the_in_memory_fallback(self):
+        def flag_nothing(score):
+            def scored(*args, **kwargs):
+                result = score(*args, **kwargs)
+                result['labels'] = result['labels'] * 0
+                return result
+            return scored
+
+        with mock.patch.object(backend_file1, 'score_prepared', flag_nothing(backend_file1.score_prepared)), \
+                mock.patch.object(streaming, 'score_prepared', flag_nothing(streaming.score_prepared)):
+            expected = predict_feeder_errors(FEEDER_SETUP, output_root=self.output_root)['json_output']
+            actual = predict_feeder_errors_streaming(FEEDER_SETUP, output_root=self.output_root,
+                                                     chunk_rows=200)['json_output']
+        self.assertIsNotNone(actual['incremental_state']['fallback_threshold'])
+        self.assert_same_tables(expected, actual)
+
+
+def scored_frame(rows=2000, seed=0):
+    """Scored setup rows as predict_feeder_errors summarizes them, with missing values"""
+    rng = np.random.RandomState(seed)
+    positions = np.array([f'M{m}-{s:02d}' for m in range(1, 7) for s in range(1, 30)], dtype=object)
+    df = pd.DataFrame({
+        'Position': rng.choice(positions, rows),
+        'PartNumber': rng.choice(np.array([f'P{i}' for i in range(120)] + [None], dtype=object), rows),
+        'PartShapeName': rng.choice(np.array(['0402', '0603', 'SOT23', 'QFN', None], dtype=object), rows),
+        'PackageName': rng.choice(np.array(['Tape', 'Tray', 'Stick'], dtype=object), rows),
+        'TapeWidth': rng.choice([8.0, 12.0, 16.0, np.nan], rows),
+        'FeederType': rng.choice(np.array(['W08', 'W12', 'W16'], dtype=object), rows),
+        'PredictedError': (rng.rand(rows) < 0.1).astype(int),
+        'Error': rng.poisson(0.2, rows),
+    })
+    df['Module'] = df['Position'].str.extract(r'(M\d+)', expand=False)
+    return df
+
+
+class AggregationTests(TestCase):
+    """summarize_errors against the pandas expressions it replaced"""
+
+    def test_summary_matches_pandas(self):
+        df = scored_frame()
+        total_errors = int(df['PredictedError'].sum())
+        report = summarize_errors(df, 'PartNumber', 'PartShapeName', 'PackageName', total_errors)
+        summary = report['summary']
+
+        self.assertEqual(summary['unique_part_numbers'], df['PartNumber'].nunique())
+        self.assertEqual(summary['unique_feeder_ids'], df['Position'].nunique())
+        self.assertEqual(summary['most_used_feeder_id'], df['Position'].mode().iloc[0])
+        self.assertEqual(summary['part_number_count_per_feeder'],
+                         df.groupby('Position')['PartNumber'].count().to_dict())
+        self.assertEqual(summary['shape_distribution'], df['PartShapeName'].value_counts(normalize=True).to_dict())
+        self.assertEqual(summary['most_common_shape'], df['PartShapeName'].mode().iloc[0])
+        self.assertEqual(summary['most_common_package'], df['PackageName'].mode().iloc[0])
+        self.assertEqual(summary['tape_width_distribution'], df['TapeWidth'].value_counts(normalize=True).to_dict())
+        self.assertEqual(summary['feeder_type_distribution'], df['FeederType'].value_counts(normalize=True).to_dict())
+
+        flagged = df[df['PredictedError'] == 1]
+        for key, col in [('error_distribution_by_shape', 'PartShapeName'),
+                         ('error_distribution_by_part_number', 'PartNumber'),
+                         ('error_distribution_by_module', 'Module'),
+                         ('error_distribution_by_package', 'PackageName')]:
+            self.assertEqual(summary[key], flagged[col].value_counts().to_dict(), key)
+
+        for name, col in [('shape_errors', 'PartShapeName'), ('part_errors', 'PartNumber'),
+                          ('module_errors', 'Module'), ('package_errors', 'PackageName')]:
+            expected = df.groupby(col).agg({'PredictedError': ['sum', 'mean'], 'Position': 'count'}).reset_index()
+            expected.columns = [col, 'ErrorCount', 'ErrorRate', 'TotalCount']
+            expected['ErrorPercentage'] = expected['ErrorCount'] / expected['ErrorCount'].sum() * 100
+            expected = expected.sort_values('ErrorCount', ascending=False).reset_index(drop=True)
+            pd.testing.assert_frame_equal(report['tables'][name], expected, check_dtype=False, obj=name)
+
+    def test_merged_chunks_match_one_pass(self):
+        df = scored_frame()
+        partials = None
+        for start in range(0, len(df), 300):
+            chunk = df.iloc[start:start + 300]
+            partials = merge_partials(partials, compute_partials(chunk, 'PartNumber', 'PartShapeName', 'PackageName',
+                                                                 offset=start))
+        chunked = finalize_report(partials, 10, 'PartNumber', 'PartShapeName', 'PackageName')
+        whole = summarize_errors(df, 'PartNumber', 'PartShapeName', 'PackageName', 10)
+        self.assertEqual(chunked['summary'], whole['summary'])
+        for name, table in whole['tables'].items():
+            pd.testing.assert_frame_equal(chunked['tables'][name], table, obj=name)
+
+
+class PositionTests(TestCase):
+    """Vectorized positions against the per-row string chain they replaced"""
+
+    module = pd.Series(['01', '1', 1, '007', '', '0', np.nan, '12', '01', 3.0] * 3, dtype=object)
+    location = pd.Series(["'0011", '11', "'007,'008", '0', '', 5, np.nan, "'B-12-02", "'0011", '10,11'] * 3,
+                         dtype=object)
+
+    def test_positions_match_string_chain(self):
+        expected = (self.module.astype(str).str.lstrip('0').replace('', '0').map(lambda m: f"M{m}") + '-' +
+                    self.location.astype(str).str.replace("'", "").str.lstrip('0').replace('', '0'))
+        positions = build_positions(self.module, self.location)
+        self.assertEqual(positions.tolist(), expected.tolist())
+        # Memoized values from the first call give the same result
+        self.assertEqual(build_positions(self.module, self.location).tolist(), expected.tolist())
+
+    def test_explode_and_modules_match_pandas(self):
+        df = pd.DataFrame({'Position': build_positions(self.module, self.location), 'Row': range(len(self.module))})
+        expected = df.assign(Position=df['Position'].str.split(',')).explode('Position').reset_index(drop=True)
+        exploded = explode_positions(df)
+        pd.testing.assert_frame_equal(exploded, expected, check_dtype=False)
+        self.assertEqual(position_modules(exploded['Position']).tolist(),
+                         exploded['Position'].str.extract(r'(M\d+)', expand=False).tolist())
+
+
+def write_csv_variant(source, path, delimiter=',', newline='\n', footer=True):
+    """source rewritten with another delimiter, line ending, or without the TotalSlots footer"""
+    with open(source, newline='') as f:
+        rows = list(csv.reader(f))
+    if not footer:
+        rows = rows[:-2] + [['end'], ['end']]
+    with open(path, 'w', newline='') as f:
+        csv.writer(f, delimiter=delimiter, lineterminator=newline).writerows(rows)
+    return path
+
+
+class IngestionTests(TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir, ignore_errors=True)
+        self.variants = {
+            'comma': (write_csv_variant(FEEDER_SETUP, os.path.join(self.dir, 'comma.csv')), ','),
+            'semicolon': (write_csv_variant(FEEDER_SETUP, os.path.join(self.dir, 'semicolon.csv'), ';'), ';'),
+            'crlf': (write_csv_variant(FEEDER_SETUP, os.path.join(self.dir, 'crlf.csv'), newline='\r\n'), ','),
+            'no footer marker': (write_csv_variant(FEEDER_SETUP, os.path.join(self.dir, 'plain.csv'),
+                                                   footer=False), ','),
+        }
+
+    def baseline(self, path, delimiter):
+        """The former reader: python engine with skiprows/skipfooter, same column types"""
+        dtypes = {c: str for c in TEXT_COLUMNS}
+        dtypes.update({c: 'float64' for c in FLOAT_COLUMNS})
+        return pd.read_csv(path, skiprows=2, skipfooter=2, sep=delimiter, engine='python', dtype=dtypes)
+
+    def test_c_engine_matches_python_engine(self):
+        for name, (path, delimiter) in self.variants.items():
+            parsed = read_feeder_setup(path)
+            self.assertEqual(parsed['layout']['delimiter'], delimiter, name)
+            pd.testing.assert_frame_equal(parsed['frame'], self.baseline(path, delimiter), obj=name)
+
+    def test_chunks_concatenate_to_the_whole_setup(self):
+        path, _ = self.variants['semicolon']
+        frame = read_feeder_setup(path)['frame']
+        chunks = pd.concat(iter_feeder_setup(path, 100))
+        # Numeric columns are inferred per chunk, so only their values must match
+        pd.testing.assert_frame_equal(chunks, frame, check_dtype=False)
+
+
+class CompiledScorerTests(TestCase):
+    def test_compiled_scorer_matches_the_pipeline(self):
+        output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, output_dir, ignore_errors=True)
+        compiled = export_scorer(output_path=os.path.join(output_dir, 'pipeline.scorer.npz'))
+        scorer = load_scorer(compiled['path'])
+
+        features = get_pipeline()['features']
+        prepared = backend_file1.prepare_setup(read_feeder_setup(FEEDER_SETUP)['frame'], features)
+        X = backend_file1.feature_matrix(prepared['df'], features).reset_index(drop=True)
+        # Missing values and categories the encoder never saw
+        edited = X.copy()
+        edited.iloc[::3, 0] = np.nan
+        for c in scorer['features'][len(scorer['num_features']):]:
+            edited.loc[1::4, c] = 'never seen'
+        X = pd.concat([X, edited], ignore_index=True)[scorer['features']]
+
+        check = check_equivalence(compiled['pipeline'], scorer, X)
+        self.assertEqual(check['rows'], 2 * len(prepared['df']))
+        self.assertTrue(check['equivalent'], check)
+
+
+class PredictionCacheTests(TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir, ignore_errors=True)
+        self.path = os.path.join(self.dir, 'predictions.sqlite3')
+        clear_prediction_cache()
+        self.addCleanup(clear_prediction_cache)
+        self.scored = []
+
+    def score(self, X):
+        self.scored.append(len(X))
+        probabilities = (X['Width'].fillna(0).to_numpy() % 10) / 10
+        return probabilities, (probabilities >= 0.5).astype(int)
+
+    def rows(self):
+        return pd.DataFrame({
+            'Position': ['M1-1', 'M1-2', 'M1-2', 'M2-1'],
+            'PartNumber': ['A', 'B', 'B', None],
+            'Width': [3, 7, 7, np.nan],
+            'Shape': ['0402', 'QFN', 'QFN', None],
+        })
+
+    def test_rows_are_scored_once(self):
+        first = cached_score(self.score, self.rows(), 'v1', self.path)
+        self.assertEqual(self.scored, [3])  # the repeated row is scored once
+        self.assertEqual(first['sources'].tolist(), [SCORED] * 4)
+        np.testing.assert_array_equal(first['probabilities'], [0.3, 0.7, 0.7, 0.0])
+
+        again = cached_score(self.score, self.rows(), 'v1', self.path)
+        self.assertEqual(self.scored, [3])
+        self.assertEqual(again['sources'].tolist(), [MEMORY] * 4)
+        np.testing.assert_array_equal(again['probabilities'], first['probabilities'])
+        np.testing.assert_array_equal(again['labels'], first['labels'])
+        self.assertEqual(cache_stats(again['sources'])['hit_rate'], 1.0)
+
+    def test_other_processes_read_the_store(self):
+        cached_score(self.score, self.rows(), 'v1', self.path)
+        clear_prediction_cache()
+        # Same values with another dtype, stacked after a new row
+        rows = pd.concat([pd.DataFrame({'Position': ['M3-1'], 'PartNumber': ['C'], 'Width': [1.0],
+                                        'Shape': ['0603']}), self.rows()], ignore_index=True)
+        result = cached_score(self.score, rows, 'v1', self.path)
+        self.assertEqual(result['sources'].tolist(), [SCORED] + [DISK] * 4)
+        self.assertEqual(self.scored, [3, 1])
+
+    def test_new_model_version_misses_and_prunes_the_old_one(self):
+        cached_score(self.score, self.rows(), 'v1', self.path)
+        result = cached_score(self.score, self.rows(), 'v2', self.path)
+        self.assertEqual(result['sources'].tolist(), [SCORED] * 4)
+        with sqlite3.connect(self.path) as conn:
+            versions = conn.execute('SELECT model_version, COUNT(*) FROM predictions GROUP BY 1').fetchall()
+        self.assertEqual(versions, [('v2', 3)])
+
+
+def write_revised_setup(source, path):
+    """source with two part numbers swapped, one slot removed and one duplicated"""
+    with open(source, newline='') as f:
+        rows = list(csv.reader(f))
+    header, body, footer = rows[:3], [list(r) for r in rows[3:-2]], rows[-2:]
+    filled = [i for i, r in enumerate(body) if r[8]]
+    first, last = filled[0], filled[-1]
+    body[first][8], body[last][8] = body[last][8], body[first][8]
+    body.append(list(body[filled[10]]))
+    del body[filled[5]]
+    with open(path, 'w', newline='') as f:
+        csv.writer(f).writerows(header + body + footer)
+    return path
+
+
+class IncrementalTests(TestCase):
+    """predict_feeder_errors_diff against a full run of the same revision"""
+
+    def setUp(self):
+        self.output_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.output_root, ignore_errors=True)
+        self.revised = write_revised_setup(FEEDER_SETUP, os.path.join(self.output_root, 'revised.csv'))
+
+    def test_diff_is_the_full_run(self):
+        previous = predict_feeder_errors(FEEDER_SETUP, output_root=self.output_root)['json_output']
+        full = predict_feeder_errors(self.revised, output_root=self.output_root)['json_output']
+        diff = predict_feeder_errors_diff(
+            self.revised, lambda identity: {'result_id': 1, 'prediction_data': previous},
+            output_root=self.output_root,
+        )['json_output']
+
+        self.assertTrue(diff['incremental']['applied'])
+        self.assertEqual(diff['incremental']['added'], 3)
+        self.assertEqual(diff['incremental']['removed'], 3)
+        for name in ['predictions', 'raw', 'shape_errors', 'part_errors', 'module_errors', 'package_errors']:
+            a = read_table(full['output_files'], name)
+            b = read_table(diff['output_files'], name)
+            self.assertTrue(a.equals(b), name)
+        self.assertEqual(full['model_performance'], diff['model_performance'])
+
+    def test_no_previous_result_runs_in_full(self):
+        diff = predict_feeder_errors_diff(self.revised, lambda identity: None,
+                                          output_root=self.output_root)['json_output']
+        self.assertEqual(diff['incremental'], {'applied': False, 'reason': 'no previous result for this setup'})
+
+
+def history_frame(rows=3000, seed=0):
+    """PartUsage rows with missing error rates"""
+    rng = np.random.RandomState(seed)
+    return pd.DataFrame({
+        'Shape': rng.choice(['0402', '0603', 'QFN', 'SOT23'], rows),
+        'Position': rng.choice([f'M{m}-{s}' for m in range(1, 4) for s in range(1, 20)], rows),
+        'PartNumber': rng.choice([f'P{i}' for i in range(80)], rows),
+        'Error Rate': np.where(rng.rand(rows) < 0.3, np.nan, rng.rand(rows)),
+    })
+
+
+class LookupTableTests(TestCase):
+    """apply_lookups against the groupby imputation of the training notebook"""
+
+    def test_lookups_match_the_groupby_features(self):
+        history = history_frame()
+        rate = history['Error Rate']
+        imputed = (rate.fillna(rate.groupby([history['Shape'], history['Position']]).transform('mean'))
+                   .fillna(rate.mean()))
+        X = history.assign(PartNumber_MeanError=np.nan, ShapeErrMean=np.nan, PosErrMean=np.nan)
+
+        filled = apply_lookups(X, tables_from_arrays(build_lookup_tables(history)))
+        np.testing.assert_allclose(filled['Error Rate'], imputed)
+        np.testing.assert_allclose(filled['PartNumber_MeanError'],
+                                   imputed.groupby(history['PartNumber']).transform('mean'))
+        np.testing.assert_allclose(filled['ShapeErrMean'], rate.groupby(history['Shape']).transform('mean'))
+        np.testing.assert_allclose(filled['PosErrMean'], rate.groupby(history['Position']).transform('mean'))
+
+    def test_unknown_keys_get_the_global_mean(self):
+        history = history_frame()
+        tables = tables_from_arrays(build_lookup_tables(history))
+        X = pd.DataFrame({'Shape': ['BGA', '0402'], 'Position': ['M9-1', 'M9-1'], 'PartNumber': ['new', None],
+                          'Error Rate': [np.nan, np.nan], 'PartNumber_MeanError': [np.nan, np.nan]})
+        filled = apply_lookups(X, tables)
+        np.testing.assert_allclose(filled['Error Rate'], [history['Error Rate'].mean()] * 2)
+        np.testing.assert_allclose(filled['PartNumber_MeanError'], [history['Error Rate'].mean()] * 2)
+
+    def test_exported_tables_are_the_built_ones(self):
+        with tempfile.TemporaryDirectory() as folder:
+            history_path = os.path.join(folder, 'PartUsage.csv')
+            history_frame().to_csv(history_path, index=False)
+            path = export_lookup_tables(history_path, os.path.join(folder, 'model.lookups.npz'), 'v1')
+            loaded = load_lookup_tables(path)
+            built = tables_from_arrays(build_lookup_tables(read_history_csv(history_path), 'v1'))
+        self.assertEqual(loaded['pipeline_version'], 'v1')
+        for key in ['global_mean', 'group_means', 'part_means', 'shape_means', 'position_means']:
+            self.assertEqual(loaded[key], built[key], key)
+
+
+class UnifiedScoringTests(TestCase):
+    """score_prepared against separate predict_proba, predict and regressor calls"""
+
+    def setUp(self):
+        clear_prediction_cache()
+        self.addCleanup(clear_prediction_cache)
+        self.model = get_model(regressor_path=DEFAULT_REGRESSOR_PATH)
+        parsed = read_feeder_setup(FEEDER_SETUP)
+        self.df = backend_file1.prepare_setup(parsed['frame'], self.model['input_features'],
+                                              positions=parsed.get('positions'))['df']
+
+    def test_both_models_match_their_pipelines(self):
+        scored = backend_file1.score_prepared(self.model, [self.df])
+
+        pipeline = get_pipeline()['pipeline']
+        X = backend_file1.feature_matrix(self.df, self.model['features'], self.model['lookups'])
+        np.testing.assert_allclose(scored['probabilities'], pipeline.predict_proba(X)[:, 1], atol=1e-9)
+        np.testing.assert_array_equal(scored['labels'], pipeline.predict(X))
+
+        regressor = self.model['regressor']
+        X = backend_file1.feature_matrix(self.df, regressor['features'], regressor['lookups'])
+        X[regressor['categorical']] = X[regressor['categorical']].astype(object)
+        rates = regressor['pipeline'].predict(X)
+        np.testing.assert_allclose(scored['regression']['error_rates'], rates)
+        np.testing.assert_array_equal(scored['regression']['high_error_rate'], rates >= regressor['threshold'])
+
+    def test_stacked_setups_are_scored_as_each_alone(self):
+        halves = [self.df.iloc[:500], self.df.iloc[500:]]
+        stacked = backend_file1.score_prepared(self.model, halves)
+        clear_prediction_cache()
+        alone = [backend_file1.score_prepared(self.model, [half]) for half in halves]
+        np.testing.assert_array_equal(stacked['labels'], np.concatenate([a['labels'] for a in alone]))
+        np.testing.assert_allclose(stacked['probabilities'], np.concatenate([a['probabilities'] for a in alone]))
+        np.testing.assert_allclose(stacked['regression']['error_rates'],
+                                   np.concatenate([a['regression']['error_rates'] for a in alone]))
+
+
+class OptimizerTests(TestCase):
+    """optimize_assignments against scoring every slot's moves on their own"""
+
+    def setUp(self):
+        clear_prediction_cache()
+        self.addCleanup(clear_prediction_cache)
+        parsed = read_feeder_setup(FEEDER_SETUP)
+        setup = backend_file1.setup_slots(parsed['frame'], parsed.get('positions'))
+        self.slots = setup['slots'].reset_index(drop=True)
+        self.part_number_col = setup['part_number_col']
+        self.part_numbers = self.slots[self.part_number_col].dropna().unique()[:12].tolist()
+        self.model = get_model()
+
+    def score(self, rows):
+        """Classifier probability of setup rows, one per row as predict_feeder_errors scores them"""
+        rows = rows.reset_index(drop=True).assign(row=np.arange(len(rows)))
+        df = backend_file1.model_rows(rows, self.part_number_col, self.model['input_features'])
+        df = df.drop_duplicates('row')
+        return self.model['score'](backend_file1.feature_matrix(df, self.model['features'], self.model['lookups']))[0]
+
+    def test_moves_match_a_search_slot_by_slot(self):
+        result = optimize_assignments(FEEDER_SETUP, part_numbers=self.part_numbers, chunk_rows=97, top=50)
+        self.assertFalse(result['truncated'])
+
+        positions = pd.unique(self.slots['Position'].dropna())
+        expected = []
+        for i in np.flatnonzero(self.slots[self.part_number_col].isin(self.part_numbers)):
+            slot = self.slots.iloc[[i]]
+            current = self.score(slot)[0]
+            targets = positions[positions != slot['Position'].iloc[0]]
+            best = self.score(self.slots.iloc[[i] * len(targets)].assign(Position=targets)).min()
+            if best < current:
+                expected.append((slot[self.part_number_col].iloc[0], slot['Position'].iloc[0], current, best))
+
+        actual = [(a['PartNumber'], a['from_position'], a['current'], a['predicted']) for a in result['assignments']]
+        self.assertGreater(len(expected), 1)
+        self.assertEqual(sorted(actual), sorted(expected))
+
+    def test_budget_bounds_the_candidates(self):
+        result = optimize_assignments(FEEDER_SETUP, part_numbers=self.part_numbers, max_candidates=100)
+        self.assertTrue(result['truncated'])
+        self.assertLessEqual(result['candidates_scored'], 100)
+        self.assertGreater(result['candidates_total'], 100)
+
+
+class ModelPackageTests(TestCase):
+    """Memory-mapped models and arrays against the pickle and np.load"""
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir, ignore_errors=True)
+
+    def test_packaged_pipeline_predicts_as_the_pickle(self):
+        entry = get_pipeline()
+        path = export_package(entry['pipeline'], os.path.join(self.dir, 'pipeline.pkg'), 'v1')['path']
+        packaged = load_package(path)
+
+        prepared = backend_file1.prepare_setup(read_feeder_setup(FEEDER_SETUP)['frame'], entry['features'])
+        X = backend_file1.feature_matrix(prepared['df'], entry['features'])
+        np.testing.assert_array_equal(packaged.predict_proba(X), entry['pipeline'].predict_proba(X))
+        np.testing.assert_array_equal(packaged.predict(X), entry['pipeline'].predict(X))
+
+    def test_stale_package_is_ignored(self):
+        model = {'weights': np.arange(10000, dtype=np.float64)}
+        path = os.path.join(self.dir, 'model.pkl')
+        with open(path, 'wb') as f:
+            pickle.dump(model, f)
+        export_package({'weights': np.zeros(10000)}, os.path.join(self.dir, 'model.pkg'), 'not this file')
+        with self.assertLogs('data_processor.services.model_registry', 'WARNING'):
+            loaded = _load_pickle(path)
+        np.testing.assert_array_equal(loaded['weights'], model['weights'])
+
+    def test_mapped_npz_is_np_load(self):
+        path = os.path.join(self.dir, 'arrays.npz')
+        arrays = {
+            'large': np.arange(5000, dtype=np.float64).reshape(50, 100),
+            'fortran': np.asfortranarray(np.arange(6000, dtype=np.int32).reshape(60, 100)),
+            'small': np.arange(3),
+            'names': np.array(['a', 'bc']),
+            'scalar': np.array(1.5),
+        }
+        np.savez(path, **arrays)
+        mapped = map_npz(path)
+        self.assertEqual(set(mapped), set(arrays))
+        for name, values in arrays.items():
+            np.testing.assert_array_equal(mapped[name], values)
+            self.assertEqual(mapped[name].dtype, values.dtype)
+        self.assertFalse(mapped['large'].flags.writeable)
+
+
+class SetupCacheTests(TestCase):
+    """Setup caches against parsing their source"""
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir, ignore_errors=True)
+        self.source = shutil.copy(FEEDER_SETUP, os.path.join(self.dir, 'setup.csv'))
+        self.cache = build_setup_cache(self.source)['path']
+
+    def test_cache_read_is_the_parse(self):
+        parsed = read_feeder_setup(self.source)
+        cached = read_feeder_setup(self.cache)
+        self.assertTrue(cached['cached'])
+        self.assertEqual(cached['layout'], parsed['layout'])
+        pd.testing.assert_frame_equal(cached['frame'], parsed['frame'])
+        frame = parsed['frame']
+        pd.testing.assert_series_equal(cached['positions'], build_positions(frame['ModuleNumber'], frame['Location']),
+                                       check_names=False)
+
+    def test_cache_chunks_are_the_parsed_chunks(self):
+        chunks = list(iter_feeder_setup(self.cache, 200))
+        self.assertEqual([len(chunk) for chunk in chunks], [200, 200, 200, 200, 40])
+        whole = pd.concat(chunks)
+        positions = pop_positions(whole)
+        pd.testing.assert_frame_equal(whole, read_feeder_setup(self.source)['frame'])
+        pd.testing.assert_series_equal(positions, read_feeder_setup(self.cache)['positions'])
+
+    def test_predictions_from_the_cache_are_the_same(self):
+        expected = predict_feeder_errors(self.source, output_root=self.dir)['json_output']
+        actual = predict_feeder_errors(self.cache, output_root=self.dir)['json_output']
+        for name in ['predictions', 'raw']:
+            self.assertTrue(read_table(expected['output_files'], name).equals(
+                read_table(actual['output_files'], name)), name)
+        self.assertEqual(expected['model_performance'], actual['model_performance'])
+
+    def test_execution_reads_the_cache_once_ready(self):
+        file = make_file(make_user(), 'setup.csv')
+        file.storage_path = os.path.join(self.dir, 'upload.csv')
+        self.assertEqual(setup_path(file), file.storage_path)
+        file.cache_path, file.cache_status = self.cache, READY
+        self.assertEqual(setup_path(file), self.cache)
+
+
+def _workbook_cell(text):
+    """A CSV field as Excel stores it: empty, a number when the text is one, else text"""
+    if text == '':
+        return None
+    try:
+        value = float(text)
+    except ValueError:
+        return text
+    if value.is_integer() and str(int(value)) == text:
+        return int(value)
+    return value if repr(value) == text else text
+
+
+def write_workbook(source, path):
+    """The rows of a CSV setup as the first sheet of an .xlsx workbook"""
+    with open(source, newline='') as f:
+        rows = list(csv.reader(f))
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    for row in rows:
+        sheet.append([_workbook_cell(text) for text in row])
+    workbook.save(path)
+    return path
+
+
+class WorkbookTests(TestCase):
+    """Workbook setups against the CSV export of the same setup"""
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir, ignore_errors=True)
+        self.workbook = write_workbook(FEEDER_SETUP, os.path.join(self.dir, 'setup.xlsx'))
+
+    def test_workbook_is_read_as_the_csv(self):
+        parsed = read_feeder_setup(self.workbook)
+        pd.testing.assert_frame_equal(parsed['frame'], read_feeder_setup(FEEDER_SETUP)['frame'])
+        self.assertEqual(parsed['layout']['columns'], list(parsed['frame'].columns))
+
+    def test_workbook_chunks_concatenate_to_the_whole_setup(self):
+        chunks = pd.concat(iter_feeder_setup(self.workbook, 200))
+        pd.testing.assert_frame_equal(chunks, read_feeder_setup(FEEDER_SETUP)['frame'], check_dtype=False)
+
+    def test_legacy_workbooks_are_refused(self):
+        path = os.path.join(self.dir, 'setup.xls')
+        open(path, 'wb').close()
+        with self.assertRaisesRegex(ValueError, 'legacy .xls'):
+            read_feeder_setup(path)
+
+
+class CompressedSetupTests(TestCase):
+    """.gz and .zip setups against the file they were compressed from"""
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir, ignore_errors=True)
+        with open(FEEDER_SETUP, 'rb') as f:
+            self.content = f.read()
+        self.gz = os.path.join(self.dir, 'setup.csv.gz')
+        with gzip.open(self.gz, 'wb') as f:
+            f.write(self.content)
+        self.zip = os.path.join(self.dir, 'setup.zip')
+        with zipfile.ZipFile(self.zip, 'w', zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr('FeederSetupA.csv', self.content)
+
+    def test_compressed_setups_are_read_as_the_csv(self):
+        expected = read_feeder_setup(FEEDER_SETUP)
+        for path, compression in [(self.gz, 'gzip'), (self.zip, 'zip')]:
+            parsed = read_feeder_setup(path)
+            pd.testing.assert_frame_equal(parsed['frame'], expected['frame'], obj=compression)
+            self.assertEqual(parsed['layout']['compression'], compression)
+            self.assertEqual(parsed['layout']['delimiter'], expected['layout']['delimiter'])
+            self.assertEqual(setup_size(path), len(self.content))
+
+    def test_compressed_chunks_concatenate_to_the_whole_setup(self):
+        frame = read_feeder_setup(FEEDER_SETUP)['frame']
+        for path in [self.gz, self.zip]:
+            chunks = pd.concat(iter_feeder_setup(path, 200))
+            pd.testing.assert_frame_equal(chunks, frame, check_dtype=False, obj=path)
+
+    def test_zip_must_hold_one_setup(self):
+        path = os.path.join(self.dir, 'two.zip')
+        with zipfile.ZipFile(path, 'w') as archive:
+            archive.writestr('a.csv', self.content)
+            archive.writestr('b.csv', self.content)
+        with self.assertRaisesRegex(ValueError, 'exactly one feeder setup'):
+            read_feeder_setup(path)
@@ -15,6 +15,10 @@ urlpatterns = [
     path('users/<int:user_id>/reset-password/', views.reset_password, name='reset_password'),
 
     path('files/upload/', csrf_exempt(views.upload_file), name='upload_file'),
+    path('files/uploads/', csrf_exempt(views.init_upload), name='init_upload'),
+    path('files/uploads/<int:upload_id>/', views.get_upload_status, name='get_upload_status'),
+    path('files/uploads/<int:upload_id>/chunk/', csrf_exempt(views.upload_chunk), name='upload_chunk'),
+    path('files/uploads/<int:upload_id>/finalize/', csrf_exempt(views.finalize_upload), name='finalize_upload'),
     path('files/recent/', views.get_user_files, name='get_recent_uploads'),
     path('files/<int:file_id>/delete/',views.delete_file),
     path('files/<int:file_id>/', views.get_file_by_id, name='get_file_by_id'),
@@ -22,6 +26,7 @@ urlpatterns = [
 
     # Processing endpoints
     path('files/<int:file_id>/process/', views.process_file, name='process_file'),
+    path('files/batch/process/', views.process_files_batch, name='process_files_batch'),
     path('files/<int:file_id>/processing/', views.get_latest_file_processing,
          name='get_latest_file_processing'),
     path('jobs/<int:job_id>/status/', views.get_processing_status, name='get_processing_status'),
@@ -32,5 +37,8 @@ urlpatterns = [
 # Add to urls.py
 path('results/<int:result_id>/download/<str:export_type>/', views.download_export_file, name='download_export_file'),
 path('files/<int:file_id>/processing-history/', views.get_processing_history, name='get_file_processing_history'),
+    path('models/registry/', views.get_model_registry_stats, name='get_model_registry_stats'),
+    path('slots/score/', views.score_feeder_slots, name='score_feeder_slots'),
+    path('files/<int:file_id>/optimize/', views.optimize_feeder_assignments, name='optimize_feeder_assignments'),
 
 ]
\ No newline at end of file
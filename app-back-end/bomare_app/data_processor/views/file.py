@@ -5,21 +5,30 @@ from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework.response import Response
 from django.views.decorators.csrf import csrf_exempt
 import os
+import re
 from django.conf import settings
+from django.utils import timezone
 
 from ..models import ProcessingHistory
 from ..models.file import File
 from ..models.job import ProcessingJob
+from ..models.upload import UploadSession
 from ..serializers import ProcessingHistorySerializer
 from ..serializers.file import FileSerializer
 from ..serializers.processing import ProcessingJobSerializer
-from ..serializers.file import FileSerializer
+from ..services.file_store import (
+    commit_chunked_upload, expire_upload_sessions, received_bytes, session_path, store_upload, write_chunk,
+)
+from ..services.setup_cache import schedule_setup_cache
+from ..serializers.file import FileSerializer, UploadSessionSerializer
 from ..utils.auth import verify_jwt_token
 
 # Ensure uploads directory exists
 UPLOAD_DIR = os.path.join(settings.BASE_DIR, 'uploads')
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
+SHA256_PATTERN = re.compile(r'[0-9a-f]{64}')
+
 
 @csrf_exempt  # Add CSRF exemption
 @api_view(['POST'])
@@ -41,35 +50,220 @@ def upload_file(request):
     if not file:
         return Response({'error': 'No file provided'}, status=400)
 
-    # Create file path
     user_id = payload['user_id']
-    user_dir = os.path.join(UPLOAD_DIR, f'user_{user_id}')
-    os.makedirs(user_dir, exist_ok=True)
-
-    # Save file to disk
-    file_path = os.path.join(user_dir, file.name)
-    with open(file_path, 'wb+') as destination:
-        for chunk in file.chunks():
-            destination.write(chunk)
 
     # Determine file type
     file_type = file.name.split('.')[-1].lower()
 
+    # Save file to disk, once per content (hashed while it is written)
+    stored = store_upload(file.chunks(), UPLOAD_DIR, file_type)
+
+    serializer = _create_file(user_id, file.name, file_type, stored)
+    if serializer.instance is not None:
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+    return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+def _create_file(user_id, filename, file_type, stored):
+    """File row of a stored upload (see store_upload); the serializer holds its errors when invalid"""
     # Create file record in database
     file_data = {
         'user': user_id,
-        'filename': file.name,
+        'filename': filename,
         'file_type': file_type,
-        'file_size': file.size,
-        'storage_path': file_path,
+        'file_size': stored['size'],
+        'storage_path': stored['path'],
+        'content_hash': stored['content_hash'],
         'status': 'uploaded'  # Initial status
     }
 
     serializer = FileSerializer(data=file_data)
     if serializer.is_valid():
-        serializer.save()
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
-    return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        file_instance = serializer.save()
+        # Parse it now, in the background, so execution starts from the setup cache
+        schedule_setup_cache(file_instance)
+    return serializer
+
+
+@csrf_exempt
+@api_view(['POST'])
+def init_upload(request):
+    """
+    Start a chunked upload: {'filename', 'size', 'checksum' (sha256, optional
+    until finalize)}. Chunks are then PUT to files/uploads/<id>/chunk/?offset=N
+    and the File row is created by files/uploads/<id>/finalize/.
+    """
+    # Get token from Authorization header
+    auth_header = request.headers.get('Authorization')
+    if not auth_header or not auth_header.startswith('Bearer '):
+        return Response({'error': 'Authorization required'}, status=401)
+
+    # Extract and verify token
+    token = auth_header.split(' ')[1]
+    payload = verify_jwt_token(token)
+    if not payload:
+        return Response({'error': 'Invalid or expired token'}, status=401)
+
+    filename = os.path.basename(str(request.data.get('filename') or ''))
+    if not filename:
+        return Response({'error': 'No filename provided'}, status=400)
+    try:
+        total_size = int(request.data.get('size'))
+    except (TypeError, ValueError):
+        return Response({'error': 'size must be the file size in bytes'}, status=400)
+    if total_size < 1:
+        return Response({'error': 'size must be the file size in bytes'}, status=400)
+    if total_size > settings.UPLOAD_MAX_BYTES:
+        return Response({'error': 'File too large', 'max_size': settings.UPLOAD_MAX_BYTES}, status=413)
+    checksum = str(request.data.get('checksum') or '').lower()
+    if checksum and not SHA256_PATTERN.fullmatch(checksum):
+        return Response({'error': 'checksum must be a hex sha256'}, status=400)
+
+    # Sessions abandoned by their clients free their disk space here
+    expire_upload_sessions(settings.UPLOAD_SESSION_MAX_AGE)
+
+    session = UploadSession.objects.create(
+        user_id=payload['user_id'],
+        filename=filename,
+        file_type=filename.split('.')[-1].lower(),
+        total_size=total_size,
+        checksum=checksum,
+    )
+    session.partial_path = session_path(UPLOAD_DIR, session.id)
+    session.save(update_fields=['partial_path'])
+    return Response(UploadSessionSerializer(session).data, status=status.HTTP_201_CREATED)
+
+
+@api_view(['GET'])
+def get_upload_status(request, upload_id):
+    """State of a chunked upload; 'received' is the offset to resume from after a dropped connection"""
+    # Authenticate user
+    auth_header = request.headers.get('Authorization')
+    if not auth_header or not auth_header.startswith('Bearer '):
+        return Response({'error': 'Authorization required'}, status=401)
+
+    # Extract and verify token
+    token = auth_header.split(' ')[1]
+    payload = verify_jwt_token(token)
+    if not payload:
+        return Response({'error': 'Invalid or expired token'}, status=401)
+
+    session = get_object_or_404(UploadSession, id=upload_id, user=payload['user_id'])
+    if session.status == 'open':
+        # What is on disk, which a request dropped mid-chunk may not have recorded
+        session.received = received_bytes(session.partial_path)
+    return Response(UploadSessionSerializer(session).data)
+
+
+@csrf_exempt
+@api_view(['PUT'])
+def upload_chunk(request, upload_id):
+    """
+    Write the raw request body at ?offset=N of a chunked upload. The offset may
+    repeat bytes already received (a chunk sent again after a dropped
+    connection) but not skip any.
+    """
+    # Authenticate user
+    auth_header = request.headers.get('Authorization')
+    if not auth_header or not auth_header.startswith('Bearer '):
+        return Response({'error': 'Authorization required'}, status=401)
+
+    # Extract and verify token
+    token = auth_header.split(' ')[1]
+    payload = verify_jwt_token(token)
+    if not payload:
+        return Response({'error': 'Invalid or expired token'}, status=401)
+
+    session = get_object_or_404(UploadSession, id=upload_id, user=payload['user_id'])
+    if session.status != 'open':
+        return Response({'error': f'Upload is {session.status}'}, status=409)
+
+    try:
+        offset = int(request.query_params.get('offset'))
+    except (TypeError, ValueError):
+        return Response({'error': 'offset must be the byte position of the chunk'}, status=400)
+    length = request.META.get('CONTENT_LENGTH')
+    if not length:
+        return Response({'error': 'Content-Length required'}, status=411)
+    try:
+        length = int(length)
+    except ValueError:
+        return Response({'error': 'Content-Length must be the chunk size in bytes'}, status=400)
+    if length < 0:
+        return Response({'error': 'Content-Length must be the chunk size in bytes'}, status=400)
+
+    received = received_bytes(session.partial_path)
+    if offset < 0 or offset > received:
+        return Response({'error': 'Chunk does not continue the upload', 'received': received}, status=409)
+    if offset + length > session.total_size:
+        return Response({'error': 'Chunk ends past the declared size', 'total_size': session.total_size},
+                        status=400)
+
+    # The body is copied from the request stream, not parsed (no MultiPartParser, no request.data)
+    session.received = write_chunk(session.partial_path, offset, request.stream, length)
+    session.save(update_fields=['received', 'updated_at'])
+    return Response(UploadSessionSerializer(session).data)
+
+
+@csrf_exempt
+@api_view(['POST'])
+def finalize_upload(request, upload_id):
+    """
+    Finish a chunked upload: check the received bytes against the sha256 given
+    at init or here ({'checksum'}), store them as upload_file does and create
+    the File row. Finalizing a completed upload again returns the same File.
+    """
+    # Authenticate user
+    auth_header = request.headers.get('Authorization')
+    if not auth_header or not auth_header.startswith('Bearer '):
+        return Response({'error': 'Authorization required'}, status=401)
+
+    # Extract and verify token
+    token = auth_header.split(' ')[1]
+    payload = verify_jwt_token(token)
+    if not payload:
+        return Response({'error': 'Invalid or expired token'}, status=401)
+
+    session = get_object_or_404(UploadSession, id=upload_id, user=payload['user_id'])
+    if session.status == 'complete' and session.file is not None:
+        # A retry after the response was lost
+        return Response(FileSerializer(session.file).data)
+
+    checksum = str(request.data.get('checksum') or session.checksum).lower()
+    if not SHA256_PATTERN.fullmatch(checksum):
+        return Response({'error': 'A hex sha256 checksum is required'}, status=400)
+    if session.checksum and checksum != session.checksum:
+        return Response({'error': 'checksum differs from the one given at init'}, status=400)
+
+    received = received_bytes(session.partial_path)
+    if received != session.total_size:
+        return Response({'error': 'Upload is incomplete', 'received': received,
+                         'total_size': session.total_size}, status=409)
+
+    # Claim the session, so a concurrent finalize or chunk cannot touch the partial file
+    if not UploadSession.objects.filter(id=session.id, status='open').update(status='finalizing',
+                                                                           updated_at=timezone.now()):
+        return Response({'error': 'Upload is already being finalized'}, status=409)
+    try:
+        stored = commit_chunked_upload(session.partial_path, UPLOAD_DIR, checksum, session.file_type)
+    except Exception:
+        UploadSession.objects.filter(id=session.id).update(status='open')
+        raise
+    if stored is None:
+        UploadSession.objects.filter(id=session.id).update(status='failed')
+        return Response({'error': 'Checksum mismatch: the uploaded bytes were discarded, start a new upload'},
+                        status=400)
+
+    serializer = _create_file(session.user_id, session.filename, session.file_type, stored)
+    if serializer.instance is None:
+        UploadSession.objects.filter(id=session.id).update(status='failed')
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    session.status = 'complete'
+    session.received = received
+    session.checksum = checksum
+    session.file = serializer.instance
+    session.save(update_fields=['status', 'received', 'checksum', 'file', 'updated_at'])
+    return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 @api_view(['GET'])
 def get_user_files(request):
@@ -101,12 +295,8 @@ def delete_file(request, file_id):
     # Soft delete - mark as deleted
     file_instance.delete()
 
-    # Optional: Also delete from disk
-    try:
-        if os.path.exists(file_instance.storage_path):
-            os.remove(file_instance.storage_path)
-    except Exception as e:
-        return Response({'error': f'File marked deleted, but failed to remove from disk: {str(e)}'}, status=500)
+    # The bytes are removed from disk by the sweep_uploads command once no file
+    # points to them (other files may have the same content)
 
     return Response({'message': 'File deleted successfully'}, status=status.HTTP_200_OK)
 
@@ -11,6 +11,7 @@ import os
 import json
 from datetime import datetime
 from django.conf import settings
+from django.utils import timezone
 
 from ..models import Export, User, ProcessingHistory
 from ..models.file import File
@@ -20,6 +21,16 @@ from ..serializers.processing import ProcessingJobSerializer, ExportSerializer
 from ..serializers.processing import ProcessingResultSerializer
 from ..serializers.file import FileSerializer
 from ..services.backend_file1 import predict_feeder_errors
+from ..services.exports import EXPORT_ALIASES, EXPORT_EXTENSIONS, render_export
+from ..services.job_queue import (
+    COMPLETED, CREATED, DIFF, FAILED, FULL, PENDING, PROCESSING, create_jobs, enqueue_job, run_job, run_jobs,
+    start_job,
+)
+from ..services.model_registry import get_registry_stats
+from ..services.optimizer import optimize_assignments
+from ..services.prediction_cache import get_prediction_cache_stats
+from ..services.setup_cache import setup_path
+from ..services.slot_scoring import score_slots, validate_slots
 from ..utils.auth import verify_jwt_token
 from ..services import predict_feeder_errors_detailed
 
@@ -42,21 +53,86 @@ def process_file(request, file_id):
     # Get the file
     file_instance = get_object_or_404(File, id=file_id, user=user_id, is_deleted=False)
 
-    # Create a processing job
+    # Create a processing job; it is queued by jobs/<id>/execute/, so its mode can still be set there
     job = ProcessingJob.objects.create(
         file=file_instance,
-        status='pending',
+        status=CREATED,
     )
 
     # Update file status
     file_instance.status = 'processing'
-    file_instance.save()
+    file_instance.save(update_fields=['status'])
 
     # Return job details
     serializer = ProcessingJobSerializer(job)
     return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 
+@api_view(['POST'])
+def process_files_batch(request):
+    """
+    Create jobs for several files at once: {"file_ids": [1, 2, 3]}.
+
+    Queued jobs are claimed together by the workers and scored with a single
+    model call; with PROCESSING_QUEUE_ENABLED off they run in this request.
+    """
+    # Authenticate user
+    auth_header = request.headers.get('Authorization')
+    if not auth_header or not auth_header.startswith('Bearer '):
+        return Response({'error': 'Authorization required'}, status=401)
+
+    # Extract and verify token
+    token = auth_header.split(' ')[1]
+    payload = verify_jwt_token(token)
+    if not payload:
+        return Response({'error': 'Invalid or expired token'}, status=401)
+
+    user_id = payload['user_id']
+    user = get_object_or_404(User, id=user_id)
+
+    file_ids = request.data.get('file_ids')
+    if not isinstance(file_ids, list) or not file_ids:
+        return Response({'error': 'file_ids must be a non-empty list'}, status=400)
+    try:
+        file_ids = list(dict.fromkeys(int(file_id) for file_id in file_ids))
+    except (TypeError, ValueError):
+        return Response({'error': 'file_ids must contain integers'}, status=400)
+
+    files = {f.id: f for f in File.objects.filter(id__in=file_ids, user=user_id, is_deleted=False)}
+    missing = [file_id for file_id in file_ids if file_id not in files]
+    if missing:
+        return Response({'error': 'Files not found', 'file_ids': missing}, status=404)
+    files = [files[file_id] for file_id in file_ids]
+
+    if settings.PROCESSING_QUEUE_ENABLED:
+        jobs = create_jobs(files)
+        return Response({
+            'status': 'queued',
+            'job_ids': [job.id for job in jobs],
+            'jobs': ProcessingJobSerializer(jobs, many=True).data,
+        }, status=status.HTTP_202_ACCEPTED)
+
+    # Inline execution (development without workers)
+    jobs = create_jobs(files, status=PROCESSING)
+    outcomes = run_jobs(jobs, user=user)
+
+    results = []
+    for job in jobs:
+        outcome = outcomes.get(job.id, {})
+        results.append({
+            'job_id': job.id,
+            'file_id': job.file_id,
+            'status': job.status,
+            'result_id': outcome['result'].id if 'result' in outcome else None,
+            'error': outcome.get('error'),
+        })
+    failed = sum(1 for r in results if r['error'])
+    return Response({
+        'status': 'success' if not failed else ('failed' if failed == len(results) else 'partial'),
+        'jobs': results,
+    }, status=status.HTTP_200_OK)
+
+
 @api_view(['GET'])
 def get_processing_status(request, job_id):
     # Authenticate user
@@ -90,12 +166,18 @@ def get_processing_status(request, job_id):
     return Response(response_data)
 
 
-# This would typically be an async task, but we'll make it a separate endpoint because it is more simple
-
 @api_view(['POST'])
 def execute_processing(request, job_id):
-    # In production, this would be triggered by a worker/scheduler
-    # Authenticate as admin or system user
+    """
+    Queue a job for the background workers (python manage.py run_workers) and
+    return immediately; poll jobs/<id>/status/ for the result. With
+    PROCESSING_QUEUE_ENABLED off the prediction runs inside the request.
+
+    Optional body {"mode": "diff"} re-scores only the slots that changed since
+    the last result of the same line/setup (see services/incremental.py); the
+    mode can only change before the job is queued. A completed job is not run
+    again: its stored result is returned.
+    """
     auth_header = request.headers.get('Authorization')
     if not auth_header or not auth_header.startswith('Bearer '):
         return Response({'error': 'Authorization required'}, status=401)
@@ -108,154 +190,87 @@ def execute_processing(request, job_id):
 
     user_id = payload['user_id']
     user = get_object_or_404(User, id=user_id)
-    print("1")
-    # Get the job
-    job = get_object_or_404(ProcessingJob, id=job_id)
-    print("2")
+    # Get the job and ensure it belongs to the user
+    job = get_object_or_404(ProcessingJob, id=job_id, file__user=user_id)
 
-    # Update job status
-    job.status = 'processing'
-    job.started_at = datetime.now()
-    job.save()
-    print("3")
+    mode = request.data.get('mode', FULL)
+    if mode not in (FULL, DIFF):
+        return Response({'error': f'mode must be "{FULL}" or "{DIFF}"'}, status=400)
 
-    try:
-        # Get the file data
-        file_path = job.file.storage_path
-        file_type = job.file.file_type.lower()
-        print("4")
-
-        # Read the file
-        #if file_type in ['csv']:
-            #df = pd.read_csv(file_path)
-       # elif file_type in ['xls', 'xlsx', 'excel']:
-            #df = pd.read_excel(file_path)
-        #else:
-            #raise ValueError(f"Unsupported file type: {file_type}")
-
-        # Process with model
-        model_output = predict_feeder_errors(file_path)['json_output']
-        print(type(model_output))
-        import json
-        cleaned_output = make_json_serializable(model_output)
-
-
-        # Extract AI score from model output
-        ai_score = model_output['model_performance']['accuracy']
-        print("ai score khlas")
-
-        # Save prediction result
-        result = ProcessingResult.objects.create(
-            job=job,
-            ai_score=ai_score,
-            prediction_data=cleaned_output,  # Store the entire model output
-            confidence_level=ai_score # Use precision as confidence level
-        )
-        print("output result khlas")
-
-        # Update job status
-        job.status = 'completed'
-        job.completed_at = datetime.now()
-        job.save()
-        print("job status khlas")
-        # Update file status
-        job.file.status = 'processed'
-        job.file.save()
-        print("file status khlas")
-
-        # Save the historical data
-        ProcessingHistory.objects.create(
-            file=job.file,
-            accuracy=model_output['model_performance']['accuracy'],
-            precision=model_output['model_performance']['precision'],
-            recall=model_output['model_performance']['recall'],
-            f1_score=model_output['model_performance']['f1_score'],
-            total_samples=model_output['model_performance']['total_samples'],
-            #nan_samples=model_output['model_performance']['nan_samples'],
-            #predicted_errors=model_output['error_summary']['PredictedErrors'],
-            error_rate=model_output['model_performance']['error_rate'],
-            #top_shapes=model_output['top_shapes'],
-            #top_modules=model_output['top_modules'],
-            #top_error_partnumbers=model_output['top_error_partnumbers']
-        )
-        print("his data khlas")
-
-        # Create export records
-        exports = []
-        for export_key, file_path in model_output['output_files'].items():
-            if export_key == 'csv':
-                export_type = 'CSV'
-            elif export_key == 'excel':
-                export_type = 'Excel'
-            elif export_key == 'json':
-                export_type = 'JSON'
-            else:
-                export_type = 'Other'
-
-            export_obj = Export.objects.create(
-                user=user,
-                result=result,  # Link to the result object
-                export_type=export_type
-            )
-            exports.append(export_obj)
-
-        # Serialize export objects
-        export_serializer = ExportSerializer(exports, many=True)
-        print("export khlas")
-        # Prepare complete response data
-        response_data = {
-            'status': 'success',
-            'job_id': job.id,
-            'result_id': result.id,
-            'exports': export_serializer.data,
-            'model_output': {
-                # Include all the fields from model_output, preserving the original structure
-                'model_performance': model_output['model_performance'],
-                'total_parts': model_output.get('total_parts'),
-                'unique_part_numbers': model_output.get('unique_part_numbers'),
-                'unique_feeder_ids': model_output.get('unique_feeder_ids'),
-                'most_used_feeder_id': model_output.get('most_used_feeder_id'),
-                'part_number_count_per_feeder': model_output.get('part_number_count_per_feeder'),
-                'unique_shapes': model_output.get('unique_shapes'),
-                'shape_distribution': model_output.get('shape_distribution', {}),
-                'most_common_shape': model_output.get('most_common_shape'),
-                'unique_package_names': model_output.get('unique_package_names'),
-                'most_common_package': model_output.get('most_common_package'),
-                'package_type_distribution': model_output.get('package_type_distribution', {}),
-                'tape_width_distribution': model_output.get('tape_width_distribution', {}),
-                'feeder_type_distribution': model_output.get('feeder_type_distribution', {}),
-                'total_errors': model_output.get('total_errors'),
-                'error_rate': model_output.get('error_rate'),
-                'error_distribution_by_shape': model_output.get('error_distribution_by_shape', {}),
-                'shape_with_most_error': model_output.get('shape_with_most_error'),
-                'top_5_shapes_with_errors': model_output.get('top_5_shapes_with_errors', {}),
-                'all_shapes_errors': {'somth': 1},
-                'error_distribution_by_part_number': model_output.get('error_distribution_by_part_number', {}),
-                'part_number_with_most_error': model_output.get('part_number_with_most_error'),
-                'top_5_parts_with_errors': model_output.get('top_5_parts_with_errors', {}),
-                'all_parts_errors': model_output.get('all_parts_errors', {}),
-                'error_distribution_by_module': model_output.get('error_distribution_by_module', {}),
-                'module_with_most_error': model_output.get('module_with_most_error'),
-                'top_5_modules_with_errors': model_output.get('top_5_modules_with_errors', {}),
-                'all_modules_errors': model_output.get('all_modules_errors', {}),
-                'output_files': model_output.get('output_files')
-            }
-        }
+    if job.status != COMPLETED and job.mode != mode:
+        # Without workers nothing claims a queued job, so it can still change
+        changeable = (CREATED, FAILED) if settings.PROCESSING_QUEUE_ENABLED else (CREATED, PENDING, FAILED)
+        if not ProcessingJob.objects.filter(id=job.id, status__in=changeable).update(mode=mode):
+            return Response({'error': f'Job is already {job.status}, its mode can no longer change'}, status=409)
+        job.mode = mode
 
-        return Response(response_data, status=status.HTTP_200_OK)
-
-    except Exception as e:
-        # Handle error
-        job.status = 'failed'
-        job.error_message = str(e)
-        job.completed_at = datetime.now()
-        job.save()
+    if settings.PROCESSING_QUEUE_ENABLED:
+        enqueue_job(job)
+        return Response({
+            'status': 'completed' if job.status == COMPLETED else 'queued',
+            'job_id': job.id,
+            'job': ProcessingJobSerializer(job).data,
+        }, status=status.HTTP_200_OK if job.status == COMPLETED else status.HTTP_202_ACCEPTED)
+
+    # Inline execution (development without workers)
+    if start_job(job):
+        try:
+            outcome = run_job(job, user=user)
+        except Exception as e:
+            return Response({'error': str(e)}, status=500)
+    elif job.status == COMPLETED:
+        # Executed before: the stored result, not a second run
+        result = job.results.order_by('-created_at', '-id').first()
+        outcome = {'result': result, 'exports': result.exports.all(), 'model_output': result.prediction_data}
+    else:
+        return Response({'error': f'Job is already {job.status}'}, status=409)
 
-        # Update file status
-        job.file.status = 'error'
-        job.file.save()
+    model_output = outcome['model_output']
+    export_serializer = ExportSerializer(outcome['exports'], many=True)
+    # Prepare complete response data
+    response_data = {
+        'status': 'success',
+        'job_id': job.id,
+        'result_id': outcome['result'].id,
+        'exports': export_serializer.data,
+        'model_output': {
+            # Include all the fields from model_output, preserving the original structure
+            'model_performance': model_output['model_performance'],
+            'total_parts': model_output.get('total_parts'),
+            'unique_part_numbers': model_output.get('unique_part_numbers'),
+            'unique_feeder_ids': model_output.get('unique_feeder_ids'),
+            'most_used_feeder_id': model_output.get('most_used_feeder_id'),
+            'part_number_count_per_feeder': model_output.get('part_number_count_per_feeder'),
+            'unique_shapes': model_output.get('unique_shapes'),
+            'shape_distribution': model_output.get('shape_distribution', {}),
+            'most_common_shape': model_output.get('most_common_shape'),
+            'unique_package_names': model_output.get('unique_package_names'),
+            'most_common_package': model_output.get('most_common_package'),
+            'package_type_distribution': model_output.get('package_type_distribution', {}),
+            'tape_width_distribution': model_output.get('tape_width_distribution', {}),
+            'feeder_type_distribution': model_output.get('feeder_type_distribution', {}),
+            'total_errors': model_output.get('total_errors'),
+            'error_rate': model_output.get('error_rate'),
+            'error_distribution_by_shape': model_output.get('error_distribution_by_shape', {}),
+            'shape_with_most_error': model_output.get('shape_with_most_error'),
+            'top_5_shapes_with_errors': model_output.get('top_5_shapes_with_errors', {}),
+            'all_shapes_errors': {'somth': 1},
+            'error_distribution_by_part_number': model_output.get('error_distribution_by_part_number', {}),
+            'part_number_with_most_error': model_output.get('part_number_with_most_error'),
+            'top_5_parts_with_errors': model_output.get('top_5_parts_with_errors', {}),
+            'all_parts_errors': model_output.get('all_parts_errors', {}),
+            'error_distribution_by_module': model_output.get('error_distribution_by_module', {}),
+            'module_with_most_error': model_output.get('module_with_most_error'),
+            'top_5_modules_with_errors': model_output.get('top_5_modules_with_errors', {}),
+            'all_modules_errors': model_output.get('all_modules_errors', {}),
+            'incremental': model_output.get('incremental'),
+            'error_rate_model': model_output.get('error_rate_model'),
+            'reused_result_id': model_output.get('reused_result_id'),
+            'output_files': model_output.get('output_files')
+        }
+    }
 
-        return Response({'error': str(e)}, status=500)
+    return Response(response_data, status=status.HTTP_200_OK)
 
 
 
@@ -320,7 +335,7 @@ def get_latest_file_processing(request, file_id):
             'file': file_serializer.data,
             'job': job_serializer.data,
             'results': results_data,
-            'isLoading': latest_job.status in ['pending', 'processing'],
+            'isLoading': latest_job.status in [CREATED, PENDING, PROCESSING],
             'error': latest_job.error_message if latest_job.status == 'failed' else None
         })
 
@@ -407,22 +422,6 @@ def parse_json_export(file_path):
 
     return JsonResponse(data, safe=False)
 
-import numpy as np
-def make_json_serializable(obj):
-    if isinstance(obj, dict):
-        return {k: make_json_serializable(v) for k, v in obj.items()}
-    elif isinstance(obj, list):
-        return [make_json_serializable(v) for v in obj]
-    elif isinstance(obj, (np.ndarray,)):
-        return obj.tolist()
-    elif isinstance(obj, (np.float32, np.float64)):
-        return float(obj)
-    elif isinstance(obj, (np.int32, np.int64)):
-        return int(obj)
-    else:
-        return obj  # assume already serializable
-
-
 @api_view(['GET'])
 def download_export_file(request, result_id, export_type):
     """
@@ -440,29 +439,31 @@ def download_export_file(request, result_id, export_type):
         return Response({'error': 'Invalid or expired token'}, status=401)
 
     user_id = payload['user_id']
-    print("passed auth")
     # Get the result
     result = get_object_or_404(ProcessingResult, id=result_id)
-    print("passed result fetching")
     # Check if user has access to this result
     job = result.job
-    print("passed job thing")
     if job.file.user.id != user_id:
         return Response({'error': 'Unauthorized access'}, status=403)
 
     # Get file path from model_output
     try:
-        if (export_type == 'excel'):
-            export = 'xlsx'
-        export = 'csv'
-        file_path = result.prediction_data['output_files'][export]
-        print("passed file path")
+        export_key = EXPORT_ALIASES.get(export_type.lower())
+        if export_key is None:
+            raise KeyError(export_type)
+        # CSV/Excel/JSON exports are rendered from the Parquet tables on first download
+        file_path = render_export(
+            export_key,
+            result.prediction_data,
+            settings.EXPORT_CACHE_DIR,
+            max_bytes=settings.EXPORT_CACHE_MAX_BYTES,
+        )
         # Ensure file exists
         if not os.path.exists(file_path):
             return Response({'error': 'Export file not found'}, status=404)
 
         # Determine filename
-        filename = f"feeder-error-prediction-{job.id}.{export_type.lower()}"
+        filename = f"feeder-error-prediction-{job.id}.{EXPORT_EXTENSIONS[export_key]}"
 
         # Serve the file
         response = FileResponse(open(file_path, 'rb'))
@@ -472,4 +473,104 @@ def download_export_file(request, result_id, export_type):
     except KeyError:
         return Response({'error': f'Export file of type {export_type} not found'}, status=404)
     except Exception as e:
-        return Response({'error': str(e)}, status=500)
\ No newline at end of file
+        return Response({'error': str(e)}, status=500)
+
+
+@api_view(['GET'])
+def get_model_registry_stats(request):
+    """Model registry load times, hit/miss counters and prediction cache size for this worker process"""
+    # Authenticate user
+    auth_header = request.headers.get('Authorization')
+    if not auth_header or not auth_header.startswith('Bearer '):
+        return Response({'error': 'Authorization required'}, status=401)
+
+    # Extract and verify token
+    token = auth_header.split(' ')[1]
+    payload = verify_jwt_token(token)
+    if not payload:
+        return Response({'error': 'Invalid or expired token'}, status=401)
+
+    stats = get_registry_stats()
+    stats['prediction_cache'] = get_prediction_cache_stats()
+    return Response(stats)
+
+
+@api_view(['POST'])
+def score_feeder_slots(request):
+    """
+    Score slots directly, without uploading a setup:
+    {"slots": [{"ModuleNumber": 1, "Location": "'07", "PartNumber": "...", "FeederName": ...}]}.
+
+    Uses the model and history already loaded in this process and writes nothing,
+    so an answer takes milliseconds; see services/slot_scoring.py.
+    """
+    # Authenticate user
+    auth_header = request.headers.get('Authorization')
+    if not auth_header or not auth_header.startswith('Bearer '):
+        return Response({'error': 'Authorization required'}, status=401)
+
+    # Extract and verify token
+    token = auth_header.split(' ')[1]
+    payload = verify_jwt_token(token)
+    if not payload:
+        return Response({'error': 'Invalid or expired token'}, status=401)
+
+    slots = request.data.get('slots')
+    error = validate_slots(slots, settings.SLOT_SCORING_MAX_SLOTS)
+    if error:
+        return Response({'error': error}, status=400)
+
+    try:
+        return Response(score_slots(slots))
+    except Exception as e:
+        return Response({'error': str(e)}, status=500)
+
+
+@api_view(['POST'])
+def optimize_feeder_assignments(request, file_id):
+    """
+    What-if search on an uploaded setup: which parts would do better in another
+    position. Optional body: {"shape": "R-0402", "part_numbers": [...],
+    "max_candidates": 5000, "top": 20}; see services/optimizer.py.
+    """
+    # Authenticate user
+    auth_header = request.headers.get('Authorization')
+    if not auth_header or not auth_header.startswith('Bearer '):
+        return Response({'error': 'Authorization required'}, status=401)
+
+    # Extract and verify token
+    token = auth_header.split(' ')[1]
+    payload = verify_jwt_token(token)
+    if not payload:
+        return Response({'error': 'Invalid or expired token'}, status=401)
+
+    file_instance = get_object_or_404(File, id=file_id, user=payload['user_id'], is_deleted=False)
+
+    shape = request.data.get('shape')
+    part_numbers = request.data.get('part_numbers')
+    if shape is not None and not isinstance(shape, str):
+        return Response({'error': 'shape must be a string'}, status=400)
+    if part_numbers is not None and not isinstance(part_numbers, list):
+        return Response({'error': 'part_numbers must be a list'}, status=400)
+    try:
+        max_candidates = int(request.data.get('max_candidates', settings.OPTIMIZER_MAX_CANDIDATES))
+        top = int(request.data.get('top', 20))
+    except (TypeError, ValueError):
+        return Response({'error': 'max_candidates and top must be integers'}, status=400)
+    if max_candidates < 1 or max_candidates > settings.OPTIMIZER_MAX_CANDIDATES:
+        return Response({'error': f'max_candidates must be between 1 and {settings.OPTIMIZER_MAX_CANDIDATES}'},
+                        status=400)
+    if top < 1:
+        return Response({'error': 'top must be at least 1'}, status=400)
+
+    try:
+        return Response(optimize_assignments(
+            setup_path(file_instance),
+            regressor_path=settings.ERROR_RATE_REGRESSOR_PATH,
+            shape=shape,
+            part_numbers=part_numbers,
+            max_candidates=max_candidates,
+            top=top,
+        ))
+    except Exception as e:
+        return Response({'error': str(e)}, status=500)
@@ -108,6 +108,12 @@ const ProcessingScreen = () => {
           // Start polling for results
           pollForResults(newJob.id);
         }
+        // If the job was created but never queued (e.g. execute failed), queue it now
+        else if (fileProcessing.job.status === 'created') {
+          setIsProcessing(true);
+          await fileProcessingService.executeJob(fileProcessing.job.id);
+          pollForResults(fileProcessing.job.id);
+        }
         // If job is already in progress, poll for results
         else if (fileProcessing.job.status === 'pending' || fileProcessing.job.status === 'processing') {
           pollForResults(fileProcessing.job.id);
@@ -20,7 +20,7 @@ export interface ProcessingJob {
   file_name: string;
   file_type: string;
   file_size: number;
-  status: 'pending' | 'processing' | 'completed' | 'failed';
+  status: 'created' | 'pending' | 'processing' | 'completed' | 'failed';
   started_at: string | null;
   completed_at: string | null;
   error_message: string | null;